@@ -1,15 +1,33 @@
+import json
 import os
+import threading
 import time
+from contextlib import closing
 from flask import (Flask, render_template, request, jsonify,
-                   session, redirect, url_for)
+                   session, redirect, url_for, Response, abort,
+                   send_from_directory, send_file, g)
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import database
 import auth
-import sqlite3
+import snapshot
+import print_styles
+import barcodes
+import cards
+import batch
+import audit
+import backup
+import profiling
+import catalog
+import branches
+import suggest
+import maintenance
+import catalog_files
+import exports
+import storage
 
 app = Flask(__name__)
-app.secret_key = 'zerotech-secret-key-2024'
+app.secret_key = os.environ.get('ZT_SECRET_KEY', 'zerotech-secret-key-2024')
 CORS(app)
 
 # Upload configuration
@@ -18,11 +36,153 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5MB max
 
+# Optional in-memory read snapshot for GET routes
+app.config['READ_SNAPSHOT'] = os.environ.get('ZT_READ_SNAPSHOT') == '1'
+app.config['READ_SNAPSHOT_MAX_BYTES'] = int(
+    os.environ.get('ZT_READ_SNAPSHOT_MAX_MB', '64')
+) * 1024 * 1024
+app.config['READ_SNAPSHOT_REFRESH_SECONDS'] = float(
+    os.environ.get('ZT_READ_SNAPSHOT_REFRESH_SECONDS', '2')
+)
+
+# Barcode render cache (memory LRU + files on disk)
+app.config['BARCODE_CACHE_DIR'] = os.environ.get(
+    'ZT_BARCODE_CACHE_DIR',
+    os.path.join(app.root_path, 'cache', 'barcodes')
+)
+app.config['BARCODE_QR_URL'] = os.environ.get('ZT_QR_URL_TEMPLATE')
+
+# Rendered card fragment cache size (entries per worker)
+app.config['CARD_CACHE_SIZE'] = int(
+    os.environ.get('ZT_CARD_CACHE_SIZE', '2048')
+)
+
+# Precompressed /api/products files: directory and rebuild debounce (s)
+app.config['CATALOG_FILES_DIR'] = os.environ.get(
+    'ZT_CATALOG_FILES_DIR', os.path.join(app.root_path, 'cache', 'catalog')
+)
+app.config['CATALOG_FILES_DELAY'] = float(
+    os.environ.get('ZT_CATALOG_FILES_DELAY', '1')
+)
+
+# Online backups: snapshot directory and how many snapshots to keep
+app.config['BACKUP_DIR'] = os.environ.get(
+    'ZT_BACKUP_DIR', os.path.join(app.root_path, 'backups')
+)
+app.config['BACKUP_KEEP'] = int(os.environ.get('ZT_BACKUP_KEEP', '10'))
+
+# Request profiling: sampling rate (0-1), slow threshold (ms, 0 = off)
+app.config['PROFILE_DIR'] = os.environ.get(
+    'ZT_PROFILE_DIR', os.path.join(app.root_path, 'cache', 'profiles')
+)
+app.config['PROFILE_SAMPLE_RATE'] = float(
+    os.environ.get('ZT_PROFILE_SAMPLE_RATE', '0')
+)
+app.config['PROFILE_SLOW_MS'] = float(
+    os.environ.get('ZT_PROFILE_SLOW_MS', '0')
+)
+app.config['PROFILE_MAX'] = int(os.environ.get('ZT_PROFILE_MAX', '200'))
+
+# Database maintenance: hours between runs (0 = off), quiet period and
+# time budget in seconds
+app.config['MAINTENANCE_INTERVAL_HOURS'] = float(
+    os.environ.get('ZT_MAINTENANCE_INTERVAL_HOURS', '24')
+)
+app.config['MAINTENANCE_QUIET_SECONDS'] = float(
+    os.environ.get('ZT_MAINTENANCE_QUIET_SECONDS', '300')
+)
+app.config['MAINTENANCE_BUDGET'] = float(
+    os.environ.get('ZT_MAINTENANCE_BUDGET', '30')
+)
+
+# Catalog storage: the SQLite file (default) or a PostgreSQL URL, and the
+# PostgreSQL connection pool size and wait (s) per process
+app.config['STORAGE_URL'] = os.environ.get('ZT_STORAGE_URL', '')
+app.config['STORAGE_POOL_MIN'] = int(
+    os.environ.get('ZT_STORAGE_POOL_MIN', '1')
+)
+app.config['STORAGE_POOL_MAX'] = int(
+    os.environ.get('ZT_STORAGE_POOL_MAX', '10')
+)
+app.config['STORAGE_POOL_TIMEOUT'] = float(
+    os.environ.get('ZT_STORAGE_POOL_TIMEOUT', '30')
+)
+
+# Branch databases (price overrides and print settings per branch)
+app.config['BRANCHES_DIR'] = os.environ.get(
+    'ZT_BRANCHES_DIR', os.path.join(app.root_path, 'branches')
+)
+app.config['DEFAULT_BRANCH'] = os.environ.get('ZT_DEFAULT_BRANCH') or None
+
+# Whether /api/events exists; asgi.py, which serves it, turns this on
+app.config['CATALOG_EVENTS'] = False
+
 # Ensure upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # Initialize database on startup
 database.init_db()
+audit.install()
+maintenance.install()
+
+branch_store = branches.BranchStore(app.config['BRANCHES_DIR'])
+
+store = storage.configure(
+    app.config['STORAGE_URL'], branch_store,
+    pool_min=app.config['STORAGE_POOL_MIN'],
+    pool_max=app.config['STORAGE_POOL_MAX'],
+    pool_timeout=app.config['STORAGE_POOL_TIMEOUT']
+)
+store.install()
+
+# Branch settings may still refer to logos deleted before branches were
+# cleared along with the master
+with closing(store.connect()) as conn:
+    branch_store.migrate_all(logo_ids=store.logos.ids(conn))
+
+if app.config['READ_SNAPSHOT'] and store.local:
+    snapshot.enable(app.config['READ_SNAPSHOT_MAX_BYTES'],
+                    min_interval=app.config['READ_SNAPSHOT_REFRESH_SECONDS'])
+
+barcode_cache = barcodes.BarcodeCache(
+    app.config['BARCODE_CACHE_DIR'],
+    qr_url_template=app.config['BARCODE_QR_URL']
+)
+card_cache = cards.CardCache(app.config['CARD_CACHE_SIZE'])
+
+maintenance_scheduler = None
+if app.config['MAINTENANCE_INTERVAL_HOURS'] > 0:
+    maintenance_scheduler = maintenance.MaintenanceScheduler(
+        app.config['MAINTENANCE_INTERVAL_HOURS'],
+        quiet_seconds=app.config['MAINTENANCE_QUIET_SECONDS'],
+        budget_seconds=app.config['MAINTENANCE_BUDGET']
+    )
+
+# Precompressed /api/products files are made from the SQLite file
+catalog_file_store = None
+if store.local:
+    catalog_file_store = catalog_files.CatalogFiles(
+        app.config['CATALOG_FILES_DIR'],
+        delay=app.config['CATALOG_FILES_DELAY']
+    )
+    catalog_file_store.schedule()
+
+# Product-code autocomplete, kept current through the catalog change log
+# (or rebuilt in the background on each new catalog version where there
+# is none)
+suggest_index = suggest.SuggestIndex(
+    None if store.local else store.catalog_version,
+    connect=store.read_connection
+)
+with closing(store.read_connection()) as conn:
+    suggest_index.build(conn)
+
+profiler = profiling.Profiler(
+    app.config['PROFILE_DIR'],
+    sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+    slow_ms=app.config['PROFILE_SLOW_MS'],
+    max_profiles=app.config['PROFILE_MAX']
+)
 
 
 def allowed_file(filename):
@@ -30,6 +190,92 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def json_text_response(body, status=200):
+    """Return already-serialized JSON text as a response"""
+    return Response(body, status=status, mimetype='application/json')
+
+
+def record_audit(action, entity, entity_key=None, details=None):
+    """Queue an audit event attributed to the current user"""
+    audit.record(action, entity, entity_key, session.get('user_id'), details)
+
+
+def catalog_changed():
+    """Rebuild the precompressed product files after a catalog write"""
+    if catalog_file_store is not None:
+        catalog_file_store.schedule()
+
+
+def branch_exists(name):
+    """Whether a branch database exists (branches need the SQLite store)"""
+    return store.local and branch_store.exists(name)
+
+
+def current_branch():
+    """Return the branch this request is for, or None for the master"""
+    if 'branch' not in g:
+        name = request.headers.get('X-Branch') or session.get('branch') \
+            or app.config['DEFAULT_BRANCH']
+        g.branch = name if name and branch_exists(name) else None
+    return g.branch
+
+
+def get_read_connection():
+    """Return a read connection with the request's branch attached"""
+    return store.read_connection(current_branch())
+
+
+def print_stylesheet_url(settings):
+    """Return the content-hashed stylesheet URL for the print settings"""
+    digest, _ = print_styles.stylesheet_for(settings)
+    return url_for('print_stylesheet', digest=digest)
+
+
+# ============== Request Profiling ==============
+
+@app.before_request
+def start_profiling():
+    """Time or profile this request if it is flagged or sampled"""
+    flag = request.headers.get('X-Profile') or request.args.get('_profile')
+    requested = False
+    if flag and 'user_id' in session:
+        user = auth.get_current_user()
+        requested = bool(user) and user['role'] == 'admin'
+    g.profile = profiler.start(requested, memory=flag == 'memory')
+
+
+@app.after_request
+def finish_profiling(response):
+    """Save the profile of a profiled or slow request"""
+    request_profile = g.pop('profile', None)
+    if request_profile is not None:
+        profile_id = profiler.finish(request_profile, {
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'user_id': session.get('user_id')
+        })
+        if profile_id:
+            response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+@app.teardown_request
+def cancel_profiling(exc):
+    """Stop a profile left running by a request that failed"""
+    request_profile = g.pop('profile', None)
+    if request_profile is not None:
+        profiler.cancel(request_profile)
+
+
+@app.before_request
+def note_activity():
+    """Keep scheduled maintenance out of busy periods"""
+    if maintenance_scheduler is not None:
+        maintenance_scheduler.touch()
+
+
 # ============== Page Routes ==============
 
 @app.route('/login', methods=['GET'])
@@ -44,8 +290,22 @@ def login():
 @auth.login_required
 def index():
     """Serve the main page"""
+    # ?branch=<name> pins this terminal's session to a branch
+    if 'branch' in request.args:
+        name = request.args['branch']
+        if name and not branch_exists(name):
+            abort(404)
+        session['branch'] = name or None
+        g.pop('branch', None)
+
     user = auth.get_current_user()
-    return render_template('index.html', user=user)
+    conn = get_read_connection()
+    settings = store.print_settings.get(conn, current_branch())
+    conn.close()
+    return render_template(
+        'index.html', user=user,
+        print_stylesheet_url=print_stylesheet_url(settings)
+    )
 
 
 @app.route('/admin')
@@ -82,6 +342,8 @@ def api_login():
 @app.route('/api/auth/logout', methods=['POST'])
 def api_logout():
     """API logout endpoint"""
+    if 'user_id' in session:
+        record_audit('auth.logout', 'user', session['user_id'])
     session.pop('user_id', None)
     return jsonify({'message': 'Logged out successfully'}), 200
 
@@ -100,8 +362,7 @@ def api_me():
 @auth.admin_required
 def get_users():
     """Get all users (admin only)"""
-    users = auth.get_all_users()
-    return jsonify(users), 200
+    return json_text_response(auth.get_all_users_json())
 
 
 @app.route('/api/users', methods=['POST'])
@@ -128,6 +389,8 @@ def create_user():
     if error:
         return jsonify({'error': error}), 400
 
+    record_audit('user.create', 'user', user_id,
+                 {'username': username, 'role': role})
     return jsonify({'message': 'User created successfully', 'id': user_id}), 201
 
 
@@ -145,6 +408,8 @@ def update_user(user_id):
         role=data.get('role', 'user')
     )
 
+    record_audit('user.update', 'user', user_id,
+                 {'role': data.get('role', 'user')})
     return jsonify({'message': 'User updated successfully'}), 200
 
 
@@ -160,6 +425,7 @@ def delete_user(user_id):
     if not success:
         return jsonify({'error': error}), 400
 
+    record_audit('user.delete', 'user', user_id)
     return jsonify({'message': 'User deleted successfully'}), 200
 
 
@@ -176,6 +442,8 @@ def toggle_user_status(user_id):
         return jsonify({'error': result}), 400
 
     status = 'activated' if result else 'deactivated'
+    record_audit('user.activate' if result else 'user.deactivate',
+                 'user', user_id)
     return jsonify({
         'message': f'User {status} successfully',
         'is_active': result
@@ -187,14 +455,14 @@ def toggle_user_status(user_id):
 @app.route('/api/categories', methods=['GET'])
 @auth.login_required
 def get_categories():
-    """Get all categories"""
+    """Get all categories, with product counts and prices if requested"""
     try:
-        conn = database.get_db_connection()
-        categories = conn.execute(
-            'SELECT * FROM categories ORDER BY name'
-        ).fetchall()
+        conn = store.read_connection()
+        body = store.categories.list_json(
+            conn, with_stats=request.args.get('with_stats') == '1'
+        )
         conn.close()
-        return jsonify([dict(cat) for cat in categories]), 200
+        return json_text_response(body)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -210,15 +478,16 @@ def create_category():
         if not name:
             return jsonify({'error': 'Category name is required'}), 400
 
-        conn = database.get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO categories (name) VALUES (?)', (name,))
-        cat_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        conn = store.connect()
+        try:
+            cat_id = store.categories.create(conn, name)
+            conn.commit()
+        finally:
+            conn.close()
 
+        record_audit('category.create', 'category', cat_id, {'name': name})
         return jsonify({'message': 'Category created', 'id': cat_id}), 201
-    except sqlite3.IntegrityError:
+    except storage.DuplicateError:
         return jsonify({'error': 'Category already exists'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -235,17 +504,17 @@ def update_category(cat_id):
         if not name:
             return jsonify({'error': 'Category name is required'}), 400
 
-        conn = database.get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            'UPDATE categories SET name = ? WHERE id = ?',
-            (name, cat_id)
-        )
-        conn.commit()
-        conn.close()
+        conn = store.connect()
+        try:
+            store.categories.rename(conn, cat_id, name)
+            conn.commit()
+        finally:
+            conn.close()
 
+        catalog_changed()
+        record_audit('category.update', 'category', cat_id, {'name': name})
         return jsonify({'message': 'Category updated'}), 200
-    except sqlite3.IntegrityError:
+    except storage.DuplicateError:
         return jsonify({'error': 'Category name already exists'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -256,19 +525,13 @@ def update_category(cat_id):
 def delete_category(cat_id):
     """Delete a category"""
     try:
-        conn = database.get_db_connection()
-        cursor = conn.cursor()
-
-        # Set products with this category to null
-        cursor.execute(
-            'UPDATE products SET category_id = NULL WHERE category_id = ?',
-            (cat_id,)
-        )
-        cursor.execute('DELETE FROM categories WHERE id = ?', (cat_id,))
-
+        conn = store.connect()
+        store.categories.delete(conn, cat_id)
         conn.commit()
         conn.close()
 
+        catalog_changed()
+        record_audit('category.delete', 'category', cat_id)
         return jsonify({'message': 'Category deleted'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -281,12 +544,10 @@ def delete_category(cat_id):
 def get_logos():
     """Get all logos"""
     try:
-        conn = database.get_db_connection()
-        logos = conn.execute(
-            'SELECT * FROM logos ORDER BY uploaded_at DESC'
-        ).fetchall()
+        conn = store.read_connection()
+        body = store.logos.list_json(conn)
         conn.close()
-        return jsonify([dict(logo) for logo in logos]), 200
+        return json_text_response(body)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -316,16 +577,13 @@ def upload_logo():
 
             file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
 
-            conn = database.get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO logos (name, filename, logo_type)
-                VALUES (?, ?, 'custom')
-            ''', (name, filename))
-            logo_id = cursor.lastrowid
+            conn = store.connect()
+            logo_id = store.logos.create(conn, name, filename)
             conn.commit()
             conn.close()
 
+            record_audit('logo.create', 'logo', logo_id,
+                         {'name': name, 'filename': filename})
             return jsonify({
                 'message': 'Logo uploaded successfully',
                 'id': logo_id,
@@ -342,13 +600,10 @@ def upload_logo():
 def delete_logo(logo_id):
     """Delete a logo"""
     try:
-        conn = database.get_db_connection()
-        cursor = conn.cursor()
+        conn = store.connect()
 
         # Get logo info
-        logo = cursor.execute(
-            'SELECT * FROM logos WHERE id = ?', (logo_id,)
-        ).fetchone()
+        logo = store.logos.get(conn, logo_id)
         if not logo:
             conn.close()
             return jsonify({'error': 'Logo not found'}), 404
@@ -363,16 +618,15 @@ def delete_logo(logo_id):
         if os.path.exists(filepath):
             os.remove(filepath)
 
-        # Update print settings that use this logo
-        cursor.execute(
-            'UPDATE print_settings SET logo_id = NULL WHERE logo_id = ?',
-            (logo_id,)
-        )
-        cursor.execute('DELETE FROM logos WHERE id = ?', (logo_id,))
+        # Print settings that use this logo keep no logo
+        store.logos.delete(conn, logo_id)
 
         conn.commit()
         conn.close()
+        branch_store.clear_logo(logo_id)
 
+        record_audit('logo.delete', 'logo', logo_id,
+                     {'filename': logo['filename']})
         return jsonify({'message': 'Logo deleted'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -385,18 +639,13 @@ def delete_logo(logo_id):
 def get_print_settings():
     """Get print settings"""
     try:
-        conn = database.get_db_connection()
-        settings = conn.execute('''
-            SELECT ps.*, l.filename as logo_filename, l.name as logo_name
-            FROM print_settings ps
-            LEFT JOIN logos l ON ps.logo_id = l.id
-            ORDER BY ps.id DESC LIMIT 1
-        ''').fetchone()
+        conn = get_read_connection()
+        settings = store.print_settings.get(conn, current_branch())
         conn.close()
 
         if settings:
-            return jsonify(dict(settings)), 200
-        return jsonify({}), 200
+            settings['stylesheet_url'] = print_stylesheet_url(settings)
+        return jsonify(settings), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -408,84 +657,164 @@ def save_print_settings():
     try:
         data = request.get_json()
 
-        conn = database.get_db_connection()
-        cursor = conn.cursor()
-
-        # Check if settings exist
-        existing = cursor.execute(
-            'SELECT id FROM print_settings LIMIT 1'
-        ).fetchone()
-
-        if existing:
-            cursor.execute('''
-                UPDATE print_settings SET
-                    page_size = ?,
-                    custom_width = ?,
-                    custom_height = ?,
-                    card_color_start = ?,
-                    card_color_end = ?,
-                    logo_id = ?,
-                    logo_position = ?,
-                    logo_size = ?,
-                    font_size = ?,
-                    font_color = ?,
-                    border_enabled = ?,
-                    border_color = ?,
-                    border_width = ?,
-                    card_mode = ?,
-                    card_width = ?,
-                    card_height = ?
-                WHERE id = ?
-            ''', (
-                data.get('page_size', 'A4'),
-                data.get('custom_width'),
-                data.get('custom_height'),
-                data.get('card_color_start', '#1e3c72'),
-                data.get('card_color_end', '#2a5298'),
-                data.get('logo_id'),
-                data.get('logo_position', 'top-center'),
-                data.get('logo_size', 100),
-                data.get('font_size', 28),
-                data.get('font_color', '#ffffff'),
-                1 if data.get('border_enabled') else 0,
-                data.get('border_color', '#ffffff'),
-                data.get('border_width', 2),
-                data.get('card_mode', 'grid'),
-                data.get('card_width', 50),
-                data.get('card_height', 50),
-                existing['id']
-            ))
-        else:
-            cursor.execute('''
-                INSERT INTO print_settings
-                (page_size, custom_width, custom_height, card_color_start,
-                 card_color_end, logo_id, logo_position, logo_size,
-                 font_size, font_color, border_enabled, border_color,
-                 border_width, card_mode, card_width, card_height)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                data.get('page_size', 'A4'),
-                data.get('custom_width'),
-                data.get('custom_height'),
-                data.get('card_color_start', '#1e3c72'),
-                data.get('card_color_end', '#2a5298'),
-                data.get('logo_id'),
-                data.get('logo_position', 'top-center'),
-                data.get('logo_size', 100),
-                data.get('font_size', 28),
-                data.get('font_color', '#ffffff'),
-                1 if data.get('border_enabled') else 0,
-                data.get('border_color', '#ffffff'),
-                data.get('border_width', 2),
-                data.get('card_mode', 'grid'),
-                data.get('card_width', 50),
-                data.get('card_height', 50)
-            ))
+        barcode_type = data.get('barcode_type') or 'none'
+        if barcode_type != 'none' and \
+                barcode_type not in barcodes.SYMBOLOGIES:
+            return jsonify({'error': 'Invalid barcode type'}), 400
 
+        # A branch's settings live in its own database
+        branch = current_branch()
+        conn = store.connect(branch)
+        store.print_settings.save(conn, data)
         conn.commit()
         conn.close()
 
-        return jsonify({'message': 'Settings saved'}), 200
+        conn = get_read_connection()
+        settings = store.print_settings.get(conn, branch)
+        conn.close()
+
+        record_audit('print_settings.update', 'print_settings',
+                     settings.get('id'),
+                     {'branch': branch} if branch else None)
+        return jsonify({
+            'message': 'Settings saved',
+            'stylesheet_url': print_stylesheet_url(settings)
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/print-styles/<digest>.css', methods=['GET'])
+def print_stylesheet(digest):
+    """Serve a compiled print stylesheet; the URL changes with the content"""
+    css = print_styles.get_stylesheet(digest)
+    if css is None:
+        # Compiled by another worker: rebuild from the saved settings
+        conn = get_read_connection()
+        settings = store.print_settings.get(conn, current_branch())
+        conn.close()
+        current, css = print_styles.stylesheet_for(settings)
+        if current != digest:
+            abort(404)
+
+    response = Response(css, mimetype='text/css')
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.set_etag(digest)
+    return response
+
+
+# ============== Branch API Routes ==============
+
+@app.route('/api/branches', methods=['GET'])
+@auth.login_required
+def get_branches():
+    """List branches and the one this session is using"""
+    return jsonify({
+        'branches': branch_store.names(),
+        'current': current_branch()
+    }), 200
+
+
+@app.route('/api/branch', methods=['POST'])
+@auth.login_required
+def set_branch():
+    """Pin this session to a branch (null for the master)"""
+    data = request.get_json() or {}
+    name = data.get('branch') or None
+    if name and not branch_exists(name):
+        return jsonify({'error': 'Branch not found'}), 404
+    session['branch'] = name
+    g.pop('branch', None)
+    return jsonify({'current': current_branch()}), 200
+
+
+@app.route('/api/admin/branches', methods=['POST'])
+@auth.admin_required
+def create_branch():
+    """Create a branch database"""
+    try:
+        if not store.local:
+            return jsonify({
+                'error': 'Branches need the SQLite storage backend'
+            }), 400
+        data = request.get_json() or {}
+        name = data.get('name', '')
+        branch_store.create(name)
+        record_audit('branch.create', 'branch', name)
+        return jsonify({'message': 'Branch created successfully',
+                        'name': name}), 201
+    except branches.BranchError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/branches/<branch>/prices', methods=['GET'])
+@auth.admin_required
+def get_branch_prices(branch):
+    """List a branch's price overrides"""
+    try:
+        conn = branch_store.connect(branch)
+        prices = conn.execute(
+            'SELECT * FROM price_overrides ORDER BY code'
+        ).fetchall()
+        conn.close()
+        return jsonify([dict(row) for row in prices]), 200
+    except branches.BranchError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/branches/<branch>/prices/<code>', methods=['PUT'])
+@auth.admin_required
+def set_branch_price(branch, code):
+    """Override a product's price in one branch"""
+    try:
+        data = request.get_json() or {}
+        if 'price' not in data:
+            return jsonify({'error': 'Field price is required'}), 400
+        price = float(data['price'])
+
+        conn = store.connect()
+        product = store.products.find(conn, code)
+        conn.close()
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+
+        conn = branch_store.connect(branch)
+        branch_store.set_price(conn, code, price)
+        conn.commit()
+        conn.close()
+
+        record_audit('branch.price_set', 'product', code,
+                     {'branch': branch, 'price': price})
+        return jsonify({'message': 'Price updated successfully'}), 200
+    except branches.BranchError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/branches/<branch>/prices/<code>', methods=['DELETE'])
+@auth.admin_required
+def delete_branch_price(branch, code):
+    """Return a product to the master price in one branch"""
+    try:
+        conn = branch_store.connect(branch)
+        cursor = conn.execute(
+            'DELETE FROM price_overrides WHERE code = ?', (code,)
+        )
+        conn.commit()
+        conn.close()
+        if not cursor.rowcount:
+            return jsonify({'error': 'Price override not found'}), 404
+
+        record_audit('branch.price_delete', 'product', code,
+                     {'branch': branch})
+        return jsonify({'message': 'Price override deleted'}), 200
+    except branches.BranchError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -495,19 +824,52 @@ def save_print_settings():
 @app.route('/api/products', methods=['GET'])
 @auth.login_required
 def get_products():
-    """Get all products"""
+    """Get all products (?format=ndjson for one product per line)"""
     try:
-        conn = database.get_db_connection()
-        products = conn.execute('''
-            SELECT p.*, c.name as category_name
-            FROM products p
-            LEFT JOIN categories c ON p.category_id = c.id
-            ORDER BY p.code
-        ''').fetchall()
+        fmt = 'ndjson' if request.args.get('format') == 'ndjson' else 'json'
+        mimetype = 'application/x-ndjson' if fmt == 'ndjson' \
+            else 'application/json'
+        conn = get_read_connection()
+
+        # The master list is usually on disk, already compressed
+        if catalog_file_store is not None and not current_branch() and \
+                'gzip' in request.accept_encodings:
+            rev, f = catalog_file_store.lookup(conn, fmt)
+            if f:
+                conn.close()
+                size = os.fstat(f.fileno()).st_size
+                response = send_file(f, mimetype=mimetype,
+                                     etag=f'{rev}.{fmt}', max_age=0)
+                if response.status_code == 200:
+                    response.content_length = size
+                response.headers['Content-Encoding'] = 'gzip'
+                response.headers['Vary'] = 'Accept-Encoding'
+                return response
+
+        objects = store.products.json_objects(conn, current_branch())
         conn.close()
 
-        products_list = [dict(product) for product in products]
-        return jsonify(products_list), 200
+        if fmt == 'ndjson':
+            return Response(''.join(obj + '\n' for obj in objects),
+                            mimetype=mimetype)
+        return json_text_response('[' + ','.join(objects) + ']')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/products/suggest', methods=['GET'])
+@auth.login_required
+def suggest_products():
+    """Suggest products whose code or name starts with a prefix"""
+    prefix = request.args.get('prefix', '').strip()
+    limit = request.args.get('limit', suggest.DEFAULT_LIMIT, type=int)
+    if not prefix:
+        return jsonify([]), 200
+    try:
+        conn = store.read_connection()
+        suggest_index.refresh(conn)
+        conn.close()
+        return jsonify(suggest_index.lookup(prefix, limit)), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -517,17 +879,12 @@ def get_products():
 def get_product(code):
     """Get a single product by code"""
     try:
-        conn = database.get_db_connection()
-        product = conn.execute('''
-            SELECT p.*, c.name as category_name
-            FROM products p
-            LEFT JOIN categories c ON p.category_id = c.id
-            WHERE p.code = ?
-        ''', (code,)).fetchone()
+        conn = get_read_connection()
+        product = store.products.get(conn, code, current_branch())
         conn.close()
 
         if product:
-            return jsonify(dict(product)), 200
+            return jsonify(product), 200
         else:
             return jsonify({'error': 'Product not found'}), 404
     except Exception as e:
@@ -546,40 +903,24 @@ def create_product():
             if field not in data or not data[field]:
                 return jsonify({'error': f'Field {field} is required'}), 400
 
-        conn = database.get_db_connection()
-        cursor = conn.cursor()
-
-        existing = cursor.execute(
-            'SELECT code FROM products WHERE code = ?', (data['code'],)
-        ).fetchone()
+        conn = store.connect()
+        try:
+            if store.products.find(conn, data['code']):
+                return jsonify({'error': 'Product code already exists'}), 400
 
-        if existing:
+            product_id = store.products.create(conn, data)
+            conn.commit()
+        finally:
             conn.close()
-            return jsonify({'error': 'Product code already exists'}), 400
-
-        cursor.execute('''
-            INSERT INTO products
-            (code, name, specs, price, logo_url, category_id, description)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['code'],
-            data['name'],
-            data.get('specs', ''),
-            float(data['price']),
-            data.get('logo_url', 'logowhite.png'),
-            data.get('category_id'),
-            data.get('description', '')
-        ))
-
-        conn.commit()
-        product_id = cursor.lastrowid
-        conn.close()
 
+        catalog_changed()
+        record_audit('product.create', 'product', data['code'],
+                     {'name': data['name'], 'price': float(data['price'])})
         return jsonify({
             'message': 'Product created successfully',
             'id': product_id
         }), 201
-    except sqlite3.IntegrityError:
+    except storage.DuplicateError:
         return jsonify({'error': 'Product code already exists'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -592,36 +933,23 @@ def update_product(code):
     try:
         data = request.get_json()
 
-        conn = database.get_db_connection()
-        cursor = conn.cursor()
-
-        existing = cursor.execute(
-            'SELECT code FROM products WHERE code = ?', (code,)
-        ).fetchone()
+        conn = store.connect()
+        existing = store.products.find(conn, code)
 
         if not existing:
             conn.close()
             return jsonify({'error': 'Product not found'}), 404
 
-        cursor.execute('''
-            UPDATE products
-            SET name = ?, specs = ?, price = ?, logo_url = ?,
-                category_id = ?, description = ?,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE code = ?
-        ''', (
-            data.get('name', ''),
-            data.get('specs', ''),
-            float(data.get('price', 0)),
-            data.get('logo_url', 'logowhite.png'),
-            data.get('category_id'),
-            data.get('description', ''),
-            code
-        ))
-
+        store.products.update(conn, code, data)
         conn.commit()
         conn.close()
 
+        new_price = float(data.get('price', 0))
+        details = {'name': data.get('name', '')}
+        if new_price != existing['price']:
+            details['price'] = [existing['price'], new_price]
+        catalog_changed()
+        record_audit('product.update', 'product', code, details)
         return jsonify({'message': 'Product updated successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -632,25 +960,537 @@ def update_product(code):
 def delete_product(code):
     """Delete a product"""
     try:
-        conn = database.get_db_connection()
-        cursor = conn.cursor()
-
-        existing = cursor.execute(
-            'SELECT code FROM products WHERE code = ?', (code,)
-        ).fetchone()
+        conn = store.connect()
+        existing = store.products.find(conn, code)
 
         if not existing:
             conn.close()
             return jsonify({'error': 'Product not found'}), 404
 
-        cursor.execute('DELETE FROM products WHERE code = ?', (code,))
+        store.products.delete(conn, code)
         conn.commit()
         conn.close()
 
+        catalog_changed()
+        record_audit('product.delete', 'product', code)
         return jsonify({'message': 'Product deleted successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+# ============== Export API Routes ==============
+
+@app.route('/api/exports/products', methods=['GET'])
+@auth.login_required
+def export_products():
+    """Stream the product list (?format=ndjson|json) as a download"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in exports.FORMATS:
+        return jsonify({'error': f'Unknown export format: {fmt}'}), 400
+    response = Response(
+        exports.iter_export(store, fmt, current_branch()),
+        mimetype=exports.FORMATS[fmt]
+    )
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename=products.{fmt}'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+# ============== Offline Catalog API Routes ==============
+
+@app.route('/api/catalog', methods=['GET'])
+@auth.login_required
+def get_catalog():
+    """Get the offline catalog, or its changes since a version"""
+    try:
+        since = request.args.get('since')
+        epoch = request.args.get('epoch')
+        branch = current_branch()
+
+        conn = get_read_connection()
+        # One read transaction, so all parts match the reported version
+        store.begin_read(conn)
+        parts = store.read_catalog(conn, since, epoch, branch)
+        settings = None
+        if parts['settings_changed']:
+            settings = store.print_settings.get(conn, branch)
+            if settings:
+                settings['stylesheet_url'] = print_stylesheet_url(settings)
+        conn.rollback()
+        conn.close()
+
+        response = json_text_response(catalog.to_json(parts, settings))
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/bootstrap', methods=['GET'])
+@auth.login_required
+def get_bootstrap():
+    """Get everything a page needs on load, from one read transaction
+
+    ``view=admin`` returns products, categories (with stats), users and
+    logos; ``view=print`` returns the offline catalog (``since`` and
+    ``epoch`` as for /api/catalog).  The user is read in the same
+    transaction, so no separate lookup is needed to check the role.
+    """
+    view = request.args.get('view', 'print')
+    if view not in ('admin', 'print'):
+        return jsonify({'error': 'Invalid view'}), 400
+
+    try:
+        branch = current_branch()
+        conn = get_read_connection()
+        store.begin_read(conn)
+        user = store.users.get(conn, session['user_id'])
+        if not user or not user['is_active']:
+            conn.rollback()
+            conn.close()
+            return jsonify({'error': 'Authentication required'}), 401
+        if view == 'admin' and user['role'] != 'admin':
+            conn.rollback()
+            conn.close()
+            return jsonify({'error': 'Admin access required'}), 403
+
+        if view == 'admin':
+            body = (
+                '{"categories":%s,"logos":%s,"products":%s,"user":%s,'
+                '"users":%s,"view":"admin"}'
+            ) % (
+                store.categories.list_json(conn, with_stats=True),
+                store.logos.list_json(conn),
+                store.products.list_json(conn, branch),
+                json.dumps(user, ensure_ascii=False),
+                store.users.list_json(conn)
+            )
+        else:
+            parts = store.read_catalog(conn, request.args.get('since'),
+                                       request.args.get('epoch'), branch)
+            settings = None
+            if parts['settings_changed']:
+                settings = store.print_settings.get(conn, branch)
+                if settings:
+                    settings['stylesheet_url'] = \
+                        print_stylesheet_url(settings)
+            body = '{"branch":%s,"catalog":%s,"user":%s,"view":"print"}' % (
+                json.dumps(branch),
+                catalog.to_json(parts, settings),
+                json.dumps(user, ensure_ascii=False)
+            )
+        conn.rollback()
+        conn.close()
+
+        response = json_text_response(body)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/sw.js')
+def service_worker():
+    """Serve the service worker from the root so it controls every page"""
+    response = send_from_directory(os.path.join(app.static_folder, 'js'),
+                                   'sw.js', mimetype='text/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+# ============== Card Fragment API Routes ==============
+
+@app.route('/api/cards', methods=['GET'])
+@auth.login_required
+def get_cards():
+    """Get server-rendered card fragments for ?codes=1001,1002"""
+    try:
+        codes = [code for code in request.args.get('codes', '').split(',')
+                 if code]
+        if not codes:
+            return jsonify({'error': 'No product codes given'}), 400
+
+        conn = get_read_connection()
+        products = store.products.get_many(conn, codes, current_branch())
+        settings = store.print_settings.get(conn, current_branch())
+        conn.close()
+
+        fragments = card_cache.get_many(products, settings)
+        return jsonify({
+            'cards': [{'code': code, 'html': fragments[code]}
+                      for code in codes if code in fragments],
+            'missing': [code for code in codes if code not in fragments]
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/admin/card-cache', methods=['GET'])
+@auth.admin_required
+def get_card_cache_stats():
+    """Get card fragment cache statistics for this worker"""
+    return jsonify(card_cache.stats()), 200
+
+
+# ============== Barcode API Routes ==============
+
+@app.route('/api/barcodes/<path:filename>', methods=['GET'])
+@auth.login_required
+def get_barcode(filename):
+    """Render (or serve from cache) a barcode image for a product code"""
+    # Codes may contain dots: only the last one starts the format
+    code, _, fmt = filename.rpartition('.')
+    if not code:
+        abort(404)
+    symbology = request.args.get('type', 'code128')
+    size = request.args.get('size', 2, type=int)
+
+    if symbology not in barcodes.SYMBOLOGIES:
+        return jsonify({'error': 'Invalid barcode type'}), 400
+    if fmt not in barcodes.FORMATS:
+        return jsonify({'error': 'Invalid format'}), 400
+    if not barcodes.MIN_SIZE <= size <= barcodes.MAX_SIZE:
+        return jsonify({'error': 'Invalid size'}), 400
+
+    try:
+        data = barcode_cache.get(code, symbology, fmt, size)
+    except barcodes.BarcodeError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = Response(data, mimetype=barcodes.MIMETYPES[fmt])
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+def _prewarm_barcodes(codes, options):
+    """Render barcodes for many codes in the background"""
+    try:
+        result = barcode_cache.prewarm(codes, **options)
+        app.logger.info('Barcode prewarm finished: %s', result)
+    except Exception:
+        app.logger.exception('Barcode prewarm failed')
+
+
+@app.route('/api/barcodes/prewarm', methods=['POST'])
+@auth.admin_required
+def prewarm_barcodes():
+    """Pre-render barcodes for all products (or the given codes)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        options = {
+            'symbologies': data.get('symbologies', ['code128']),
+            'formats': data.get('formats', ['svg']),
+            'sizes': data.get('sizes', [2])
+        }
+        if not set(options['symbologies']) <= set(barcodes.SYMBOLOGIES) or \
+                not set(options['formats']) <= set(barcodes.FORMATS):
+            return jsonify({'error': 'Invalid barcode type or format'}), 400
+
+        codes = data.get('codes')
+        if codes is None:
+            conn = store.read_connection()
+            codes = store.products.codes(conn)
+            conn.close()
+
+        threading.Thread(
+            target=_prewarm_barcodes, args=(codes, options), daemon=True
+        ).start()
+        return jsonify({
+            'message': 'Barcode prewarm started',
+            'count': len(codes)
+        }), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/admin/barcode-cache', methods=['GET'])
+@auth.admin_required
+def get_barcode_cache_stats():
+    """Get barcode render cache statistics for this worker"""
+    return jsonify(barcode_cache.stats()), 200
+
+
+# ============== Audit API Routes ==============
+
+@app.route('/api/audit', methods=['GET'])
+@auth.admin_required
+def get_audit_log():
+    """Get a filtered, paginated page of audit events (newest first)"""
+    try:
+        page = max(1, request.args.get('page', 1, type=int))
+        per_page = min(200, max(1, request.args.get('per_page', 50, type=int)))
+
+        # Include events queued by this worker that are not written yet
+        audit.flush(timeout=2)
+
+        conn = audit.get_connection()
+        items, total = audit.query(
+            conn,
+            page=page,
+            per_page=per_page,
+            action=request.args.get('action'),
+            entity=request.args.get('entity'),
+            entity_key=request.args.get('entity_key'),
+            user_id=request.args.get('user_id', type=int),
+            since=request.args.get('since', type=float),
+            until=request.args.get('until', type=float)
+        )
+        conn.close()
+
+        # Users live in the catalog store, not in the audit database
+        conn = store.read_connection()
+        usernames = store.users.usernames(
+            conn, {item['user_id'] for item in items
+                   if item['user_id'] is not None}
+        )
+        conn.close()
+        for item in items:
+            item['username'] = usernames.get(item['user_id'])
+
+        return jsonify({
+            'items': items,
+            'page': page,
+            'per_page': per_page,
+            'total': total
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# ============== Read Snapshot API Routes ==============
+
+@app.route('/api/admin/read-snapshot', methods=['GET'])
+@auth.admin_required
+def get_read_snapshot_stats():
+    """Get in-memory read snapshot statistics for this worker"""
+    return jsonify(snapshot.stats()), 200
+
+
+@app.route('/api/admin/catalog-files', methods=['GET'])
+@auth.admin_required
+def get_catalog_files_stats():
+    """Get precompressed catalog file statistics for this worker"""
+    if catalog_file_store is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify(catalog_file_store.stats()), 200
+
+
+# ============== Backup API Routes ==============
+
+@app.route('/api/admin/backups', methods=['GET'])
+@auth.admin_required
+def get_backups():
+    """List database snapshots and the latest backup job"""
+    job = backup.job_status(app.config['BACKUP_DIR'])
+    return jsonify({
+        'backups': backup.list_backups(app.config['BACKUP_DIR']),
+        'job': job,
+        'last_report': (job or {}).get('report')
+    }), 200
+
+
+@app.route('/api/admin/backups', methods=['POST'])
+@auth.admin_required
+def create_backup():
+    """Start an online snapshot of the database in the background"""
+    try:
+        user_id = session.get('user_id')
+
+        def on_done(job):
+            if job['status'] != 'done':
+                return
+            report = job['report']
+            audit.record('backup.create', 'backup', report['filename'],
+                         user_id, {
+                             'size': report['size'],
+                             'total_seconds': report['total_seconds']
+                         })
+
+        job = backup.start_backup(
+            app.config['BACKUP_DIR'], keep=app.config['BACKUP_KEEP'],
+            branches_dir=app.config['BRANCHES_DIR'], on_done=on_done
+        )
+        return jsonify({
+            'job': job,
+            'status_url': url_for('get_backup_status')
+        }), 202
+    except backup.BackupInProgress as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/admin/backups/status', methods=['GET'])
+@auth.admin_required
+def get_backup_status():
+    """Get the state of the latest backup job (running, done or failed)"""
+    job = backup.job_status(app.config['BACKUP_DIR'])
+    if job is None:
+        return jsonify({'error': 'No backup has been started'}), 404
+    return jsonify(job), 200
+
+
+@app.route('/api/admin/backups/<filename>', methods=['GET'])
+@auth.admin_required
+def download_backup(filename):
+    """Download a database snapshot"""
+    if not filename.startswith(backup.PREFIX) or \
+            not filename.endswith(backup.SUFFIX):
+        abort(404)
+    return send_from_directory(app.config['BACKUP_DIR'], filename,
+                               as_attachment=True)
+
+
+# ============== Maintenance API Routes ==============
+
+@app.route('/api/admin/maintenance', methods=['GET'])
+@auth.admin_required
+def get_maintenance():
+    """Get current file statistics and the latest maintenance runs"""
+    try:
+        conn = database.get_db_connection()
+        stats = maintenance.file_stats(conn)
+        conn.close()
+        return jsonify({
+            'stats': stats,
+            'runs': maintenance.recent_runs(),
+            'scheduled': maintenance_scheduler is not None
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/admin/maintenance', methods=['POST'])
+@auth.admin_required
+def run_maintenance():
+    """Run maintenance now (tasks and budget_seconds are optional)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        budget = data.get('budget_seconds', app.config['MAINTENANCE_BUDGET'])
+        report = maintenance.run(
+            float(budget), tasks=data.get('tasks') or maintenance.TASKS
+        )
+        record_audit('maintenance.run', 'database', report['id'], {
+            'duration_seconds': report['duration_seconds']
+        })
+        return jsonify(report), 200
+    except maintenance.MaintenanceInProgress as e:
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# ============== Profiling API Routes ==============
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@auth.admin_required
+def get_profiles():
+    """List stored request profiles, newest first"""
+    return jsonify({
+        'profiles': profiler.list_profiles(),
+        'stats': profiler.stats()
+    }), 200
+
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+@auth.admin_required
+def get_profile(profile_id):
+    """Get one profile with its SQL timings and top functions"""
+    record = profiler.load(profile_id)
+    if record is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return jsonify(record), 200
+
+
+@app.route('/api/admin/profiles/<profile_id>.prof', methods=['GET'])
+@auth.admin_required
+def download_profile(profile_id):
+    """Download the pstats file of a profile"""
+    filename = profiler.pstats_filename(profile_id)
+    if filename is None:
+        abort(404)
+    return send_from_directory(profiler.directory, filename,
+                               as_attachment=True)
+
+
+# ============== Batch API Routes ==============
+
+@app.route('/api/batch', methods=['POST'])
+@auth.admin_required
+def apply_batch():
+    """Apply an ordered list of product/category operations atomically"""
+    try:
+        data = request.get_json(silent=True) or {}
+        operations = data.get('operations')
+
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': 'Field operations is required'}), 400
+        if len(operations) > batch.MAX_OPERATIONS:
+            return jsonify({
+                'error': f'At most {batch.MAX_OPERATIONS} operations allowed'
+            }), 400
+
+        conn = store.connect()
+        try:
+            # Take the write lock first so validation sees what apply sees
+            store.begin_write(conn)
+
+            errors = batch.validate(conn, operations)
+            if errors:
+                return jsonify({
+                    'error': 'Batch validation failed',
+                    'errors': errors
+                }), 400
+
+            try:
+                results = batch.apply(conn, operations)
+                conn.commit()
+            except conn.IntegrityError as e:
+                return jsonify({'error': str(e)}), 400
+
+            settings = store.print_settings.get(conn)
+        finally:
+            # Never leave the write lock held, whatever went wrong
+            conn.rollback()
+            conn.close()
+
+        catalog_changed()
+        for op, result in zip(operations, results):
+            record_audit(f"{op['entity']}.{op['op']}", op['entity'],
+                         result.get('code', result.get('id')),
+                         {'batch': True})
+
+        # Newly imported products get their barcodes rendered up front
+        created = [result['code'] for result in results
+                   if result['status'] == 'created' and 'code' in result]
+        barcode_type = settings.get('barcode_type') or 'none'
+        if created and barcode_type != 'none':
+            threading.Thread(
+                target=_prewarm_barcodes,
+                args=(created, {'symbologies': [barcode_type]}),
+                daemon=True
+            ).start()
+
+        return jsonify({'message': 'Batch applied', 'results': results}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/healthz')
+def healthz():
+    """Liveness check for load balancers and deploy scripts"""
+    try:
+        store.ping()
+        return jsonify({'status': 'ok', 'pid': os.getpid()}), 200
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 503
+
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    # Development server; production runs wsgi.py under gunicorn
+    app.run(host=os.environ.get('ZT_HOST', '127.0.0.1'),
+            port=int(os.environ.get('PORT', '5000')),
+            debug=os.environ.get('ZT_DEBUG', '1') == '1')
@@ -0,0 +1,235 @@
+"""ASGI entry point: the Flask app plus natively asynchronous routes.
+
+Run with uvicorn::
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8000 \\
+        --timeout-graceful-shutdown 5
+
+Every route of app.py is served as under gunicorn, through a2wsgi on a
+pool of ``ZT_ASGI_THREADS`` threads, with the same session cookie, login
+checks and branches.  Two routes run on the event loop itself, where a
+waiting client costs a coroutine instead of a thread:
+
+``GET /api/events``
+    Server-sent events: a ``catalog`` event with the catalog epoch and
+    version when the stream opens and whenever they change, so print
+    terminals fetch the changes from ``/api/catalog`` as they happen.  One
+    task per process polls the version of each branch someone listens to.
+``GET /api/exports/products``
+    The streamed export of app.py; each chunk is read while the client
+    receives the previous one.
+
+Their database work runs on a separate executor of ``ZT_ASGI_DB_THREADS``
+threads, so neither a slow query nor a busy Flask pool stalls the loop.
+Event streams never end by themselves; ``--timeout-graceful-shutdown``
+bounds how long a reload or shutdown waits for them (browsers reconnect).
+"""
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from starlette.applications import Starlette
+from starlette.responses import (JSONResponse, RedirectResponse,
+                                 StreamingResponse)
+from starlette.routing import Mount, Route
+
+import app as app_module
+import exports
+from wsgi import application as flask_app
+
+logger = logging.getLogger(__name__)
+
+# Tells the print page it can subscribe to /api/events
+flask_app.config['CATALOG_EVENTS'] = True
+
+THREADS = int(os.environ.get('ZT_ASGI_THREADS', '32'))
+DB_THREADS = int(os.environ.get('ZT_ASGI_DB_THREADS', '4'))
+EVENTS_POLL_SECONDS = float(os.environ.get('ZT_EVENTS_POLL_SECONDS', '1'))
+EVENTS_KEEPALIVE_SECONDS = float(
+    os.environ.get('ZT_EVENTS_KEEPALIVE_SECONDS', '15')
+)
+
+db_executor = ThreadPoolExecutor(DB_THREADS, thread_name_prefix='zt-db')
+
+
+async def run_db(fn, *args):
+    """Run blocking database work on the database executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, fn, *args)
+
+
+# ============== Sessions ==============
+
+def load_session(request):
+    """Return the Flask session stored in the request's cookie"""
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    serializer = flask_app.session_interface.get_signing_serializer(
+        flask_app
+    )
+    if not cookie or serializer is None:
+        return {}
+    max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+    try:
+        return serializer.loads(cookie, max_age=max_age)
+    except BadSignature:
+        return {}
+
+
+def login_required(request, session):
+    """Return the response auth.login_required gives without a login"""
+    if 'user_id' in session:
+        return None
+    if request.headers.get('content-type', '').startswith(
+            'application/json'):
+        return JSONResponse({'error': 'Authentication required'},
+                            status_code=401)
+    return RedirectResponse('/login', status_code=302)
+
+
+def request_branch(request, session):
+    """Return the request's branch, chosen as app.current_branch() does"""
+    name = request.headers.get('x-branch') or session.get('branch') \
+        or flask_app.config['DEFAULT_BRANCH']
+    return name if name and app_module.branch_exists(name) else None
+
+
+# ============== Catalog Events ==============
+
+def read_version(branch):
+    """Return the catalog ``(epoch, version)`` of a branch or the master"""
+    store = app_module.store
+    conn = store.read_connection(branch)
+    try:
+        return store.catalog_version(conn, branch)
+    finally:
+        conn.close()
+
+
+class CatalogWatcher:
+    """Polls the catalog version of the branches that have listeners"""
+
+    def __init__(self, poll_seconds):
+        self.poll_seconds = poll_seconds
+        self._versions = {}
+        self._listeners = {}
+        self._changed = None
+        self._task = None
+
+    async def watch(self, branch, keepalive):
+        """Yield the version now and after each change, and None after
+        ``keepalive`` seconds without one"""
+        if self._task is None:
+            self._changed = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+        self._listeners[branch] = self._listeners.get(branch, 0) + 1
+        try:
+            if branch not in self._versions:
+                self._versions[branch] = await run_db(read_version, branch)
+            seen = None
+            while True:
+                # Taken before yielding, so a change meanwhile still wakes us
+                changed = self._changed
+                current = self._versions.get(branch)
+                if current is not None and current != seen:
+                    seen = current
+                    yield current
+                try:
+                    await asyncio.wait_for(changed.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._listeners[branch] -= 1
+            if not self._listeners[branch]:
+                del self._listeners[branch]
+                self._versions.pop(branch, None)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            changed = False
+            for branch in list(self._listeners):
+                try:
+                    current = await run_db(read_version, branch)
+                except Exception:
+                    logger.exception('Reading the catalog version failed')
+                    continue
+                if branch in self._listeners and \
+                        current != self._versions.get(branch):
+                    self._versions[branch] = current
+                    changed = True
+            if changed:
+                event, self._changed = self._changed, asyncio.Event()
+                event.set()
+
+
+watcher = CatalogWatcher(EVENTS_POLL_SECONDS)
+
+
+async def catalog_events(request):
+    """Stream the catalog version to a print terminal"""
+    session = load_session(request)
+    denied = login_required(request, session)
+    if denied:
+        return denied
+    branch = await run_db(request_branch, request, session)
+
+    async def stream():
+        # Browsers wait this long (ms) before reconnecting
+        yield 'retry: 5000\n\n'
+        async for current in watcher.watch(branch, EVENTS_KEEPALIVE_SECONDS):
+            if current is None:
+                yield ': keepalive\n\n'
+                continue
+            epoch, version = current
+            data = json.dumps({'epoch': epoch, 'version': version})
+            yield f'event: catalog\ndata: {data}\n\n'
+
+    return StreamingResponse(stream(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-store',
+                                      'X-Accel-Buffering': 'no'})
+
+
+# ============== Exports ==============
+
+async def export_products(request):
+    """Stream the product list (?format=ndjson|json) as a download"""
+    session = load_session(request)
+    denied = login_required(request, session)
+    if denied:
+        return denied
+    fmt = request.query_params.get('format', 'ndjson')
+    if fmt not in exports.FORMATS:
+        return JSONResponse({'error': f'Unknown export format: {fmt}'},
+                            status_code=400)
+    if app_module.maintenance_scheduler is not None:
+        app_module.maintenance_scheduler.touch()
+    branch = await run_db(request_branch, request, session)
+
+    async def stream():
+        after = ''
+        first = True
+        while True:
+            objects, after = await run_db(exports.read_chunk,
+                                          app_module.store, after, branch)
+            if not objects:
+                break
+            yield exports.frame(objects, fmt, first)
+            first = False
+        yield exports.closing_text(fmt, first)
+
+    return StreamingResponse(
+        stream(), media_type=exports.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename=products.{fmt}',
+                 'Cache-Control': 'no-store'}
+    )
+
+
+application = Starlette(routes=[
+    Route('/api/events', catalog_events),
+    Route('/api/exports/products', export_products),
+    Mount('/', app=WSGIMiddleware(flask_app, workers=THREADS))
+])
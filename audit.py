@@ -0,0 +1,329 @@
+"""Write-behind audit log of admin actions and logins.
+
+Handlers call :func:`record`, which only enqueues the event (or drops it
+when the queue is full).  A background thread drains the bounded queue and
+writes events to the ``audit_log`` table in batches (when ``batch_size``
+events are pending, every ``flush_interval`` seconds, and at shutdown), so
+auditing adds no commits to the request path.
+
+The table lives in its own file (``ZT_AUDIT_DB``, default ``audit.db`` next
+to the products database): audit writes do not invalidate the read
+snapshot of products.db, and the log cannot grow the catalog file.  Events
+older than ``ZT_AUDIT_RETENTION_DAYS`` are pruned by the writer thread.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import database
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = os.environ.get('ZT_AUDIT_DB')
+RETENTION_DAYS = float(os.environ.get('ZT_AUDIT_RETENTION_DAYS', '90'))
+PRUNE_INTERVAL = 3600.0
+PRUNE_BATCH = 5000
+
+_STOP = object()
+
+
+def db_path():
+    """Path of the audit database (next to the products database)"""
+    if DB_NAME:
+        return DB_NAME
+    return os.path.join(os.path.dirname(database.DB_NAME), 'audit.db')
+
+
+def get_connection():
+    """Open a connection to the audit database"""
+    conn = database.connect(db_path(), timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def install():
+    """Create the audit database; move events out of products.db once"""
+    conn = get_connection()
+    try:
+        # Only takes effect for a new file; prune() frees pages with it
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS audit_log (
+                id INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                user_id INTEGER,
+                action TEXT NOT NULL,
+                entity TEXT NOT NULL,
+                entity_key TEXT,
+                details TEXT
+            )
+        ''')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_audit_log_ts ON audit_log (ts)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_audit_log_entity '
+            'ON audit_log (entity, entity_key, ts)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_audit_log_user '
+            'ON audit_log (user_id, ts)'
+        )
+        conn.commit()
+
+        # Databases from before the split kept the log in products.db
+        conn.execute('ATTACH DATABASE ? AS products', (database.DB_NAME,))
+        legacy = conn.execute(
+            "SELECT 1 FROM products.sqlite_master "
+            "WHERE type = 'table' AND name = 'audit_log'"
+        ).fetchone()
+        if legacy:
+            conn.execute('''
+                INSERT INTO main.audit_log
+                (ts, user_id, action, entity, entity_key, details)
+                SELECT ts, user_id, action, entity, entity_key, details
+                FROM products.audit_log ORDER BY id
+            ''')
+            conn.execute('DROP TABLE products.audit_log')
+            conn.commit()
+        conn.execute('DETACH DATABASE products')
+    finally:
+        conn.close()
+
+
+def prune(conn, before, batch=PRUNE_BATCH):
+    """Delete events older than ``before`` in short transactions"""
+    deleted = 0
+    while True:
+        count = conn.execute('''
+            DELETE FROM audit_log WHERE id IN (
+                SELECT id FROM audit_log WHERE ts < ? LIMIT ?
+            )
+        ''', (before, batch)).rowcount
+        conn.commit()
+        deleted += count
+        if count < batch:
+            break
+    if deleted:
+        # execute() would free one page; executescript() runs it through
+        conn.executescript('PRAGMA incremental_vacuum')
+    return deleted
+
+
+class _Flush:
+    """Queue marker asking the writer to persist everything before it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class AuditLog:
+    """Bounded in-memory queue persisted by a background writer thread"""
+
+    def __init__(self, max_queue=10000, batch_size=200, flush_interval=2.0,
+                 retention_days=RETENTION_DAYS):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.written = 0
+        self.dropped = 0
+        self.pruned = 0
+        self._next_prune = 0.0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so each worker starts its own writer
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._thread = threading.Thread(
+                target=self._run, name='audit-writer', daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def record(self, action, entity, entity_key=None, user_id=None,
+               details=None):
+        """Enqueue an audit event; never blocks the caller"""
+        self._ensure_started()
+        event = (
+            time.time(),
+            user_id,
+            action,
+            entity,
+            None if entity_key is None else str(entity_key),
+            json.dumps(details, ensure_ascii=False, separators=(',', ':'))
+            if details else None
+        )
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            # One line per burst, not per event
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning('Audit queue full, %d event(s) dropped',
+                               self.dropped)
+
+    def flush(self, timeout=5.0):
+        """Wait until everything enqueued so far has been written"""
+        if self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        marker = _Flush()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(max(0.0, deadline - time.monotonic()))
+
+    def close(self):
+        """Write pending events and stop the writer thread"""
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=10)
+
+    def _run(self):
+        pending = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write(pending)
+                return
+            if isinstance(item, _Flush):
+                self._write(pending)
+                pending = []
+                item.done.set()
+                continue
+            if item is not None:
+                pending.append(item)
+
+            if len(pending) >= self.batch_size or \
+                    time.monotonic() >= deadline:
+                self._write(pending)
+                pending = []
+                deadline = time.monotonic() + self.flush_interval
+                self._prune()
+
+    def _write(self, events):
+        if not events:
+            return
+        try:
+            conn = get_connection()
+            conn.executemany('''
+                INSERT INTO audit_log
+                (ts, user_id, action, entity, entity_key, details)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', events)
+            conn.commit()
+            conn.close()
+            self.written += len(events)
+        except Exception:
+            self.dropped += len(events)
+            logger.exception('Failed to write %d audit events', len(events))
+
+    def _prune(self):
+        if self.retention_days <= 0 or time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL
+        try:
+            conn = get_connection()
+            try:
+                self.pruned += prune(
+                    conn, time.time() - self.retention_days * 86400
+                )
+            finally:
+                conn.close()
+        except Exception:
+            logger.exception('Failed to prune the audit log')
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize() if self._queue else 0,
+            'written': self.written,
+            'dropped': self.dropped,
+            'pruned': self.pruned
+        }
+
+
+_log = AuditLog()
+atexit.register(_log.close)
+
+
+def record(action, entity, entity_key=None, user_id=None, details=None):
+    """Record an audit event (written asynchronously in batches)"""
+    _log.record(action, entity, entity_key, user_id, details)
+
+
+def flush(timeout=5.0):
+    """Block until queued audit events are persisted"""
+    return _log.flush(timeout)
+
+
+def stats():
+    """Return audit writer counters for this worker"""
+    return _log.stats()
+
+
+def query(conn, page=1, per_page=50, action=None, entity=None,
+          entity_key=None, user_id=None, since=None, until=None):
+    """Return (items, total) for a filtered, newest-first page of events"""
+    clauses = []
+    params = []
+    if action:
+        clauses.append('a.action = ?')
+        params.append(action)
+    if entity:
+        clauses.append('a.entity = ?')
+        params.append(entity)
+    if entity_key:
+        clauses.append('a.entity_key = ?')
+        params.append(entity_key)
+    if user_id is not None:
+        clauses.append('a.user_id = ?')
+        params.append(user_id)
+    if since is not None:
+        clauses.append('a.ts >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append('a.ts < ?')
+        params.append(until)
+    where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+
+    total = conn.execute(
+        f'SELECT COUNT(*) AS count FROM audit_log a {where}', params
+    ).fetchone()['count']
+    rows = conn.execute(f'''
+        SELECT a.id, a.ts, a.user_id, a.action, a.entity, a.entity_key,
+               a.details
+        FROM audit_log a
+        {where}
+        ORDER BY a.ts DESC, a.id DESC
+        LIMIT ? OFFSET ?
+    ''', params + [per_page, (page - 1) * per_page]).fetchall()
+
+    items = []
+    for row in rows:
+        item = dict(row)
+        item['details'] = json.loads(row['details']) if row['details'] \
+            else None
+        items.append(item)
+    return items, total
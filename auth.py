@@ -1,22 +1,27 @@
 from functools import wraps
 from flask import session, redirect, url_for, jsonify, request
 from werkzeug.security import check_password_hash, generate_password_hash
-import database
+import audit
+import storage
 
 
 def login_user(username, password):
     """Authenticate user and return user data if successful"""
-    conn = database.get_db_connection()
-    user = conn.execute(
-        'SELECT * FROM users WHERE username = ?', (username,)
-    ).fetchone()
+    store = storage.get_store()
+    conn = store.connect()
+    user = store.users.find(conn, username)
     conn.close()
 
     if user and check_password_hash(user['password_hash'], password):
         # Check if user is active
         if not user['is_active']:
+            audit.record('auth.login_denied', 'user', user['id'],
+                         user['id'], {'username': username})
             return None, 'Account is deactivated'
-        return dict(user), None
+        audit.record('auth.login', 'user', user['id'], user['id'])
+        return user, None
+    audit.record('auth.login_failed', 'user', None, None,
+                 {'username': username})
     return None, 'Invalid username or password'
 
 
@@ -25,15 +30,12 @@ def get_current_user():
     if 'user_id' not in session:
         return None
 
-    conn = database.get_db_connection()
-    user = conn.execute(
-        '''SELECT id, username, full_name, email, phone, role, is_active,
-           created_at FROM users WHERE id = ?''',
-        (session['user_id'],)
-    ).fetchone()
+    store = storage.get_store()
+    conn = store.read_connection()
+    user = store.users.get(conn, session['user_id'])
     conn.close()
 
-    return dict(user) if user else None
+    return user
 
 
 def login_required(f):
@@ -69,121 +71,99 @@ def admin_required(f):
 def create_user(username, password, role='user', full_name=None,
                 email=None, phone=None):
     """Create a new user with extended fields"""
-    conn = database.get_db_connection()
-    cursor = conn.cursor()
-
-    # Check if username exists
-    existing = cursor.execute(
-        'SELECT id FROM users WHERE username = ?', (username,)
-    ).fetchone()
-
-    if existing:
-        conn.close()
+    store = storage.get_store()
+    conn = store.connect()
+    try:
+        # Check if username exists
+        if store.users.find(conn, username):
+            return None, 'Username already exists'
+
+        user_id = store.users.create(
+            conn, username, generate_password_hash(password), role,
+            full_name, email, phone
+        )
+        conn.commit()
+    except storage.DuplicateError:
         return None, 'Username already exists'
-
-    password_hash = generate_password_hash(password)
-    cursor.execute('''
-        INSERT INTO users (username, password_hash, full_name, email,
-                          phone, role, is_active)
-        VALUES (?, ?, ?, ?, ?, ?, 1)
-    ''', (username, password_hash, full_name, email, phone, role))
-
-    user_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    finally:
+        conn.close()
 
     return user_id, None
 
 
 def get_all_users():
     """Get all users with extended fields"""
-    conn = database.get_db_connection()
-    users = conn.execute(
-        '''SELECT id, username, full_name, email, phone, role, is_active,
-           created_at FROM users ORDER BY created_at DESC'''
-    ).fetchall()
+    store = storage.get_store()
+    conn = store.read_connection()
+    users = store.users.list(conn)
     conn.close()
-    return [dict(user) for user in users]
-
+    return users
 
-def delete_user(user_id):
-    """Delete a user by ID"""
-    conn = database.get_db_connection()
-    cursor = conn.cursor()
 
-    # Don't allow deleting the last admin
-    cursor.execute("SELECT COUNT(*) as count FROM users WHERE role = 'admin'")
-    admin_count = cursor.fetchone()['count']
+def get_all_users_json():
+    """Get all users as JSON text, serialized by the database"""
+    store = storage.get_store()
+    conn = store.read_connection()
+    body = store.users.list_json(conn)
+    conn.close()
+    return body
 
-    cursor.execute("SELECT role FROM users WHERE id = ?", (user_id,))
-    user = cursor.fetchone()
 
-    if user and user['role'] == 'admin' and admin_count <= 1:
+def delete_user(user_id):
+    """Delete a user by ID"""
+    store = storage.get_store()
+    conn = store.connect()
+    try:
+        user = store.users.get(conn, user_id)
+
+        # Don't allow deleting the last admin
+        if user and user['role'] == 'admin' and \
+                store.users.count_admins(conn) <= 1:
+            return False, 'Cannot delete the last admin user'
+
+        store.users.delete(conn, user_id)
+        conn.commit()
+    finally:
         conn.close()
-        return False, 'Cannot delete the last admin user'
-
-    cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
     return True, None
 
 
 def toggle_user_status(user_id):
     """Toggle user active status"""
-    conn = database.get_db_connection()
-    cursor = conn.cursor()
-
-    # Get current status
-    cursor.execute("SELECT is_active, role FROM users WHERE id = ?", (user_id,))
-    user = cursor.fetchone()
-
-    if not user:
-        conn.close()
-        return False, 'User not found'
-
-    # Don't allow deactivating the last active admin
-    if user['is_active'] and user['role'] == 'admin':
-        cursor.execute(
-            "SELECT COUNT(*) as count FROM users "
-            "WHERE role = 'admin' AND is_active = 1"
-        )
-        active_admin_count = cursor.fetchone()['count']
-        if active_admin_count <= 1:
-            conn.close()
+    store = storage.get_store()
+    conn = store.connect()
+    try:
+        user = store.users.get(conn, user_id)
+        if not user:
+            return False, 'User not found'
+
+        # Don't allow deactivating the last active admin
+        if user['is_active'] and user['role'] == 'admin' and \
+                store.users.count_admins(conn, active_only=True) <= 1:
             return False, 'Cannot deactivate the last active admin'
 
-    new_status = 0 if user['is_active'] else 1
-    cursor.execute(
-        'UPDATE users SET is_active = ? WHERE id = ?',
-        (new_status, user_id)
-    )
-    conn.commit()
-    conn.close()
+        new_status = 0 if user['is_active'] else 1
+        store.users.set_active(conn, user_id, new_status)
+        conn.commit()
+    finally:
+        conn.close()
     return True, new_status
 
 
 def update_user(user_id, full_name=None, email=None, phone=None, role=None):
     """Update user details"""
-    conn = database.get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        '''UPDATE users SET full_name = ?, email = ?, phone = ?, role = ?
-           WHERE id = ?''',
-        (full_name, email, phone, role, user_id)
-    )
+    store = storage.get_store()
+    conn = store.connect()
+    store.users.update(conn, user_id, full_name, email, phone, role)
     conn.commit()
     conn.close()
 
 
 def update_user_password(user_id, new_password):
     """Update user password"""
-    conn = database.get_db_connection()
-    cursor = conn.cursor()
-    password_hash = generate_password_hash(new_password)
-    cursor.execute(
-        'UPDATE users SET password_hash = ? WHERE id = ?',
-        (password_hash, user_id)
-    )
+    store = storage.get_store()
+    conn = store.connect()
+    store.users.set_password_hash(conn, user_id,
+                                  generate_password_hash(new_password))
     conn.commit()
     conn.close()
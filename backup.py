@@ -0,0 +1,379 @@
+"""Online hot backups of the products database.
+
+Snapshots are taken with SQLite's online backup API, copying ``pages``
+pages per step and sleeping between steps.  A step only holds a read lock
+for as long as it takes to copy those pages, so the app keeps serving
+reads and writes while a backup runs; the longest step is reported as the
+most a writer could have waited.
+
+The result is always a consistent point-in-time snapshot.  In WAL mode the
+source connection holds one read transaction for the whole copy, which
+does not block writers.  Otherwise SQLite restarts the copy whenever
+another connection writes between steps; after ``MAX_RESTARTS`` restarts
+the remaining copy is done in a single step so a busy database still gets
+backed up.
+
+Each snapshot is written to a temporary file, checked with
+``PRAGMA integrity_check`` and only then renamed into place; the oldest
+snapshots beyond ``keep`` are removed.  The audit database and every
+branch database are copied the same way into a companion directory
+(``products-<stamp>.d/``) that is pruned with its snapshot.
+
+From the app, :func:`start_backup` runs the backup in a background thread
+and records its progress in ``backup-status.json`` in the backup
+directory, which any worker can read back with :func:`job_status`.  A lock
+file keeps two processes from backing up at the same time.
+"""
+import json
+import os
+import pathlib
+import secrets
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import audit
+import database
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+PREFIX = 'products-'
+SUFFIX = '.db'
+COMPANION_SUFFIX = '.d'
+STATUS_FILE = 'backup-status.json'
+LOCK_FILE = '.backup.lock'
+MAX_RESTARTS = 5
+
+_lock = threading.Lock()
+_last_report = None
+
+
+class BackupError(RuntimeError):
+    """Raised when a snapshot cannot be taken or fails its check"""
+
+
+class BackupInProgress(BackupError):
+    """Raised when another backup is already running in this process"""
+
+
+class _TooManyRestarts(Exception):
+    """Raised from the progress callback to abandon a stepped copy"""
+
+
+def _readonly_uri(path):
+    # as_uri() percent-encodes ?, # and % in the path
+    return pathlib.Path(os.path.abspath(path)).as_uri() + '?mode=ro'
+
+
+def integrity_check(path):
+    """Run PRAGMA integrity_check on a database file; return the messages"""
+    conn = sqlite3.connect(_readonly_uri(path), uri=True)
+    try:
+        return [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    finally:
+        conn.close()
+
+
+def list_backups(directory):
+    """Return the snapshots in a directory, newest first"""
+    try:
+        names = [name for name in os.listdir(directory)
+                 if name.startswith(PREFIX) and name.endswith(SUFFIX)]
+    except FileNotFoundError:
+        return []
+    backups = []
+    for name in sorted(names, reverse=True):
+        stat = os.stat(os.path.join(directory, name))
+        backups.append({
+            'filename': name,
+            'size': stat.st_size,
+            'created_at': datetime.fromtimestamp(
+                stat.st_mtime, timezone.utc
+            ).isoformat(),
+            'companions': _companion_names(
+                _companion_dir(os.path.join(directory, name))
+            )
+        })
+    return backups
+
+
+def _companion_dir(path):
+    return path[:-len(SUFFIX)] + COMPANION_SUFFIX
+
+
+def _companion_names(companion_dir):
+    names = []
+    for root, _, files in os.walk(companion_dir):
+        for name in files:
+            if name.endswith(SUFFIX):
+                names.append(os.path.relpath(os.path.join(root, name),
+                                             companion_dir))
+    return sorted(name.replace(os.sep, '/') for name in names)
+
+
+def companion_files(branches_dir=None):
+    """Return {relative name: path} of the databases copied with a snapshot"""
+    files = {}
+    audit_path = audit.db_path()
+    if os.path.exists(audit_path):
+        files['audit.db'] = audit_path
+    if branches_dir and os.path.isdir(branches_dir):
+        for name in sorted(os.listdir(branches_dir)):
+            if name.endswith(SUFFIX):
+                files[f'branches/{name}'] = os.path.join(branches_dir, name)
+    return files
+
+
+def prune(directory, keep):
+    """Delete the oldest snapshots beyond ``keep``; return their names"""
+    removed = []
+    for entry in list_backups(directory)[keep:]:
+        path = os.path.join(directory, entry['filename'])
+        shutil.rmtree(_companion_dir(path), ignore_errors=True)
+        try:
+            os.remove(path)
+            removed.append(entry['filename'])
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+# ============== Locking and jobs ==============
+
+def _acquire(directory):
+    """Take the in-process and cross-process backup locks"""
+    if not _lock.acquire(blocking=False):
+        raise BackupInProgress('A backup is already running')
+    if fcntl is None:
+        return None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        handle = open(os.path.join(directory, LOCK_FILE), 'a')
+    except OSError:
+        _lock.release()
+        raise
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        _lock.release()
+        raise BackupInProgress('A backup is already running')
+    return handle
+
+
+def _release(handle):
+    if handle is not None:
+        # Closing the file drops the flock
+        handle.close()
+    _lock.release()
+
+
+def _write_status(directory, job):
+    path = os.path.join(directory, STATUS_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(job, f)
+    os.replace(path + '.tmp', path)
+
+
+def job_status(directory):
+    """Return the latest backup job recorded in the directory, or None"""
+    try:
+        with open(os.path.join(directory, STATUS_FILE)) as f:
+            job = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if job.get('status') == 'running' and fcntl is not None:
+        # A crashed process leaves "running" behind but not the flock
+        try:
+            with open(os.path.join(directory, LOCK_FILE), 'a') as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            job = dict(job, status='failed', error='Backup was interrupted')
+        except OSError:
+            pass
+    return job
+
+
+def start_backup(directory, keep=10, pages=64, step_sleep=0.005,
+                 db_name=None, branches_dir=None, on_done=None):
+    """Start a backup in a background thread and return its job record
+
+    ``on_done(job)`` is called from that thread once the job has finished.
+    """
+    handle = _acquire(directory)
+    job = {
+        'id': secrets.token_hex(8),
+        'status': 'running',
+        'started_at': datetime.now(timezone.utc).isoformat()
+    }
+    try:
+        _write_status(directory, job)
+    except OSError:
+        _release(handle)
+        raise
+
+    def run():
+        try:
+            job['report'] = _create_backup(
+                directory, keep, pages, step_sleep,
+                db_name or database.DB_NAME, companion_files(branches_dir)
+            )
+            job['status'] = 'done'
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+        finally:
+            job['finished_at'] = datetime.now(timezone.utc).isoformat()
+            try:
+                _write_status(directory, job)
+            finally:
+                _release(handle)
+            if on_done is not None:
+                on_done(dict(job))
+
+    threading.Thread(target=run, name='backup', daemon=True).start()
+    return dict(job)
+
+
+def create_backup(directory, keep=10, pages=64, step_sleep=0.005,
+                  db_name=None, branches_dir=None):
+    """Take a snapshot of the database and return a timing report"""
+    handle = _acquire(directory)
+    try:
+        return _create_backup(directory, keep, pages, step_sleep,
+                              db_name or database.DB_NAME,
+                              companion_files(branches_dir))
+    finally:
+        _release(handle)
+
+
+# ============== Copying ==============
+
+def _create_backup(directory, keep, pages, step_sleep, db_name,
+                   companions):
+    global _last_report
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S-%f')
+    filename = PREFIX + stamp + SUFFIX
+    path = os.path.join(directory, filename)
+    companion_dir = _companion_dir(path)
+
+    started = time.perf_counter()
+    try:
+        result = _copy(db_name, path, pages, step_sleep)
+        copied_companions = []
+        for name, source_path in companions.items():
+            target_path = os.path.join(companion_dir, *name.split('/'))
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            companion = _copy(source_path, target_path, pages, step_sleep)
+            copied_companions.append({'name': name,
+                                      'size': companion['size']})
+    except BaseException:
+        for leftover in (path, path + '.tmp'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        shutil.rmtree(companion_dir, ignore_errors=True)
+        raise
+    finished = time.perf_counter()
+
+    report = {
+        'filename': filename,
+        'size': result['size'],
+        'pages': result['pages'],
+        'steps': result['steps'],
+        'restarts': result['restarts'],
+        'single_step': result['single_step'],
+        'journal_mode': result['journal_mode'],
+        'copy_seconds': result['copy_seconds'],
+        'check_seconds': result['check_seconds'],
+        'total_seconds': round(finished - started, 4),
+        'max_step_ms': result['max_step_ms'],
+        'integrity': 'ok',
+        'companions': copied_companions,
+        'removed': prune(directory, keep)
+    }
+    _last_report = report
+    return report
+
+
+def _copy(db_name, path, pages, step_sleep):
+    """Copy one database to ``path`` in steps and check the copy"""
+    tmp_path = path + '.tmp'
+
+    progress = {'steps': 0, 'restarts': 0, 'max_step': 0.0,
+                'remaining': None, 'step_started': None}
+
+    def on_progress(status, remaining, total):
+        now = time.perf_counter()
+        progress['max_step'] = max(progress['max_step'],
+                                   now - progress['step_started'])
+        # The copy starts over when the source changes underneath it, so
+        # a step that makes no progress means a restart
+        if progress['remaining'] is not None and \
+                remaining >= progress['remaining']:
+            progress['restarts'] += 1
+            if progress['restarts'] >= MAX_RESTARTS:
+                raise _TooManyRestarts()
+        progress['remaining'] = remaining
+        progress['steps'] += 1
+        if remaining:
+            time.sleep(step_sleep)
+        progress['step_started'] = time.perf_counter()
+
+    started = time.perf_counter()
+    source = sqlite3.connect(db_name, isolation_level=None)
+    target = sqlite3.connect(tmp_path)
+    single_step = False
+    try:
+        journal_mode = source.execute('PRAGMA journal_mode').fetchone()[0]
+        if journal_mode == 'wal':
+            # Pin one snapshot; WAL readers never block writers
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        progress['step_started'] = time.perf_counter()
+        try:
+            source.backup(target, pages=pages, progress=on_progress)
+        except _TooManyRestarts:
+            single_step = True
+            step_started = time.perf_counter()
+            source.backup(target)
+            progress['max_step'] = max(progress['max_step'],
+                                       time.perf_counter() - step_started)
+            progress['steps'] += 1
+        page_count = target.execute('PRAGMA page_count').fetchone()[0]
+    except sqlite3.Error as e:
+        target.close()
+        os.remove(tmp_path)
+        raise BackupError(f'Backup failed: {e}')
+    finally:
+        source.close()
+    target.close()
+    copied = time.perf_counter()
+
+    messages = integrity_check(tmp_path)
+    if messages != ['ok']:
+        os.remove(tmp_path)
+        raise BackupError('Integrity check failed: ' + '; '.join(messages))
+    os.replace(tmp_path, path)
+    finished = time.perf_counter()
+
+    return {
+        'size': os.path.getsize(path),
+        'pages': page_count,
+        'steps': progress['steps'],
+        'restarts': progress['restarts'],
+        'single_step': single_step,
+        'journal_mode': journal_mode,
+        'copy_seconds': round(copied - started, 4),
+        'check_seconds': round(finished - copied, 4),
+        'max_step_ms': round(progress['max_step'] * 1000, 3)
+    }
+
+
+def last_report():
+    """Return the report of the last backup taken by this process"""
+    return _last_report
@@ -0,0 +1,391 @@
+"""Barcode and QR code rendering for price cards.
+
+Code128 and EAN-13 are encoded here and drawn as SVG or 1-bit PNG; QR
+codes are produced with segno.  Renders are cached in memory (LRU) and on
+disk, keyed by (code, symbology, format, size), so each label image is
+generated once no matter how many times it is printed.
+
+Prewarming many codes can render them in a process pool that
+:func:`start_pool` forks once per process.  gunicorn.conf.py calls it from
+the ``post_fork`` hook when ``ZT_BARCODE_PREWARM_PROCESSES`` is set, while
+the new worker still has a single thread: forking later from a request or
+background thread would copy locks other threads hold into the children.
+Without a pool (the default, and outside gunicorn) prewarm renders in its
+own thread.
+"""
+import hashlib
+import io
+import logging
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import segno
+
+logger = logging.getLogger(__name__)
+
+SYMBOLOGIES = ('code128', 'ean13', 'qr')
+FORMATS = ('svg', 'png')
+MIMETYPES = {'svg': 'image/svg+xml', 'png': 'image/png'}
+MIN_SIZE = 1
+MAX_SIZE = 10
+QUIET_ZONE = 10
+BAR_HEIGHT = 30  # modules; multiplied by the size like the bar width
+
+# Code128 bar/space widths for values 0-106 (103-105 start A/B/C, 106 stop)
+CODE128_PATTERNS = (
+    '212222', '222122', '222221', '121223', '121322', '131222', '122213',
+    '122312', '132212', '221213', '221312', '231212', '112232', '122132',
+    '122231', '113222', '123122', '123221', '223211', '221132', '221231',
+    '213212', '223112', '312131', '311222', '321122', '321221', '312212',
+    '322112', '322211', '212123', '212321', '232121', '111323', '131123',
+    '131321', '112313', '132113', '132311', '211313', '231113', '231311',
+    '112133', '112331', '132131', '113123', '113321', '133121', '313121',
+    '211331', '231131', '213113', '213311', '213131', '311123', '311321',
+    '331121', '312113', '312311', '332111', '314111', '221411', '431111',
+    '111224', '111422', '121124', '121421', '141122', '141221', '112214',
+    '112412', '122114', '122411', '142112', '142211', '241211', '221114',
+    '413111', '241112', '134111', '111242', '121142', '121241', '114212',
+    '124112', '124211', '411212', '421112', '421211', '212141', '214121',
+    '412121', '111143', '111341', '131141', '114113', '114311', '411113',
+    '411311', '113141', '114131', '311141', '411131', '211412', '211214',
+    '211232', '2331112'
+)
+CODE128_START_B = 104
+CODE128_START_C = 105
+CODE128_CODE_B = 100
+CODE128_STOP = 106
+
+EAN_L = ('0001101', '0011001', '0010011', '0111101', '0100011',
+         '0110001', '0101111', '0111011', '0110111', '0001011')
+EAN_G = ('0100111', '0110011', '0011011', '0100001', '0011101',
+         '0111001', '0000101', '0010001', '0001001', '0010111')
+EAN_R = ('1110010', '1100110', '1101100', '1000010', '1011100',
+         '1001110', '1010000', '1000100', '1001000', '1110100')
+EAN_PARITY = ('LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG',
+              'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL')
+
+
+class BarcodeError(ValueError):
+    """Raised when a code cannot be encoded in the requested symbology"""
+
+
+# ============== Encoders ==============
+
+def code128_modules(data):
+    """Encode text as Code128 and return the module string ('1' = bar)"""
+    if not data or any(not 32 <= ord(ch) <= 126 for ch in data):
+        raise BarcodeError('Code128 supports printable ASCII only')
+
+    # Digit runs pack two per symbol in code set C
+    if data.isdigit() and len(data) >= 4:
+        even = len(data) - len(data) % 2
+        values = [CODE128_START_C]
+        values += [int(data[i:i + 2]) for i in range(0, even, 2)]
+        if even < len(data):
+            values += [CODE128_CODE_B, ord(data[-1]) - 32]
+    else:
+        values = [CODE128_START_B] + [ord(ch) - 32 for ch in data]
+
+    checksum = values[0]
+    for position, value in enumerate(values[1:], 1):
+        checksum += position * value
+    values += [checksum % 103, CODE128_STOP]
+
+    modules = []
+    for value in values:
+        for index, width in enumerate(CODE128_PATTERNS[value]):
+            modules.append(('1' if index % 2 == 0 else '0') * int(width))
+    return ''.join(modules)
+
+
+def ean13_check_digit(digits):
+    """Return the check digit for the first 12 digits of an EAN-13"""
+    total = sum(int(d) * (3 if i % 2 else 1)
+                for i, d in enumerate(digits[:12]))
+    return str((10 - total % 10) % 10)
+
+
+def ean13_modules(data):
+    """Encode 12 or 13 digits as EAN-13 and return the module string"""
+    if not data.isdigit() or len(data) not in (12, 13):
+        raise BarcodeError('EAN-13 requires 12 or 13 digits')
+    if len(data) == 12:
+        data += ean13_check_digit(data)
+    elif data[12] != ean13_check_digit(data):
+        raise BarcodeError('Invalid EAN-13 check digit')
+
+    parity = EAN_PARITY[int(data[0])]
+    left = ''.join(
+        (EAN_L if parity[i] == 'L' else EAN_G)[int(d)]
+        for i, d in enumerate(data[1:7])
+    )
+    right = ''.join(EAN_R[int(d)] for d in data[7:])
+    return '101' + left + '01010' + right + '101'
+
+
+# ============== Drawing ==============
+
+def _svg_linear(modules, size):
+    """Draw a 1D barcode as SVG"""
+    width = (len(modules) + 2 * QUIET_ZONE) * size
+    height = BAR_HEIGHT * size
+    bars = []
+    x = 0
+    while x < len(modules):
+        if modules[x] == '1':
+            run = x
+            while run < len(modules) and modules[run] == '1':
+                run += 1
+            bars.append('<rect x="%d" y="0" width="%d" height="%d"/>' % (
+                (x + QUIET_ZONE) * size, (run - x) * size, height))
+            x = run
+        else:
+            x += 1
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" '
+        'viewBox="0 0 %d %d" shape-rendering="crispEdges">'
+        '<rect width="100%%" height="100%%" fill="#fff"/>'
+        '<g fill="#000">%s</g></svg>'
+    ) % (width, height, width, height, ''.join(bars))
+
+
+def _png(rows, width):
+    """Encode rows of '1' (black) / '0' (white) pixels as a 1-bit PNG"""
+    raw = bytearray()
+    for row in rows:
+        # PNG greyscale: 0 is black, so invert the bar bits
+        bits = row.translate(str.maketrans('01', '10'))
+        bits += '1' * (-len(bits) % 8)
+        raw.append(0)  # filter type: none
+        raw += int(bits, 2).to_bytes(len(bits) // 8, 'big')
+
+    def chunk(tag, data):
+        body = tag + data
+        return (struct.pack('>I', len(data)) + body +
+                struct.pack('>I', zlib.crc32(body) & 0xffffffff))
+
+    header = struct.pack('>IIBBBBB', width, len(rows), 1, 0, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) +
+            chunk(b'IDAT', zlib.compress(bytes(raw), 9)) +
+            chunk(b'IEND', b''))
+
+
+def _png_linear(modules, size):
+    """Draw a 1D barcode as PNG"""
+    quiet = '0' * QUIET_ZONE
+    row = ''.join(bit * size for bit in quiet + modules + quiet)
+    return _png([row] * (BAR_HEIGHT * size), len(row))
+
+
+def render(code, symbology='code128', fmt='svg', size=2, qr_data=None):
+    """Render a barcode and return the image bytes"""
+    if symbology not in SYMBOLOGIES:
+        raise BarcodeError('Unknown symbology')
+    if fmt not in FORMATS:
+        raise BarcodeError('Unknown format')
+    size = max(MIN_SIZE, min(MAX_SIZE, int(size)))
+
+    if symbology == 'qr':
+        buffer = io.BytesIO()
+        qr = segno.make(qr_data or code, error='m')
+        qr.save(buffer, kind=fmt, scale=size, border=4)
+        return buffer.getvalue()
+
+    if symbology == 'ean13':
+        modules = ean13_modules(code)
+    else:
+        modules = code128_modules(code)
+
+    if fmt == 'svg':
+        return _svg_linear(modules, size).encode('utf-8')
+    return _png_linear(modules, size)
+
+
+def _ready():
+    return True
+
+
+def _render_job(job):
+    """Process pool entry point: render one (key, args) job"""
+    key, args = job
+    try:
+        return key, render(*args)
+    except BarcodeError:
+        return key, None
+
+
+# ============== Render pool ==============
+
+_pool = None
+_pool_pid = None
+
+
+def start_pool(processes):
+    """Fork the prewarm render processes while this process has one thread"""
+    global _pool, _pool_pid
+    if processes <= 0 or _pool_pid == os.getpid():
+        return
+    if threading.active_count() > 1:
+        logger.warning('Barcode render pool not started: other threads '
+                       'are running; prewarm renders in its thread')
+        return
+    pool = ProcessPoolExecutor(max_workers=processes)
+    # The first task starts every process now, before any thread exists
+    pool.submit(_ready).result()
+    _pool = pool
+    _pool_pid = os.getpid()
+
+
+# ============== Cache ==============
+
+class BarcodeCache:
+    """Two-level (memory LRU + disk) cache of rendered barcodes"""
+
+    def __init__(self, directory, max_memory_items=512, max_disk_files=20000,
+                 qr_url_template=None):
+        self.directory = directory
+        self.max_memory_items = max_memory_items
+        self.max_disk_files = max_disk_files
+        self.qr_url_template = qr_url_template
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _qr_data(self, code, symbology):
+        if symbology == 'qr' and self.qr_url_template:
+            return self.qr_url_template.format(code=code)
+        return None
+
+    def _path(self, key):
+        # The QR template is part of the content, so it is part of the name
+        digest = hashlib.sha1(
+            repr(key + (self.qr_url_template,)).encode('utf-8')
+        ).hexdigest()
+        return os.path.join(self.directory, digest + '.' + key[2])
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def _store(self, key, data):
+        path = self._path(key)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._disk_writes += 1
+            prune = self._disk_writes % 100 == 0
+        if prune:
+            self.prune_disk()
+
+    def get(self, code, symbology='code128', fmt='svg', size=2):
+        """Return the rendered image bytes, rendering on a miss"""
+        key = (code, symbology, fmt, int(size))
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return data
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            self.disk_hits += 1
+        except FileNotFoundError:
+            data = render(code, symbology, fmt, size,
+                          self._qr_data(code, symbology))
+            self._store(key, data)
+            self.misses += 1
+
+        self._remember(key, data)
+        return data
+
+    def _render_all(self, jobs):
+        global _pool, _pool_pid
+        # A pool inherited from another process is unusable here
+        pool = _pool if _pool_pid == os.getpid() else None
+        if pool is not None:
+            try:
+                return list(pool.map(_render_job, jobs, chunksize=64))
+            except BrokenProcessPool:
+                logger.warning('Barcode render pool broke; rendering '
+                               'in this thread')
+                _pool = _pool_pid = None
+        return [_render_job(job) for job in jobs]
+
+    def prewarm(self, codes, symbologies=('code128',), formats=('svg',),
+                sizes=(2,)):
+        """Render missing barcodes for many codes
+
+        Uses the pool from :func:`start_pool`, or the calling thread when
+        there is none.
+        """
+        jobs = []
+        for code in codes:
+            for symbology in symbologies:
+                for fmt in formats:
+                    for size in sizes:
+                        key = (code, symbology, fmt, int(size))
+                        if not os.path.exists(self._path(key)):
+                            args = (code, symbology, fmt, size,
+                                    self._qr_data(code, symbology))
+                            jobs.append((key, args))
+
+        rendered = skipped = 0
+        if jobs:
+            for key, data in self._render_all(jobs):
+                if data is None:
+                    skipped += 1
+                    continue
+                self._store(key, data)
+                rendered += 1
+        return {'rendered': rendered, 'skipped': skipped,
+                'cached': len(codes) * len(symbologies) * len(formats) *
+                len(sizes) - len(jobs)}
+
+    def prune_disk(self):
+        """Evict the least recently written files above the disk limit"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.is_file()]
+        except FileNotFoundError:
+            return 0
+        excess = len(entries) - self.max_disk_files
+        if excess <= 0:
+            return 0
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:excess]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        return excess
+
+    def stats(self):
+        """Return cache counters"""
+        with self._lock:
+            memory_items = len(self._memory)
+            memory_bytes = sum(len(data) for data in self._memory.values())
+        return {
+            'memory_items': memory_items,
+            'memory_bytes': memory_bytes,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses
+        }
@@ -0,0 +1,257 @@
+"""Transactional batch mutations for products and categories.
+
+A batch is an ordered list of operations such as::
+
+    {"entity": "product", "op": "create", "data": {"code": "1005", ...}}
+    {"entity": "product", "op": "update", "code": "1001", "data": {...}}
+    {"entity": "product", "op": "delete", "code": "1002"}
+    {"entity": "category", "op": "create", "data": {"name": "..."}}
+    {"entity": "category", "op": "update", "id": 3, "data": {"name": "..."}}
+    {"entity": "category", "op": "delete", "id": 4}
+
+The whole batch is validated against the database before anything is
+written, then applied in one transaction.  Runs of consecutive operations
+of the same kind are executed as set-based statements.
+"""
+from itertools import groupby
+
+MAX_OPERATIONS = 1000
+ENTITIES = ('product', 'category')
+OPS = ('create', 'update', 'delete')
+TEXT_FIELDS = ('name', 'specs', 'logo_url', 'description')
+
+
+def _price_error(data, required):
+    if 'price' not in data or data['price'] in (None, ''):
+        return 'Field price is required' if required else None
+    try:
+        float(data['price'])
+    except (TypeError, ValueError):
+        return 'Field price must be a number'
+    return None
+
+
+def _is_code(value):
+    return isinstance(value, str) and value != ''
+
+
+def _is_id(value):
+    # bool is an int subclass, but true is not a row id
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def validate(conn, operations):
+    """Check the batch in order against the database; return errors"""
+    codes = set()
+    for op in operations:
+        if isinstance(op, dict):
+            data = op.get('data')
+            for code in (op.get('code'),
+                         data.get('code') if isinstance(data, dict) else None):
+                if _is_code(code):
+                    codes.add(code)
+    codes = list(codes)
+
+    existing_codes = set()
+    if codes:
+        placeholders = ','.join('?' * len(codes))
+        existing_codes = {row['code'] for row in conn.execute(
+            f'SELECT code FROM products WHERE code IN ({placeholders})',
+            codes
+        ).fetchall()}
+    categories = {row['id']: row['name'] for row in conn.execute(
+        'SELECT id, name FROM categories'
+    ).fetchall()}
+    category_names = set(categories.values())
+
+    errors = []
+    for index, op in enumerate(operations):
+        error = None
+        if not isinstance(op, dict):
+            error = 'Operation must be an object'
+        elif op.get('entity') not in ENTITIES:
+            error = 'Invalid entity'
+        elif op.get('op') not in OPS:
+            error = 'Invalid op'
+        elif not isinstance(op.get('data', {}), dict):
+            error = 'Field data must be an object'
+        elif op['entity'] == 'product' and op['op'] != 'create' and \
+                not _is_code(op.get('code')):
+            error = 'Field code must be a non-empty string'
+        elif op['entity'] == 'category' and op['op'] != 'create' and \
+                not _is_id(op.get('id')):
+            error = 'Field id must be an integer'
+        elif op['entity'] == 'product' and op['op'] != 'delete' and \
+                (op.get('data') or {}).get('category_id') is not None and \
+                not _is_id(op['data']['category_id']):
+            error = 'Field category_id must be an integer'
+        elif op['entity'] == 'product' and op['op'] != 'delete':
+            for field in TEXT_FIELDS:
+                if isinstance((op.get('data') or {}).get(field),
+                              (dict, list)):
+                    error = f'Field {field} must be a string'
+                    break
+
+        if error:
+            errors.append({'index': index, 'error': error})
+            continue
+
+        data = op.get('data') or {}
+        kind = (op['entity'], op['op'])
+
+        if kind == ('product', 'create'):
+            code = data.get('code')
+            for field in ('code', 'name', 'price'):
+                if field not in data or not data[field]:
+                    error = f'Field {field} is required'
+                    break
+            if not error and not isinstance(code, str):
+                error = 'Field code must be a string'
+            error = error or _price_error(data, True)
+            if not error and code in existing_codes:
+                error = 'Product code already exists'
+            if not error:
+                existing_codes.add(code)
+        elif op['entity'] == 'product':
+            if op.get('code') not in existing_codes:
+                error = 'Product not found'
+            elif kind == ('product', 'update'):
+                error = _price_error(data, False)
+            else:
+                existing_codes.discard(op['code'])
+
+        if not error and op['entity'] == 'product' and op['op'] != 'delete':
+            category_id = data.get('category_id')
+            if category_id is not None and category_id not in categories:
+                error = 'Category not found'
+
+        if kind == ('category', 'create'):
+            name = str(data.get('name', '')).strip()
+            if not name:
+                error = 'Category name is required'
+            elif name in category_names:
+                error = 'Category already exists'
+            else:
+                category_names.add(name)
+        elif op['entity'] == 'category':
+            cat_id = op.get('id')
+            if cat_id not in categories:
+                error = 'Category not found'
+            elif kind == ('category', 'update'):
+                name = str(data.get('name', '')).strip()
+                if not name:
+                    error = 'Category name is required'
+                elif name != categories[cat_id] and name in category_names:
+                    error = 'Category name already exists'
+                else:
+                    category_names.discard(categories[cat_id])
+                    category_names.add(name)
+                    categories[cat_id] = name
+            else:
+                category_names.discard(categories.pop(cat_id))
+
+        if error:
+            errors.append({'index': index, 'error': error})
+    return errors
+
+
+def _product_values(data):
+    """Column values for a product, with the same defaults as the API"""
+    return (
+        data.get('name', ''),
+        data.get('specs', ''),
+        float(data.get('price', 0)),
+        data.get('logo_url', 'logowhite.png'),
+        data.get('category_id'),
+        data.get('description', '')
+    )
+
+
+def _create_products(cursor, group, results):
+    for index, op in group:
+        data = op['data']
+        cursor.execute('''
+            INSERT INTO products
+            (code, name, specs, price, logo_url, category_id, description)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (data['code'],) + _product_values(data))
+        results[index] = {'index': index, 'status': 'created',
+                          'id': cursor.lastrowid, 'code': data['code']}
+
+
+def _update_products(cursor, group, results):
+    cursor.executemany('''
+        UPDATE products
+        SET name = ?, specs = ?, price = ?, logo_url = ?,
+            category_id = ?, description = ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE code = ?
+    ''', [_product_values(op.get('data') or {}) + (op['code'],)
+          for _, op in group])
+    for index, op in group:
+        results[index] = {'index': index, 'status': 'updated',
+                          'code': op['code']}
+
+
+def _delete_products(cursor, group, results):
+    codes = [op['code'] for _, op in group]
+    placeholders = ','.join('?' * len(codes))
+    cursor.execute(
+        f'DELETE FROM products WHERE code IN ({placeholders})', codes
+    )
+    for index, op in group:
+        results[index] = {'index': index, 'status': 'deleted',
+                          'code': op['code']}
+
+
+def _create_categories(cursor, group, results):
+    for index, op in group:
+        cursor.execute('INSERT INTO categories (name) VALUES (?)',
+                       (str(op['data']['name']).strip(),))
+        results[index] = {'index': index, 'status': 'created',
+                          'id': cursor.lastrowid}
+
+
+def _update_categories(cursor, group, results):
+    cursor.executemany(
+        'UPDATE categories SET name = ? WHERE id = ?',
+        [(str(op['data']['name']).strip(), op['id']) for _, op in group]
+    )
+    for index, op in group:
+        results[index] = {'index': index, 'status': 'updated',
+                          'id': op['id']}
+
+
+def _delete_categories(cursor, group, results):
+    ids = [op['id'] for _, op in group]
+    placeholders = ','.join('?' * len(ids))
+    cursor.execute(
+        'UPDATE products SET category_id = NULL '
+        f'WHERE category_id IN ({placeholders})', ids
+    )
+    cursor.execute(f'DELETE FROM categories WHERE id IN ({placeholders})',
+                   ids)
+    for index, op in group:
+        results[index] = {'index': index, 'status': 'deleted',
+                          'id': op['id']}
+
+
+_HANDLERS = {
+    ('product', 'create'): _create_products,
+    ('product', 'update'): _update_products,
+    ('product', 'delete'): _delete_products,
+    ('category', 'create'): _create_categories,
+    ('category', 'update'): _update_categories,
+    ('category', 'delete'): _delete_categories
+}
+
+
+def apply(conn, operations):
+    """Apply validated operations in order; the caller commits"""
+    results = [None] * len(operations)
+    cursor = conn.cursor()
+    runs = groupby(enumerate(operations),
+                   key=lambda item: (item[1]['entity'], item[1]['op']))
+    for kind, group in runs:
+        _HANDLERS[kind](cursor, list(group), results)
+    return results
@@ -0,0 +1,280 @@
+"""One server process under many idle connections: WSGI vs ASGI.
+
+Each server runs as one process on a copy of a seeded database:
+
+``gunicorn``
+    ``gunicorn -c gunicorn.conf.py`` with one sync worker (the default)
+``gthread``
+    the same with one gthread worker of ``ZT_ASGI_THREADS`` threads
+``uvicorn``
+    ``uvicorn asgi:application``, one process
+
+For each server the benchmark opens ``idle`` connections that send half
+a request and then wait (slow clients), and measures /healthz latency
+from one more client while they are held.  For uvicorn it then holds the
+same number of open /api/events streams, reports the process memory, and
+times a product edit until every stream has received its event.  Finally
+it measures plain throughput of /api/products/suggest with no idle
+connections, to show what the WSGI bridge costs.
+
+Usage: python benchmarks/asgi_bench.py [idle] [product_count]
+"""
+import asyncio
+import http.client
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+
+HEALTH_PROBES = 20
+PROBE_TIMEOUT = 5.0
+
+
+def seed(count):
+    conn = database.get_db_connection()
+    conn.execute('DELETE FROM products')
+    cat_ids = [row['id'] for row in conn.execute('SELECT id FROM categories')]
+    conn.executemany('''
+        INSERT INTO products (code, name, specs, price, logo_url,
+                              category_id, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', ((str(100000 + i), f'Product {i}', 'إضاءة RGB – 7200 DPI – USB',
+           round(random.uniform(10, 5000), 2), 'logowhite.png',
+           random.choice(cat_ids), 'وصف المنتج') for i in range(count)))
+    conn.commit()
+    conn.close()
+
+
+def request(port, method, path, body=None, cookie=None, timeout=30):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    headers = {}
+    if body is not None:
+        headers['Content-Type'] = 'application/json'
+        body = json.dumps(body)
+    if cookie:
+        headers['Cookie'] = cookie
+    conn.request(method, path, body, headers)
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response, data
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response, data = request(port, 'GET', '/healthz', timeout=2)
+            if response.status == 200:
+                return json.loads(data)['pid']
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+def rss_mb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def probe_health(port):
+    """Return (p50 ms, max ms, failures, probes) of /healthz probes
+
+    Stops after three timeouts in a row, as a blocked server would only
+    add more.
+    """
+    timings = []
+    failures = probes = 0
+    for _ in range(HEALTH_PROBES):
+        probes += 1
+        started = time.perf_counter()
+        try:
+            response, _ = request(port, 'GET', '/healthz',
+                                  timeout=PROBE_TIMEOUT)
+            if response.status != 200:
+                raise OSError(response.status)
+            timings.append((time.perf_counter() - started) * 1000)
+        except OSError:
+            failures += 1
+            if failures >= 3 and not timings:
+                break
+    if not timings:
+        return None, None, failures, probes
+    return statistics.median(timings), max(timings), failures, probes
+
+
+async def open_slow(port, count):
+    """Open connections that send half a request line and stop"""
+    writers = []
+    for _ in range(count):
+        try:
+            # Past the listen backlog, connecting hangs instead of failing
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection('127.0.0.1', port), 2
+            )
+        except (OSError, asyncio.TimeoutError):
+            break
+        writer.write(b'GET /healthz HTTP/1.1\r\nHost: bench\r\n')
+        writers.append(writer)
+    await asyncio.sleep(0.5)
+    return writers
+
+
+async def open_streams(port, cookie, count):
+    """Open /api/events streams and wait for each one's first event"""
+    streams = []
+    for _ in range(count):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET /api/events HTTP/1.1\r\nHost: bench\r\n'
+                     f'Cookie: {cookie}\r\n\r\n'.encode())
+        streams.append((reader, writer))
+    await read_events(streams)
+    return streams
+
+
+async def read_event(reader):
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError('Stream closed')
+        if line.startswith(b'data: '):
+            return json.loads(line[6:])
+
+
+async def read_events(streams):
+    await asyncio.gather(*(read_event(reader) for reader, _ in streams))
+
+
+async def close_all(writers):
+    for writer in writers:
+        writer.close()
+    await asyncio.sleep(0.5)
+
+
+def throughput(port, cookie, seconds=3, clients=8):
+    path = '/api/products/suggest?prefix=1000'
+    counts = [0] * clients
+    deadline = time.monotonic() + seconds
+
+    def client(i):
+        while time.monotonic() < deadline:
+            response, _ = request(port, 'GET', path, cookie=cookie)
+            if response.status == 200:
+                counts[i] += 1
+
+    threads = [threading.Thread(target=client, args=(i,))
+               for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / seconds
+
+
+def login(port):
+    response, _ = request(port, 'POST', '/api/auth/login',
+                          {'username': 'admin', 'password': 'admin123'})
+    return response.getheader('Set-Cookie').split(';')[0]
+
+
+def fmt_ms(value):
+    return f'{value:.1f}' if value is not None else '-'
+
+
+def run_server(label, command, env, cwd, port, idle):
+    process = subprocess.Popen(command, cwd=cwd, env=env,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    loop = asyncio.new_event_loop()
+    try:
+        pid = wait_ready(port)
+        cookie = login(port)
+        base_rss = rss_mb(pid)
+
+        slow = loop.run_until_complete(open_slow(port, idle))
+        p50, worst, failures, probes = probe_health(port)
+        print(f'{label:<9}{len(slow):>5} slow clients   /healthz p50 '
+              f'{fmt_ms(p50)} ms, max {fmt_ms(worst)} ms, '
+              f'{failures}/{probes} timed out')
+        loop.run_until_complete(close_all(slow))
+
+        if label == 'uvicorn':
+            started = time.perf_counter()
+            streams = loop.run_until_complete(
+                open_streams(port, cookie, idle)
+            )
+            opened = time.perf_counter() - started
+            p50, worst, failures, probes = probe_health(port)
+            print(f'{label:<9}{len(streams):>5} event streams  /healthz p50 '
+                  f'{fmt_ms(p50)} ms, max {fmt_ms(worst)} ms, '
+                  f'{failures}/{probes} timed out; opened in {opened:.1f} s, '
+                  f'RSS {base_rss:.0f} -> {rss_mb(pid):.0f} MB')
+
+            started = time.perf_counter()
+            request(port, 'PUT', '/api/products/100000',
+                    {'name': 'Edited', 'price': 1}, cookie=cookie)
+            loop.run_until_complete(read_events(streams))
+            print(f'{label:<9}edit -> event on all {len(streams)} streams '
+                  f'in {(time.perf_counter() - started) * 1000:.0f} ms')
+            loop.run_until_complete(
+                close_all(writer for _, writer in streams)
+            )
+
+        print(f'{label:<9}suggest throughput, no idle clients: '
+              f'{throughput(port, cookie):.0f} req/s')
+    finally:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+        loop.close()
+
+
+def main():
+    idle = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        database.init_db()
+        seed(count)
+        env = dict(os.environ,
+                   ZT_DB=database.DB_NAME,
+                   ZT_BRANCHES_DIR=os.path.join(tmp, 'branches'),
+                   ZT_CATALOG_FILES_DIR=os.path.join(tmp, 'catalog'),
+                   ZT_WORKERS='1',
+                   ZT_TIMEOUT='60',
+                   PYTHONPATH=ROOT)
+        threads = os.environ.get('ZT_ASGI_THREADS', '32')
+        gunicorn = [sys.executable, '-m', 'gunicorn', '-c',
+                    os.path.join(ROOT, 'gunicorn.conf.py')]
+
+        print(f'{count} products, {idle} idle connections, '
+              f'{os.cpu_count()} CPUs, one server process each')
+        run_server('gunicorn', gunicorn,
+                   dict(env, ZT_BIND='127.0.0.1:5093'), tmp, 5093, idle)
+        run_server('gthread', gunicorn,
+                   dict(env, ZT_BIND='127.0.0.1:5094', ZT_THREADS=threads),
+                   tmp, 5094, idle)
+        run_server('uvicorn',
+                   [sys.executable, '-m', 'uvicorn', 'asgi:application',
+                    '--port', '5095', '--log-level', 'warning',
+                    '--backlog', str(idle * 2)],
+                   env, tmp, 5095, idle)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Measure backup time and its effect on read/write latency.
+
+A reader thread fetches products by code and a writer thread updates
+prices, each through its own connection, while a backup runs.  Latency
+percentiles are reported for an idle period and for the backup period.
+
+Usage: python benchmarks/backup_bench.py [product_count] [journal_mode]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup  # noqa: E402
+import database  # noqa: E402
+
+IDLE_SECONDS = 2.0
+
+
+def seed(count):
+    conn = database.get_db_connection()
+    conn.execute('DELETE FROM products')
+    conn.executemany('''
+        INSERT INTO products (code, name, specs, price, logo_url,
+                              description)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', ((str(100000 + i), f'Product {i}', 'إضاءة RGB – 7200 DPI – USB',
+           round(random.uniform(10, 5000), 2), 'logowhite.png',
+           'وصف المنتج') for i in range(count)))
+    conn.commit()
+    conn.close()
+
+
+def worker(kind, count, stop, samples):
+    conn = database.get_db_connection()
+    conn.execute('PRAGMA busy_timeout = 5000')
+    while not stop.is_set():
+        code = str(100000 + random.randrange(count))
+        start = time.perf_counter()
+        if kind == 'read':
+            conn.execute('SELECT * FROM products WHERE code = ?',
+                         (code,)).fetchone()
+        else:
+            conn.execute('UPDATE products SET price = price + 1 '
+                         'WHERE code = ?', (code,))
+            conn.commit()
+        samples.append((start, time.perf_counter() - start))
+        time.sleep(0.002)
+    conn.close()
+
+
+def percentiles(values):
+    if not values:
+        return '-'
+    values = sorted(values)
+    p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+    return '%7.2f %7.2f %7.2f' % (statistics.median(values) * 1000,
+                                  p99 * 1000, values[-1] * 1000)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    journal_mode = sys.argv[2] if len(sys.argv) > 2 else 'delete'
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        database.init_db()
+        conn = database.get_db_connection()
+        conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+        conn.close()
+        seed(count)
+
+        stop = threading.Event()
+        samples = {'read': [], 'write': []}
+        threads = [threading.Thread(target=worker,
+                                    args=(kind, count, stop, samples[kind]))
+                   for kind in samples]
+        for thread in threads:
+            thread.start()
+
+        time.sleep(IDLE_SECONDS)
+        backup_started = time.perf_counter()
+        report = backup.create_backup(os.path.join(tmp, 'backups'))
+        backup_finished = time.perf_counter()
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        print(f'{count} products, journal_mode={journal_mode}, '
+              f'{report["size"] / 1e6:.1f} MB')
+        print(f'backup: {report["total_seconds"]:.3f} s '
+              f'(copy {report["copy_seconds"]:.3f} s, '
+              f'check {report["check_seconds"]:.3f} s), '
+              f'{report["steps"]} steps, {report["restarts"]} restarts, '
+              f'single step: {report["single_step"]}, '
+              f'longest step {report["max_step_ms"]:.2f} ms')
+        print(f'{"":<16}{"p50 ms":>8}{"p99 ms":>8}{"max ms":>8}')
+        for kind in ('read', 'write'):
+            idle = [d for t, d in samples[kind] if t < backup_started]
+            during = [d for t, d in samples[kind]
+                      if backup_started <= t < backup_finished]
+            print(f'{kind + " idle":<16} {percentiles(idle)}')
+            print(f'{kind + " backup":<16} {percentiles(during)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Time until a page has all its data: separate requests vs /api/bootstrap.
+
+Runs the app on a local threaded server and, like a browser, fires the
+page's data requests in parallel over separate connections.  "separate"
+is the old page load (admin: products, categories, users, logos; print:
+products, logos, print settings); "bootstrap" is one /api/bootstrap call.
+The time until the last response body has arrived is what the page waits
+for before it becomes interactive.
+
+Usage: python benchmarks/bootstrap_bench.py [product_count] [rounds]
+"""
+import http.client
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+PAGES = {
+    'admin': (['/api/products', '/api/categories?with_stats=1',
+               '/api/users', '/api/logos'],
+              ['/api/bootstrap?view=admin']),
+    'print': (['/api/products', '/api/logos', '/api/print-settings'],
+              ['/api/bootstrap?view=print'])
+}
+
+
+def seed(count):
+    conn = database.get_db_connection()
+    conn.execute('DELETE FROM products')
+    cat_ids = [row['id'] for row in conn.execute('SELECT id FROM categories')]
+    conn.executemany('''
+        INSERT INTO products (code, name, specs, price, logo_url,
+                              category_id, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', ((str(100000 + i), f'Product {i}', 'إضاءة RGB – 7200 DPI – USB',
+           round(random.uniform(10, 5000), 2), 'logowhite.png',
+           random.choice(cat_ids), 'وصف المنتج') for i in range(count)))
+    conn.commit()
+    conn.close()
+
+
+def login(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('POST', '/api/auth/login',
+                 json.dumps({'username': 'admin', 'password': 'admin123'}),
+                 {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie').split(';')[0]
+    conn.close()
+    return cookie
+
+
+def fetch(port, cookie, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', path, headers={'Cookie': cookie})
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    assert response.status == 200, (path, response.status)
+    return len(body)
+
+
+def page_load(pool, port, cookie, paths):
+    start = time.perf_counter()
+    sizes = list(pool.map(lambda path: fetch(port, cookie, path), paths))
+    return time.perf_counter() - start, sum(sizes)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        os.environ['ZT_BRANCHES_DIR'] = os.path.join(tmp, 'branches')
+        database.init_db()
+        seed(count)
+
+        from werkzeug.serving import make_server
+        import app
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_port
+        cookie = login(port)
+
+        print(f'{count} products, {rounds} page loads each')
+        print(f'{"page":<8}{"requests":<12}{"p50 ms":>8}{"p90 ms":>8}'
+              f'{"KB":>8}')
+        # Browsers open up to 6 connections per host
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            for page, variants in PAGES.items():
+                for label, paths in zip(('separate', 'bootstrap'), variants):
+                    page_load(pool, port, cookie, paths)
+                    timings = []
+                    for _ in range(rounds):
+                        seconds, size = page_load(pool, port, cookie, paths)
+                        timings.append(seconds)
+                    timings.sort()
+                    p90 = timings[int(len(timings) * 0.9) - 1]
+                    print(f'{page:<8}{label:<12}'
+                          f'{statistics.median(timings) * 1000:>8.1f}'
+                          f'{p90 * 1000:>8.1f}{size / 1024:>8.0f}')
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Compare /api/products served live from SQLite and from the .json.gz file.
+
+Runs the app on a local threaded server, so the file is sent with the
+server's file wrapper.  "live" is a client that does not accept gzip and
+gets the product list queried and serialized per request.
+
+Usage: python benchmarks/catalog_files_bench.py [product_count] [requests]
+"""
+import http.client
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+def seed(count):
+    conn = database.get_db_connection()
+    conn.execute('DELETE FROM products')
+    cat_ids = [row['id'] for row in conn.execute('SELECT id FROM categories')]
+    conn.executemany('''
+        INSERT INTO products (code, name, specs, price, logo_url,
+                              category_id, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', ((str(100000 + i), f'Product {i}', 'إضاءة RGB – 7200 DPI – USB',
+           round(random.uniform(10, 5000), 2), 'logowhite.png',
+           random.choice(cat_ids), 'وصف المنتج') for i in range(count)))
+    conn.commit()
+    conn.close()
+
+
+def login(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('POST', '/api/auth/login',
+                 json.dumps({'username': 'admin', 'password': 'admin123'}),
+                 {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie').split(';')[0]
+    conn.close()
+    return cookie
+
+
+def fetch(port, headers):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    start = time.perf_counter()
+    conn.request('GET', '/api/products', headers=headers)
+    response = conn.getresponse()
+    body = response.read()
+    seconds = time.perf_counter() - start
+    conn.close()
+    assert response.status == 200, response.status
+    return seconds, len(body), response.getheader('Content-Encoding')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        os.environ['ZT_BRANCHES_DIR'] = os.path.join(tmp, 'branches')
+        os.environ['ZT_CATALOG_FILES_DIR'] = os.path.join(tmp, 'catalog')
+        database.init_db()
+        seed(count)
+
+        from werkzeug.serving import make_server
+        import app
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        start = time.perf_counter()
+        app.catalog_file_store.build()
+        build_seconds = time.perf_counter() - start
+
+        server = make_server('127.0.0.1', 0, app.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_port
+        cookie = login(port)
+
+        print(f'{count} products, files built in {build_seconds:.3f} s')
+        print(f'{"":<10}{"p50 ms":>9}{"max ms":>9}{"KB":>9}')
+        for label, encoding in (('live', 'identity'), ('file', 'gzip')):
+            headers = {'Cookie': cookie, 'Accept-Encoding': encoding}
+            fetch(port, headers)
+            timings = []
+            for _ in range(requests):
+                seconds, size, served = fetch(port, headers)
+                timings.append(seconds)
+            assert (served == 'gzip') == (label == 'file')
+            print(f'{label:<10}{statistics.median(timings) * 1000:>9.1f}'
+                  f'{max(timings) * 1000:>9.1f}{size / 1024:>9.0f}')
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
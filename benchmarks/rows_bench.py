@@ -0,0 +1,87 @@
+"""Compare dict(row) + json.dumps against rows.json_array for /api/products.
+
+Usage: python benchmarks/rows_bench.py [product_count]
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import rows  # noqa: E402
+
+PRODUCTS_SQL = '''
+    SELECT p.*, c.name as category_name
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+'''
+
+
+def seed(count):
+    conn = database.get_db_connection()
+    conn.execute('DELETE FROM products')
+    cat_ids = [row['id'] for row in conn.execute('SELECT id FROM categories')]
+    conn.executemany('''
+        INSERT INTO products (code, name, specs, price, logo_url,
+                              category_id, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', ((str(100000 + i), f'Product {i}', 'إضاءة RGB – 7200 DPI – USB',
+           round(random.uniform(10, 5000), 2), 'logowhite.png',
+           random.choice(cat_ids), 'وصف المنتج') for i in range(count)))
+    conn.commit()
+    conn.close()
+
+
+def dict_rows():
+    conn = database.get_db_connection()
+    products = conn.execute(PRODUCTS_SQL + ' ORDER BY p.code').fetchall()
+    conn.close()
+    return json.dumps([dict(product) for product in products],
+                      sort_keys=True)
+
+
+def json_rows():
+    conn = database.get_db_connection()
+    body = rows.json_array(conn, PRODUCTS_SQL, order_by='code')
+    conn.close()
+    return body
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        database.init_db()
+        seed(count)
+
+        assert json.loads(dict_rows()) == json.loads(json_rows())
+        print(f'{count} products')
+        print(f'{"approach":<24}{"median s":>10}{"peak MB":>10}')
+        for name, func in (('dict(row) + json.dumps', dict_rows),
+                           ('rows.json_array', json_rows)):
+            seconds, peak = measure(func, repeat=5)
+            print(f'{name:<24}{seconds:>10.3f}{peak / 1e6:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Throughput of the development server vs gunicorn.
+
+Starts each server as a subprocess on a copy of a seeded database and
+drives it with concurrent clients, one connection per request, for a
+fixed time per endpoint.  "dev" is ``python app.py`` (Flask's debug
+server with the reloader); "gunicorn" is ``gunicorn -c gunicorn.conf.py``
+with the workers from ``ZT_WORKERS`` (default: one per CPU).
+
+Usage: python benchmarks/serve_bench.py [product_count] [seconds] [clients]
+"""
+import http.client
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+
+PATHS = ['/healthz', '/api/categories', '/api/products/suggest?prefix=10001',
+         '/api/products']
+
+
+def seed(count):
+    conn = database.get_db_connection()
+    conn.execute('DELETE FROM products')
+    cat_ids = [row['id'] for row in conn.execute('SELECT id FROM categories')]
+    conn.executemany('''
+        INSERT INTO products (code, name, specs, price, logo_url,
+                              category_id, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', ((str(100000 + i), f'Product {i}', 'إضاءة RGB – 7200 DPI – USB',
+           round(random.uniform(10, 5000), 2), 'logowhite.png',
+           random.choice(cat_ids), 'وصف المنتج') for i in range(count)))
+    conn.commit()
+    conn.close()
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/healthz')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+def login(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('POST', '/api/auth/login',
+                 json.dumps({'username': 'admin', 'password': 'admin123'}),
+                 {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie').split(';')[0]
+    conn.close()
+    return cookie
+
+
+def hammer(port, cookie, path, seconds, clients):
+    """Return (requests per second, errors) for ``clients`` busy loops"""
+    counts = [0] * clients
+    errors = [0] * clients
+    deadline = time.monotonic() + seconds
+
+    def client(i):
+        headers = {'Cookie': cookie, 'Accept-Encoding': 'gzip'}
+        while time.monotonic() < deadline:
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port,
+                                                  timeout=30)
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                conn.close()
+                if response.status == 200:
+                    counts[i] += 1
+                else:
+                    errors[i] += 1
+            except OSError:
+                errors[i] += 1
+
+    threads = [threading.Thread(target=client, args=(i,))
+               for i in range(clients)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.monotonic() - started), sum(errors)
+
+
+def serve(label, command, env, cwd, port, seconds, clients):
+    process = subprocess.Popen(command, cwd=cwd, env=env,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    try:
+        wait_ready(port)
+        cookie = login(port)
+        for path in PATHS:
+            hammer(port, cookie, path, 1, clients)
+            rate, errors = hammer(port, cookie, path, seconds, clients)
+            print(f'{label:<10}{path:<40}{rate:>10.0f}{errors:>8}')
+    finally:
+        # The dev server's reloader runs the app in a child process
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    clients = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        database.init_db()
+        seed(count)
+
+        env = dict(os.environ,
+                   ZT_DB=database.DB_NAME,
+                   ZT_BRANCHES_DIR=os.path.join(tmp, 'branches'),
+                   ZT_CATALOG_FILES_DIR=os.path.join(tmp, 'catalog'),
+                   ZT_WORKERS=os.environ.get('ZT_WORKERS',
+                                             str(os.cpu_count() or 1)),
+                   PYTHONPATH=ROOT)
+
+        print(f'{count} products, {clients} clients, {seconds:g} s per row, '
+              f'{os.cpu_count()} CPUs, {env["ZT_WORKERS"]} gunicorn workers')
+        print(f'{"server":<10}{"path":<40}{"req/s":>10}{"errors":>8}')
+        serve('dev', [sys.executable, os.path.join(ROOT, 'app.py')],
+              dict(env, PORT='5091'), tmp, 5091, seconds, clients)
+        serve('gunicorn',
+              [sys.executable, '-m', 'gunicorn', '-c',
+               os.path.join(ROOT, 'gunicorn.conf.py')],
+              dict(env, ZT_BIND='127.0.0.1:5092'), tmp, 5092, seconds,
+              clients)
+
+
+if __name__ == '__main__':
+    main()
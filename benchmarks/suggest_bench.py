@@ -0,0 +1,106 @@
+"""Time prefix lookups and incremental updates of the suggest index.
+
+Lookups are timed for dense prefixes (many matches), for words inside
+product names, and for sparse prefixes with few or no matches, which fall
+through every list of the index.
+
+Usage: python benchmarks/suggest_bench.py [product_count] [lookups]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import suggest  # noqa: E402
+
+
+def seed(count):
+    conn = database.get_db_connection()
+    conn.execute('DELETE FROM products')
+    conn.executemany('''
+        INSERT INTO products (code, name, specs, price, logo_url)
+        VALUES (?, ?, '', ?, 'logowhite.png')
+    ''', ((str(1000000 + i), f'Product {i}', 100.0) for i in range(count)))
+    conn.commit()
+    conn.close()
+
+
+def percentiles(values):
+    values = sorted(values)
+    p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+    return '%8.1f %8.1f %8.1f' % (statistics.median(values) * 1e6,
+                                  p99 * 1e6, values[-1] * 1e6)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        database.init_db()
+        seed(count)
+
+        conn = database.get_db_connection()
+        index = suggest.SuggestIndex()
+        start = time.perf_counter()
+        index.build(conn)
+        build_seconds = time.perf_counter() - start
+
+        codes = [str(1000000 + random.randrange(count)) for _ in range(lookups)]
+        timings = {'code prefix': [], 'name prefix': [], 'inner word': [],
+                   'sparse prefix': [], 'refresh idle': []}
+        sparse = ['0001234', '9999999', 'zzz', 'product x', '1' * 12]
+        for code in codes:
+            prefix = code[:random.randint(1, len(code))]
+            start = time.perf_counter()
+            results = index.lookup(prefix)
+            timings['code prefix'].append(time.perf_counter() - start)
+            assert results and len(results) <= suggest.DEFAULT_LIMIT
+
+            prefix = 'product ' + code[1:random.randint(2, len(code))]
+            start = time.perf_counter()
+            index.lookup(prefix)
+            timings['name prefix'].append(time.perf_counter() - start)
+
+            # "Product 123" has the inner word "123"
+            number = str(int(code) - 1000000)
+            prefix = number[:random.randint(1, len(number))]
+            start = time.perf_counter()
+            results = index.lookup(prefix)
+            timings['inner word'].append(time.perf_counter() - start)
+            assert results
+
+            prefix = random.choice(sparse)
+            start = time.perf_counter()
+            index.lookup(prefix)
+            timings['sparse prefix'].append(time.perf_counter() - start)
+
+        for _ in range(1000):
+            start = time.perf_counter()
+            index.refresh(conn)
+            timings['refresh idle'].append(time.perf_counter() - start)
+
+        # One write per refresh, as when products are edited between lookups
+        timings['refresh 1 write'] = []
+        for i in range(200):
+            conn.execute('UPDATE products SET name = ? WHERE code = ?',
+                         (f'Renamed {i}', random.choice(codes)))
+            conn.commit()
+            start = time.perf_counter()
+            index.refresh(conn)
+            timings['refresh 1 write'].append(time.perf_counter() - start)
+        conn.close()
+
+        print(f'{count} products, index built in {build_seconds:.2f} s')
+        print(f'{"":<18}{"p50 us":>9}{"p99 us":>9}{"max us":>9}')
+        for name, values in timings.items():
+            print(f'{name:<18} {percentiles(values)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Per-branch databases layered over the master catalog.
+
+The master database (``database.DB_NAME``) holds the shared catalog:
+products, categories, logos and users.  Each branch has its own small
+database file, ``<directory>/<branch>.db``, holding its price overrides
+and its print settings.  A request for a branch attaches that file to its
+connection as ``branch``, so products are read with one join that prefers
+the branch price.
+
+Branch writes (prices, print settings) only lock the branch's own file,
+so branches never contend with each other or with reads of the master.
+"""
+import os
+import re
+import sqlite3
+
+import catalog
+import database
+
+BRANCH_NAME_RE = re.compile(r'^[a-z0-9][a-z0-9_-]{0,31}$')
+
+# Product list with category names and the branch price (branch attached)
+PRODUCTS_SQL = '''
+    SELECT p.id, p.code, p.name, p.specs,
+           COALESCE(o.price, p.price) AS price,
+           p.logo_url, p.category_id, p.description, p.created_at,
+           CASE WHEN o.updated_at > p.updated_at THEN o.updated_at
+                ELSE p.updated_at END AS updated_at,
+           c.name as category_name
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+    LEFT JOIN branch.price_overrides o ON o.code = p.code
+'''
+
+
+class BranchError(ValueError):
+    """Raised for an invalid, unknown or duplicate branch name"""
+
+
+def install(cursor):
+    """Create or migrate the tables of a branch database"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS price_overrides (
+            code TEXT PRIMARY KEY,
+            price REAL NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    database.create_print_settings_table(cursor)
+    database.migrate_print_settings(cursor)
+    catalog.install_branch(cursor)
+
+
+class BranchStore:
+    """Locates, creates and attaches branch databases"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        if not BRANCH_NAME_RE.match(name or ''):
+            raise BranchError('Invalid branch name')
+        return os.path.join(self.directory, name + '.db')
+
+    def exists(self, name):
+        return bool(BRANCH_NAME_RE.match(name or '')) and \
+            os.path.exists(self.path(name))
+
+    def names(self):
+        """Return the names of all branches"""
+        return sorted(
+            name[:-3] for name in os.listdir(self.directory)
+            if name.endswith('.db') and BRANCH_NAME_RE.match(name[:-3])
+        )
+
+    def connect(self, name):
+        """Open a connection to a branch database (for its own writes)"""
+        if not self.exists(name):
+            raise BranchError('Branch not found')
+        conn = database.connect(self.path(name))
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def attach(self, conn, name):
+        """Attach a branch database to a connection as ``branch``"""
+        conn.execute('ATTACH DATABASE ? AS branch', (self.path(name),))
+
+    def create(self, name):
+        """Create a branch starting from the master's print settings"""
+        path = self.path(name)
+        if os.path.exists(path):
+            raise BranchError('Branch already exists')
+
+        master = database.get_db_connection()
+        settings = master.execute(
+            'SELECT * FROM print_settings ORDER BY id DESC LIMIT 1'
+        ).fetchone()
+        master.close()
+
+        conn = database.connect(path)
+        cursor = conn.cursor()
+        install(cursor)
+        if settings:
+            columns = [key for key in settings.keys() if key != 'id']
+            cursor.execute(
+                f'INSERT INTO print_settings ({", ".join(columns)}) '
+                f'VALUES ({", ".join("?" * len(columns))})',
+                [settings[key] for key in columns]
+            )
+        conn.commit()
+        conn.close()
+
+    def set_price(self, conn, code, price):
+        """Set or replace a product's price override on a branch
+        connection; the caller commits"""
+        conn.execute('''
+            INSERT INTO price_overrides (code, price) VALUES (?, ?)
+            ON CONFLICT(code) DO UPDATE
+            SET price = excluded.price, updated_at = CURRENT_TIMESTAMP
+        ''', (code, price))
+
+    def clear_logo(self, logo_id):
+        """Make branch print settings using a deleted logo keep no logo"""
+        for name in self.names():
+            conn = database.connect(self.path(name), timeout=10)
+            conn.execute(
+                'UPDATE print_settings SET logo_id = NULL WHERE logo_id = ?',
+                (logo_id,)
+            )
+            conn.commit()
+            conn.close()
+
+    def migrate_all(self, logo_ids=None):
+        """Bring every branch database up to the current schema
+
+        With ``logo_ids`` (the master's logos), settings referring to any
+        other logo are cleared too.
+        """
+        for name in self.names():
+            conn = database.connect(self.path(name))
+            install(conn.cursor())
+            if logo_ids is not None:
+                logo_ids = list(logo_ids)
+                conn.execute(
+                    'UPDATE print_settings SET logo_id = NULL '
+                    'WHERE logo_id IS NOT NULL AND logo_id NOT IN '
+                    f'({", ".join("?" * len(logo_ids)) or "NULL"})',
+                    logo_ids
+                )
+            conn.commit()
+            conn.close()
@@ -0,0 +1,105 @@
+"""Server-rendered price card fragments with an LRU cache.
+
+A card's markup depends only on the product row and the few print
+settings it names (logo and barcode type), so rendered fragments are
+cached under (product code, product updated_at, render-settings version).
+Colours, fonts and sizes reach the cards through the stylesheet (see
+:mod:`print_styles`) and leave cached fragments valid.  Reprinting an
+unchanged shelf is served from memory and only edited products are
+rendered again.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import render_template
+
+# Columns that appear in the card markup
+CARD_FIELDS = ('name', 'specs', 'price')
+
+# Print settings that appear in the card markup; keep in step with
+# render_card()
+RENDER_SETTINGS = ('logo_filename', 'barcode_type')
+
+
+def settings_version(settings):
+    """Return a short digest of the print settings the markup uses"""
+    payload = repr([(name, settings.get(name))
+                    for name in RENDER_SETTINGS]).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def format_price(price):
+    """Format a price the way the print page shows it (350.0 -> 350)"""
+    if isinstance(price, float) and price.is_integer():
+        return str(int(price))
+    return str(price)
+
+
+def render_card(product, settings):
+    """Render the HTML fragment for one card"""
+    return render_template(
+        'card.html',
+        product=product,
+        price=format_price(product['price']),
+        logo_filename=settings.get('logo_filename') or 'logowhite.png',
+        barcode_type=settings.get('barcode_type') or 'none'
+    )
+
+
+class CardCache:
+    """LRU cache of rendered card fragments with hit-rate statistics"""
+
+    def __init__(self, max_items=2048):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, products, settings):
+        """Return {code: html} for the products, rendering only misses"""
+        version = settings_version(settings)
+        fragments = {}
+        for product in products:
+            key = (product['code'], product['updated_at'], version)
+            # updated_at has one-second resolution, so also confirm the
+            # displayed fields before trusting a hit
+            fields = tuple(product[field] for field in CARD_FIELDS)
+
+            with self._lock:
+                entry = self._items.get(key)
+                if entry is not None and entry[0] == fields:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    fragments[product['code']] = entry[1]
+                    continue
+                self.misses += 1
+
+            html = render_card(product, settings)
+            fragments[product['code']] = html
+            with self._lock:
+                self._items[key] = (fields, html)
+                self._items.move_to_end(key)
+                while len(self._items) > self.max_items:
+                    self._items.popitem(last=False)
+                    self.evictions += 1
+        return fragments
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        """Return size and hit-rate counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'items': len(self._items),
+                'max_items': self.max_items,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,338 @@
+"""Versioned catalog snapshots and deltas for offline print terminals.
+
+Triggers record every change to products, logos and print settings in
+``catalog_changes``, one row per changed item.  A change deletes the
+item's row and inserts it again with a new ``seq``, so the table grows
+with the number of distinct items rather than the number of edits, and
+the catalog version is simply the highest ``seq``.  (Not ``INSERT OR
+REPLACE``: inside a trigger fired by an UPSERT the outer statement's
+conflict handling wins and the REPLACE becomes a plain INSERT.)
+
+A terminal keeps the catalog in IndexedDB and asks for the changes since
+its version; anything with a newer ``seq`` is sent again and deleted
+products are listed by code.  A random epoch, created with the table,
+tells a terminal to start over when the database itself was replaced.
+"""
+import json
+import secrets
+
+import rows
+
+# Product list with category names, as served by /api/products
+PRODUCTS_SQL = '''
+    SELECT p.*, c.name as category_name
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+'''
+
+
+def _mark(entity, key, deleted):
+    return (
+        'DELETE FROM catalog_changes '
+        f"WHERE entity = '{entity}' AND entity_key = {key};\n"
+        'INSERT INTO catalog_changes '
+        f"(entity, entity_key, deleted) VALUES ('{entity}', {key}, {deleted});"
+    )
+
+
+_SETTINGS_CHANGED = _mark('print_settings', "'current'", 0)
+
+_TRIGGERS = {
+    'trg_catalog_product_insert': f'''
+        CREATE TRIGGER trg_catalog_product_insert
+        AFTER INSERT ON products
+        BEGIN
+            {_mark('product', 'NEW.code', 0)}
+        END
+    ''',
+    'trg_catalog_product_update': f'''
+        CREATE TRIGGER trg_catalog_product_update
+        AFTER UPDATE ON products
+        BEGIN
+            DELETE FROM catalog_changes
+            WHERE entity = 'product' AND entity_key IN (OLD.code, NEW.code);
+            INSERT INTO catalog_changes (entity, entity_key, deleted)
+            SELECT 'product', OLD.code, 1 WHERE OLD.code IS NOT NEW.code;
+            INSERT INTO catalog_changes (entity, entity_key, deleted)
+            VALUES ('product', NEW.code, 0);
+        END
+    ''',
+    'trg_catalog_product_delete': f'''
+        CREATE TRIGGER trg_catalog_product_delete
+        AFTER DELETE ON products
+        BEGIN
+            {_mark('product', 'OLD.code', 1)}
+        END
+    ''',
+    # Products carry their category name
+    'trg_catalog_category_update': '''
+        CREATE TRIGGER trg_catalog_category_update
+        AFTER UPDATE OF name ON categories
+        BEGIN
+            DELETE FROM catalog_changes
+            WHERE entity = 'product' AND entity_key IN (
+                SELECT code FROM products WHERE category_id = NEW.id
+            );
+            INSERT INTO catalog_changes (entity, entity_key, deleted)
+            SELECT 'product', code, 0 FROM products
+            WHERE category_id = NEW.id;
+        END
+    ''',
+    # Print settings carry their logo's filename and name
+    'trg_catalog_logo_insert': f'''
+        CREATE TRIGGER trg_catalog_logo_insert
+        AFTER INSERT ON logos
+        BEGIN
+            {_mark('logo', 'NEW.id', 0)}
+            {_SETTINGS_CHANGED}
+        END
+    ''',
+    'trg_catalog_logo_update': f'''
+        CREATE TRIGGER trg_catalog_logo_update
+        AFTER UPDATE ON logos
+        BEGIN
+            {_mark('logo', 'NEW.id', 0)}
+            {_SETTINGS_CHANGED}
+        END
+    ''',
+    'trg_catalog_logo_delete': f'''
+        CREATE TRIGGER trg_catalog_logo_delete
+        AFTER DELETE ON logos
+        BEGIN
+            {_mark('logo', 'OLD.id', 1)}
+            {_SETTINGS_CHANGED}
+        END
+    ''',
+    'trg_catalog_settings_insert': f'''
+        CREATE TRIGGER trg_catalog_settings_insert
+        AFTER INSERT ON print_settings
+        BEGIN
+            {_SETTINGS_CHANGED}
+        END
+    ''',
+    'trg_catalog_settings_update': f'''
+        CREATE TRIGGER trg_catalog_settings_update
+        AFTER UPDATE ON print_settings
+        BEGIN
+            {_SETTINGS_CHANGED}
+        END
+    ''',
+    'trg_catalog_settings_delete': f'''
+        CREATE TRIGGER trg_catalog_settings_delete
+        AFTER DELETE ON print_settings
+        BEGIN
+            {_SETTINGS_CHANGED}
+        END
+    '''
+}
+
+
+_BRANCH_TRIGGERS = {
+    'trg_catalog_override_insert': f'''
+        CREATE TRIGGER trg_catalog_override_insert
+        AFTER INSERT ON price_overrides
+        BEGIN
+            {_mark('product', 'NEW.code', 0)}
+        END
+    ''',
+    'trg_catalog_override_update': f'''
+        CREATE TRIGGER trg_catalog_override_update
+        AFTER UPDATE ON price_overrides
+        BEGIN
+            DELETE FROM catalog_changes
+            WHERE entity = 'product' AND entity_key IN (OLD.code, NEW.code);
+            INSERT INTO catalog_changes (entity, entity_key, deleted)
+            SELECT 'product', OLD.code, 0 WHERE OLD.code IS NOT NEW.code;
+            INSERT INTO catalog_changes (entity, entity_key, deleted)
+            VALUES ('product', NEW.code, 0);
+        END
+    ''',
+    'trg_catalog_override_delete': f'''
+        CREATE TRIGGER trg_catalog_override_delete
+        AFTER DELETE ON price_overrides
+        BEGIN
+            {_mark('product', 'OLD.code', 0)}
+        END
+    ''',
+    'trg_catalog_settings_insert': _TRIGGERS['trg_catalog_settings_insert'],
+    'trg_catalog_settings_update': _TRIGGERS['trg_catalog_settings_update'],
+    'trg_catalog_settings_delete': _TRIGGERS['trg_catalog_settings_delete']
+}
+
+
+def _create_log(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_key TEXT NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (entity, entity_key)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+    cursor.execute(
+        "INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('epoch', ?)",
+        (secrets.token_hex(8),)
+    )
+
+
+def _create_triggers(cursor, triggers):
+    for name, sql in triggers.items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(sql)
+
+
+def install(cursor):
+    """Create the change log, its epoch and the triggers feeding it"""
+    _create_log(cursor)
+    _create_triggers(cursor, _TRIGGERS)
+
+
+def install_branch(cursor):
+    """Create a branch database's change log for overrides and settings"""
+    _create_log(cursor)
+    _create_triggers(cursor, _BRANCH_TRIGGERS)
+
+
+def _log_state(conn, schema):
+    epoch = conn.execute(
+        f"SELECT value FROM {schema}.catalog_meta WHERE key = 'epoch'"
+    ).fetchone()[0]
+    version = conn.execute(
+        f'SELECT COALESCE(MAX(seq), 0) FROM {schema}.catalog_changes'
+    ).fetchone()[0]
+    return epoch, version
+
+
+def version(conn, branch=False):
+    """Return ``(epoch, version)`` as :func:`read` reports them"""
+    logs = [_log_state(conn, 'main')]
+    if branch:
+        logs.append(_log_state(conn, 'branch'))
+        return ('.'.join(log[0] for log in logs),
+                '.'.join(str(log[1]) for log in logs))
+    return logs[0]
+
+
+def _parse_version(since, count):
+    """Split a version string into ``count`` ints; None if malformed"""
+    if since is None:
+        return None
+    try:
+        parts = tuple(int(part) for part in str(since).split('.'))
+    except ValueError:
+        return None
+    return parts if len(parts) == count else None
+
+
+def read(conn, since=None, epoch=None, products_sql=PRODUCTS_SQL,
+         branch=False):
+    """Return the catalog, or its changes since a version, as parts
+
+    Run inside one read transaction so every part reflects the same
+    version.  ``products`` and ``logos`` are JSON text; ``logos`` is None
+    and ``settings_changed`` False when the terminal's copy is current.
+    With ``branch`` the connection has a branch database attached as
+    ``branch``; its log is combined with the master's, so versions and
+    epochs have the form ``master.branch``.
+    """
+    logs = [_log_state(conn, 'main')]
+    if branch:
+        logs.append(_log_state(conn, 'branch'))
+    current_epoch = '.'.join(log[0] for log in logs)
+    versions = tuple(log[1] for log in logs)
+    version = versions[0] if not branch else \
+        '.'.join(str(v) for v in versions)
+
+    seen = _parse_version(since, len(logs))
+    full = seen is None or epoch != current_epoch or \
+        any(old > new for old, new in zip(seen, versions))
+    if full:
+        return {
+            'epoch': current_epoch,
+            'version': version,
+            'full': True,
+            'products': rows.json_array(conn, products_sql,
+                                        order_by='code'),
+            'deleted_products': [],
+            'logos': rows.json_array(conn, 'SELECT * FROM logos',
+                                     order_by='uploaded_at DESC'),
+            'settings_changed': True
+        }
+
+    changes = conn.execute('''
+        SELECT entity, entity_key, deleted FROM main.catalog_changes
+        WHERE seq > ?
+    ''', (seen[0],)).fetchall()
+    entities = {row['entity'] for row in changes}
+    # The unary + keeps SQLite on the seq range instead of the entity
+    # index, which would visit every product ever logged
+    changed_sql = '''
+        SELECT entity_key FROM main.catalog_changes
+        WHERE +entity = 'product' AND deleted = 0 AND seq > ?
+    '''
+    params = (seen[0],)
+    settings_changed = 'print_settings' in entities
+
+    if branch:
+        branch_entities = {row['entity'] for row in conn.execute(
+            'SELECT DISTINCT entity FROM branch.catalog_changes '
+            'WHERE seq > ?', (seen[1],)
+        ).fetchall()}
+        if 'product' in branch_entities:
+            entities.add('product')
+        changed_sql += '''
+            UNION
+            SELECT entity_key FROM branch.catalog_changes
+            WHERE +entity = 'product' AND seq > ?
+        '''
+        params += (seen[1],)
+        # The branch has its own settings; the master's only matter
+        # through the logo they point at
+        settings_changed = 'print_settings' in branch_entities or \
+            'logo' in entities
+
+    products = '[]'
+    if 'product' in entities:
+        products = rows.json_array(
+            conn, f'SELECT * FROM ({products_sql}) WHERE code IN '
+            f'({changed_sql})', params, order_by='code'
+        )
+    logos = None
+    if 'logo' in entities:
+        logos = rows.json_array(conn, 'SELECT * FROM logos',
+                                order_by='uploaded_at DESC')
+    return {
+        'epoch': current_epoch,
+        'version': version,
+        'full': False,
+        'products': products,
+        'deleted_products': [row['entity_key'] for row in changes
+                             if row['entity'] == 'product' and
+                             row['deleted']],
+        'logos': logos,
+        'settings_changed': settings_changed
+    }
+
+
+def to_json(parts, print_settings):
+    """Assemble the JSON response body from :func:`read` parts"""
+    return (
+        '{"deleted_products":%s,"epoch":%s,"full":%s,"logos":%s,'
+        '"print_settings":%s,"products":%s,"version":%s}'
+    ) % (
+        json.dumps(parts['deleted_products'], ensure_ascii=False),
+        json.dumps(parts['epoch']),
+        'true' if parts['full'] else 'false',
+        parts['logos'] if parts['logos'] is not None else 'null',
+        json.dumps(print_settings, ensure_ascii=False)
+        if parts['settings_changed'] else 'null',
+        parts['products'],
+        json.dumps(parts['version'])
+    )
@@ -0,0 +1,192 @@
+"""Precompressed catalog files, rewritten after product changes.
+
+The master product list is written to ``catalog.<rev>.json.gz`` (the
+/api/products body) and ``catalog.<rev>.ndjson.gz`` (one product per
+line).  ``rev`` is ``<epoch>-<seq>`` from the catalog change log (see
+:mod:`catalog`), so a file name says exactly which data it holds and a
+file is never rewritten in place.
+
+Writes call :meth:`CatalogFiles.schedule`; the files are built ``delay``
+seconds after the last call, so a burst of edits costs one rebuild, but
+never later than ``max_delay`` after the first.  A request that finds no
+file for the current revision (a write in another process, or the delay
+not having passed yet) is answered from the database and schedules a
+build.
+"""
+import gzip
+import logging
+import os
+import threading
+import time
+
+import catalog
+import database
+import rows
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('json', 'ndjson')
+
+
+def revision(conn):
+    """Return the catalog revision the connection currently sees"""
+    epoch = conn.execute(
+        "SELECT value FROM catalog_meta WHERE key = 'epoch'"
+    ).fetchone()[0]
+    seq = conn.execute(
+        'SELECT COALESCE(MAX(seq), 0) FROM catalog_changes'
+    ).fetchone()[0]
+    return f'{epoch}-{seq}'
+
+
+class CatalogFiles:
+    """Builds, finds and prunes the materialized catalog files"""
+
+    def __init__(self, directory, delay=1.0, max_delay=10.0, keep=2):
+        self.directory = directory
+        self.delay = delay
+        self.max_delay = max_delay
+        self.keep = keep
+        self.builds = 0
+        self.hits = 0
+        self.misses = 0
+        self.last_build_seconds = 0.0
+        self._timer = None
+        self._first_scheduled = None
+        self._pid = None
+        # Guards the timer and the counters; held only briefly, unlike
+        # _build_lock, which is held for a whole build
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, rev, fmt='json'):
+        return os.path.join(self.directory, f'catalog.{rev}.{fmt}.gz')
+
+    def lookup(self, conn, fmt='json'):
+        """Return ``(rev, file)`` for the current revision's file
+
+        The file is returned open, so a :meth:`prune` in this or another
+        process cannot remove it before it is sent.  ``file`` is None when
+        it has not been built yet; a build is then scheduled.
+        """
+        rev = revision(conn)
+        try:
+            f = open(self.path(rev, fmt), 'rb')
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            self.schedule()
+            return rev, None
+        with self._lock:
+            self.hits += 1
+        return rev, f
+
+    def schedule(self):
+        """Build the files after the debounce delay"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Timers do not survive fork
+                self._timer = None
+                self._first_scheduled = None
+                self._pid = os.getpid()
+            now = time.monotonic()
+            if self._first_scheduled is None:
+                self._first_scheduled = now
+            delay = min(self.delay,
+                        max(0.0, self._first_scheduled + self.max_delay - now))
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(delay, self._run)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _run(self):
+        with self._lock:
+            self._timer = None
+            self._first_scheduled = None
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Building the catalog files failed')
+
+    def build(self):
+        """Write the files for the current revision; return the revision"""
+        with self._build_lock:
+            started = time.perf_counter()
+            conn = database.get_db_connection()
+            try:
+                # One read transaction, so the body matches the revision
+                conn.execute('BEGIN')
+                rev = revision(conn)
+                if all(os.path.exists(self.path(rev, fmt))
+                       for fmt in FORMATS):
+                    return rev
+                objects = rows.json_objects(conn, catalog.PRODUCTS_SQL,
+                                            order_by='code')
+                conn.rollback()
+            finally:
+                conn.close()
+
+            self._write(self.path(rev, 'json'),
+                        '[' + ','.join(objects) + ']')
+            self._write(self.path(rev, 'ndjson'),
+                        ''.join(obj + '\n' for obj in objects))
+            with self._lock:
+                self.builds += 1
+                self.last_build_seconds = time.perf_counter() - started
+            self.prune()
+            return rev
+
+    def _write(self, path, text):
+        # Write then rename, so readers never see a partial file
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6,
+                               mtime=0) as gz:
+                gz.write(text.encode('utf-8'))
+        os.replace(tmp, path)
+
+    def _revisions(self):
+        """Revisions on disk, newest first"""
+        revs = {}
+        for name in os.listdir(self.directory):
+            if name.startswith('catalog.') and name.endswith('.gz'):
+                rev = name.split('.')[1]
+                try:
+                    mtime = os.path.getmtime(
+                        os.path.join(self.directory, name)
+                    )
+                except OSError:
+                    # Pruned by another process meanwhile
+                    continue
+                revs[rev] = max(revs.get(rev, 0), mtime)
+        return sorted(revs, key=revs.get, reverse=True)
+
+    def prune(self):
+        """Delete the files of all but the newest ``keep`` revisions"""
+        removed = 0
+        for rev in self._revisions()[self.keep:]:
+            for fmt in FORMATS:
+                try:
+                    os.remove(self.path(rev, fmt))
+                    removed += 1
+                except OSError:
+                    # Missing, or still open for sending on Windows
+                    pass
+        return removed
+
+    def stats(self):
+        with self._lock:
+            counters = {
+                'builds': self.builds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'last_build_seconds': round(self.last_build_seconds, 6)
+            }
+        return {
+            'revisions': self._revisions(),
+            **counters,
+            'delay': self.delay,
+            'max_delay': self.max_delay
+        }
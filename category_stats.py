@@ -0,0 +1,199 @@
+"""Per-category product statistics maintained by triggers.
+
+``category_stats`` holds one row per category with the product count,
+price sum and price min/max.  Triggers on ``products`` and ``categories``
+keep it current inside the writing transaction, so reading the stats
+costs one row per category however large the catalog is.  When the
+deleted or re-priced product held the category's min or max, the new
+bound is looked up through ``idx_products_category_price``.
+
+The triggers test for an existing row rather than use ``INSERT OR
+IGNORE``: under an UPSERT the outer statement's conflict handling applies
+to the triggers too, and the IGNORE would be lost.
+"""
+
+# Absolute tolerance when comparing the running price sum with a recount
+SUM_TOLERANCE = 1e-6
+
+_TRIGGERS = {
+    'trg_category_stats_product_insert': '''
+        CREATE TRIGGER trg_category_stats_product_insert
+        AFTER INSERT ON products
+        WHEN NEW.category_id IS NOT NULL
+        BEGIN
+            INSERT INTO category_stats (category_id)
+            SELECT NEW.category_id WHERE NOT EXISTS (
+                SELECT 1 FROM category_stats
+                WHERE category_id = NEW.category_id
+            );
+            UPDATE category_stats
+            SET product_count = product_count + 1,
+                price_sum = price_sum + NEW.price,
+                price_min = min(coalesce(price_min, NEW.price), NEW.price),
+                price_max = max(coalesce(price_max, NEW.price), NEW.price)
+            WHERE category_id = NEW.category_id;
+        END
+    ''',
+    'trg_category_stats_product_delete': '''
+        CREATE TRIGGER trg_category_stats_product_delete
+        AFTER DELETE ON products
+        WHEN OLD.category_id IS NOT NULL
+        BEGIN
+            UPDATE category_stats
+            SET product_count = product_count - 1,
+                price_sum = price_sum - OLD.price,
+                price_min = CASE WHEN OLD.price <= price_min THEN (
+                    SELECT min(price) FROM products
+                    WHERE category_id = OLD.category_id
+                ) ELSE price_min END,
+                price_max = CASE WHEN OLD.price >= price_max THEN (
+                    SELECT max(price) FROM products
+                    WHERE category_id = OLD.category_id
+                ) ELSE price_max END
+            WHERE category_id = OLD.category_id;
+        END
+    ''',
+    # An update is a delete of the old values followed by an insert of the
+    # new ones; the bounds lookup already sees the updated row
+    'trg_category_stats_product_update': '''
+        CREATE TRIGGER trg_category_stats_product_update
+        AFTER UPDATE OF price, category_id ON products
+        WHEN OLD.price IS NOT NEW.price
+            OR OLD.category_id IS NOT NEW.category_id
+        BEGIN
+            UPDATE category_stats
+            SET product_count = product_count - 1,
+                price_sum = price_sum - OLD.price,
+                price_min = (
+                    SELECT min(price) FROM products
+                    WHERE category_id = OLD.category_id
+                ),
+                price_max = (
+                    SELECT max(price) FROM products
+                    WHERE category_id = OLD.category_id
+                )
+            WHERE category_id = OLD.category_id;
+            INSERT INTO category_stats (category_id)
+            SELECT NEW.category_id WHERE NEW.category_id IS NOT NULL
+            AND NOT EXISTS (
+                SELECT 1 FROM category_stats
+                WHERE category_id = NEW.category_id
+            );
+            UPDATE category_stats
+            SET product_count = product_count + 1,
+                price_sum = price_sum + NEW.price,
+                price_min = min(coalesce(price_min, NEW.price), NEW.price),
+                price_max = max(coalesce(price_max, NEW.price), NEW.price)
+            WHERE category_id = NEW.category_id;
+        END
+    ''',
+    'trg_category_stats_category_insert': '''
+        CREATE TRIGGER trg_category_stats_category_insert
+        AFTER INSERT ON categories
+        BEGIN
+            INSERT INTO category_stats (category_id)
+            SELECT NEW.id WHERE NOT EXISTS (
+                SELECT 1 FROM category_stats WHERE category_id = NEW.id
+            );
+        END
+    ''',
+    'trg_category_stats_category_delete': '''
+        CREATE TRIGGER trg_category_stats_category_delete
+        AFTER DELETE ON categories
+        BEGIN
+            DELETE FROM category_stats WHERE category_id = OLD.id;
+        END
+    '''
+}
+
+# Recount from the base tables, in the shape of category_stats
+_RECOUNT_SQL = '''
+    SELECT category_id, COUNT(*) AS product_count,
+           SUM(price) AS price_sum, MIN(price) AS price_min,
+           MAX(price) AS price_max
+    FROM products
+    WHERE category_id IS NOT NULL
+    GROUP BY category_id
+    UNION ALL
+    SELECT id, 0, 0, NULL, NULL FROM categories
+    WHERE id NOT IN (
+        SELECT category_id FROM products WHERE category_id IS NOT NULL
+    )
+'''
+
+STATS_COLUMNS = ('product_count', 'price_sum', 'price_min', 'price_max')
+
+
+def install(cursor):
+    """Create the stats table, index and triggers; fill a new table"""
+    cursor.execute(
+        "SELECT name FROM sqlite_master "
+        "WHERE type = 'table' AND name = 'category_stats'"
+    )
+    created = cursor.fetchone() is None
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS category_stats (
+            category_id INTEGER PRIMARY KEY,
+            product_count INTEGER NOT NULL DEFAULT 0,
+            price_sum REAL NOT NULL DEFAULT 0,
+            price_min REAL,
+            price_max REAL
+        )
+    ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_products_category_price '
+        'ON products (category_id, price)'
+    )
+    for name, sql in _TRIGGERS.items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(sql)
+
+    if created:
+        rebuild(cursor)
+
+
+def rebuild(cursor):
+    """Recompute every row of category_stats from the base tables"""
+    cursor.execute('DELETE FROM category_stats')
+    cursor.execute(f'''
+        INSERT INTO category_stats
+        (category_id, product_count, price_sum, price_min, price_max)
+        {_RECOUNT_SQL}
+    ''')
+
+
+def _differs(column, stored, expected):
+    if column == 'price_sum':
+        return abs((stored or 0) - (expected or 0)) > SUM_TOLERANCE
+    return stored != expected
+
+
+def verify(conn):
+    """Compare category_stats with a recount; return the mismatches"""
+    stored = {row['category_id']: row for row in conn.execute(
+        'SELECT * FROM category_stats'
+    ).fetchall()}
+    expected = {row['category_id']: row for row in conn.execute(
+        _RECOUNT_SQL
+    ).fetchall()}
+
+    mismatches = []
+    for category_id in sorted(set(stored) | set(expected)):
+        have = stored.get(category_id)
+        want = expected.get(category_id)
+        if have is None or want is None:
+            mismatches.append({
+                'category_id': category_id,
+                'error': 'missing row' if have is None else 'stale row'
+            })
+            continue
+        for column in STATS_COLUMNS:
+            if _differs(column, have[column], want[column]):
+                mismatches.append({
+                    'category_id': category_id,
+                    'column': column,
+                    'stored': have[column],
+                    'expected': want[column]
+                })
+    return mismatches
@@ -1,12 +1,27 @@
+import os
 import sqlite3
 from werkzeug.security import generate_password_hash
 
-DB_NAME = 'products.db'
+import catalog
+import category_stats
+
+DB_NAME = os.environ.get('ZT_DB', 'products.db')
+
+# Optional callable returning the sqlite3.Connection subclass to use for
+# new connections; profiling.py installs one to time SQL statements
+connection_factory = None
+
+
+def connect(target, **kwargs):
+    """Open a sqlite3 connection using the configured connection class"""
+    factory = connection_factory() if connection_factory else None
+    return sqlite3.connect(target, factory=factory or sqlite3.Connection,
+                           **kwargs)
 
 
 def get_db_connection():
     """Create and return a database connection"""
-    conn = sqlite3.connect(DB_NAME)
+    conn = connect(DB_NAME)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -16,6 +31,9 @@ def init_db():
     conn = get_db_connection()
     cursor = conn.cursor()
 
+    # Only takes effect for a new database; maintenance.py converts old ones
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
     # Products table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS products (
@@ -69,34 +87,30 @@ def init_db():
     ''')
 
     # Print settings table with font options
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS print_settings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            page_size TEXT DEFAULT 'A4',
-            custom_width REAL,
-            custom_height REAL,
-            card_color_start TEXT DEFAULT '#1e3c72',
-            card_color_end TEXT DEFAULT '#2a5298',
-            logo_id INTEGER,
-            logo_position TEXT DEFAULT 'top-center',
-            logo_size INTEGER DEFAULT 100,
-            font_size INTEGER DEFAULT 28,
-            font_color TEXT DEFAULT '#ffffff',
-            border_enabled INTEGER DEFAULT 0,
-            border_color TEXT DEFAULT '#ffffff',
-            border_width INTEGER DEFAULT 2,
-            card_mode TEXT DEFAULT 'grid',
-            card_width INTEGER DEFAULT 50,
-            card_height INTEGER DEFAULT 50,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (logo_id) REFERENCES logos(id)
-        )
-    ''')
+    create_print_settings_table(cursor)
+
+    # Per-category counters kept current by triggers
+    category_stats.install(cursor)
+
+    # Change log behind the offline catalog (see catalog.py)
+    catalog.install(cursor)
 
     # Migration: Add new columns if they don't exist (for existing databases)
     migrate_database(cursor)
 
+    # Default admin, categories, logos, sample products, print settings
+    seed_defaults(cursor)
+
+    conn.commit()
+    conn.close()
+
+
+def seed_defaults(cursor):
+    """Insert the default rows into empty tables
+
+    Uses only portable SQL, so the PostgreSQL store (storage.py) seeds a
+    new database through its sqlite3-style cursor the same way.
+    """
     # Create default admin user if no users exist
     cursor.execute('SELECT COUNT(*) as count FROM users')
     user_count = cursor.fetchone()['count']
@@ -145,8 +159,8 @@ def init_db():
     count = cursor.fetchone()['count']
 
     if count == 0:
-        # Get the first category ID
-        cursor.execute('SELECT id FROM categories LIMIT 1')
+        # Get the first category ID (by name, as SQLite's index gives it)
+        cursor.execute('SELECT id FROM categories ORDER BY name LIMIT 1')
         cat = cursor.fetchone()
         cat_id = cat['id'] if cat else None
 
@@ -190,8 +204,34 @@ def init_db():
               'top-center', 100, 28, '#ffffff',
               0, '#ffffff', 2, 'grid', 50, 50))
 
-    conn.commit()
-    conn.close()
+
+def create_print_settings_table(cursor):
+    """Create the print_settings table (also used by branch databases)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS print_settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            page_size TEXT DEFAULT 'A4',
+            custom_width REAL,
+            custom_height REAL,
+            card_color_start TEXT DEFAULT '#1e3c72',
+            card_color_end TEXT DEFAULT '#2a5298',
+            logo_id INTEGER,
+            logo_position TEXT DEFAULT 'top-center',
+            logo_size INTEGER DEFAULT 100,
+            font_size INTEGER DEFAULT 28,
+            font_color TEXT DEFAULT '#ffffff',
+            border_enabled INTEGER DEFAULT 0,
+            border_color TEXT DEFAULT '#ffffff',
+            border_width INTEGER DEFAULT 2,
+            card_mode TEXT DEFAULT 'grid',
+            card_width INTEGER DEFAULT 50,
+            card_height INTEGER DEFAULT 50,
+            barcode_type TEXT DEFAULT 'none',
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (logo_id) REFERENCES logos(id)
+        )
+    ''')
 
 
 def migrate_database(cursor):
@@ -211,7 +251,11 @@ def migrate_database(cursor):
             'ALTER TABLE users ADD COLUMN is_active INTEGER DEFAULT 1'
         )
 
-    # Check and add columns to print_settings table
+    migrate_print_settings(cursor)
+
+
+def migrate_print_settings(cursor):
+    """Add new columns to an existing print_settings table"""
     cursor.execute("PRAGMA table_info(print_settings)")
     settings_columns = [col[1] for col in cursor.fetchall()]
 
@@ -260,6 +304,11 @@ def migrate_database(cursor):
             'ALTER TABLE print_settings '
             'ADD COLUMN card_height INTEGER DEFAULT 50'
         )
+    if 'barcode_type' not in settings_columns:
+        cursor.execute(
+            'ALTER TABLE print_settings '
+            "ADD COLUMN barcode_type TEXT DEFAULT 'none'"
+        )
 
 
 def update_timestamp(code):
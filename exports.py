@@ -0,0 +1,58 @@
+"""Streamed product exports, read in chunks of short transactions.
+
+An export is sent while it is read: each chunk is one query for the next
+``CHUNK_SIZE`` products after the last code sent (keyset pagination), on
+its own connection.  No read transaction stays open while a slow client
+downloads, so writers are never blocked by an export; the price is that
+an export taken during edits is not a single point-in-time copy.
+"""
+import json
+
+CHUNK_SIZE = 500
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json'
+}
+
+
+def read_chunk(store, after='', branch=None, size=CHUNK_SIZE):
+    """Return ``(objects, last_code)`` for the products after ``after``
+
+    ``objects`` are JSON object texts; an empty list ends the export.
+    """
+    conn = store.read_connection(branch)
+    try:
+        objects = store.products.json_objects(conn, branch, after=after,
+                                              limit=size)
+    finally:
+        conn.close()
+    last = json.loads(objects[-1])['code'] if objects else after
+    return objects, last
+
+
+def frame(objects, fmt, first):
+    """Return the text of one chunk in the export format"""
+    if fmt == 'ndjson':
+        return ''.join(obj + '\n' for obj in objects)
+    return ('[' if first else ',') + ','.join(objects)
+
+
+def closing_text(fmt, empty):
+    """Text that ends an export"""
+    if fmt == 'ndjson':
+        return ''
+    return '[]' if empty else ']'
+
+
+def iter_export(store, fmt, branch=None):
+    """Yield an export's text chunk by chunk (for WSGI streaming)"""
+    after = ''
+    first = True
+    while True:
+        objects, after = read_chunk(store, after, branch)
+        if not objects:
+            break
+        yield frame(objects, fmt, first)
+        first = False
+    yield closing_text(fmt, first)
@@ -0,0 +1,52 @@
+"""Gunicorn settings for production, configured from the environment.
+
+    gunicorn -c gunicorn.conf.py
+
+Workers are separate processes serving one request at a time (the
+``sync`` worker), which suits the short SQLite reads this app does; put
+nginx or another buffering proxy in front so slow clients do not hold a
+worker.  ``ZT_THREADS`` above 1 switches to the ``gthread`` worker, but on
+gunicorn 21 that worker resets connections it has accepted and not yet
+read when it is stopped, so a reload can fail a few requests.
+``kill -HUP`` on the master reloads the code and settings gracefully (see
+wsgi.py).
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:application'
+bind = os.environ.get('ZT_BIND', '0.0.0.0:8000')
+
+workers = int(os.environ.get('ZT_WORKERS',
+                             str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.environ.get('ZT_THREADS', '1'))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+timeout = int(os.environ.get('ZT_TIMEOUT', '30'))
+# How long old workers may finish their requests on reload or shutdown
+graceful_timeout = int(os.environ.get('ZT_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('ZT_KEEPALIVE', '5'))
+
+# Recycle workers after this many requests (0 = never)
+max_requests = int(os.environ.get('ZT_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+# Load the app in each worker, not the master, so HUP picks up new code
+preload_app = False
+
+pidfile = os.environ.get('ZT_PIDFILE') or None
+accesslog = os.environ.get('ZT_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.environ.get('ZT_LOG_LEVEL', 'info')
+
+# Barcode prewarm processes per worker (0 = render in a thread)
+barcode_prewarm_processes = int(
+    os.environ.get('ZT_BARCODE_PREWARM_PROCESSES', '0')
+)
+
+
+def post_fork(server, worker):
+    # The new worker has no other threads yet, so it can fork safely
+    if barcode_prewarm_processes > 0:
+        import barcodes
+        barcodes.start_pool(barcode_prewarm_processes)
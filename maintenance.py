@@ -0,0 +1,461 @@
+"""Database maintenance: statistics, incremental vacuum and integrity checks.
+
+A maintenance run does up to three tasks on one connection, all within a
+shared time budget:
+
+``analyze``
+    ``ANALYZE`` when the database has never been analyzed, otherwise
+    ``PRAGMA optimize``, which re-analyzes only tables whose row counts
+    changed a lot.  ``analysis_limit`` keeps either one cheap.
+``vacuum``
+    ``PRAGMA incremental_vacuum`` in small chunks, each its own short
+    write transaction, until the free list is empty or time runs out.  A
+    database still in ``auto_vacuum = NONE`` needs one full ``VACUUM``
+    first; that never fits a budget, so the task only reports it and
+    :func:`convert` (``manage.py maintenance --convert``) does it offline.
+``integrity``
+    ``PRAGMA quick_check``, abandoned when time runs out.
+
+A progress handler interrupts any statement that runs past the budget.
+File size, free pages and leaf-page fragmentation are measured before and
+after, within the same budget, and each run is recorded in
+``maintenance_runs``.  That table lives in its own file (``ZT_MAINTENANCE_DB``,
+default ``maintenance.db`` next to the database), so recording and
+claiming runs do not change products.db, which would invalidate the read
+snapshot and the catalog files' change detection.
+
+:class:`MaintenanceScheduler` runs maintenance in a background thread once
+per interval, during a quiet period with no requests in this process.  A
+run is claimed in the database first, so with several workers only one
+runs it.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import database
+
+logger = logging.getLogger(__name__)
+
+RUNS_DB_NAME = os.environ.get('ZT_MAINTENANCE_DB')
+TASKS = ('analyze', 'vacuum', 'integrity')
+VACUUM_CHUNK_PAGES = 256
+ANALYSIS_LIMIT = 1000
+STALE_CLAIM = timedelta(hours=1)
+KEEP_RUNS = 50
+
+
+class MaintenanceInProgress(RuntimeError):
+    """Raised when another process or thread is already running maintenance"""
+
+
+class _Budget:
+    """Deadline shared by the tasks of one run"""
+
+    def __init__(self, seconds):
+        self.deadline = time.monotonic() + seconds
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+
+def _interrupted(error):
+    return 'interrupted' in str(error)
+
+
+# ============== Measurements ==============
+
+def fragmentation(conn):
+    """Share of b-tree leaf pages not stored right after the previous leaf
+
+    0 means every table and index is read sequentially; None when the
+    dbstat table is not compiled in.
+    """
+    try:
+        pages = conn.execute(
+            "SELECT name, pageno FROM dbstat WHERE pagetype = 'leaf'"
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        if _interrupted(e):
+            raise
+        return None
+
+    jumps = transitions = 0
+    previous_name = previous_page = None
+    for name, page in pages:
+        if name == previous_name:
+            transitions += 1
+            if page != previous_page + 1:
+                jumps += 1
+        previous_name, previous_page = name, page
+    return round(jumps / transitions, 4) if transitions else 0.0
+
+
+def file_stats(conn, db_name=None, detailed=False):
+    """Return size, page and free-list figures for the database file
+
+    ``detailed`` adds fragmentation, which reads every page through
+    dbstat; only ask for it under a progress handler or offline.
+    """
+    path = db_name or database.DB_NAME
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    try:
+        wal_bytes = os.path.getsize(path + '-wal')
+    except OSError:
+        wal_bytes = 0
+    stats = {
+        'size_bytes': os.path.getsize(path),
+        'wal_bytes': wal_bytes,
+        'page_size': page_size,
+        'page_count': page_count,
+        'freelist_pages': freelist,
+        'free_bytes': freelist * page_size,
+        'free_ratio': round(freelist / page_count, 4) if page_count else 0.0,
+        'auto_vacuum': {0: 'none', 1: 'full', 2: 'incremental'}.get(
+            auto_vacuum, str(auto_vacuum)
+        ),
+        'fragmentation': None
+    }
+    if detailed:
+        try:
+            stats['fragmentation'] = fragmentation(conn)
+        except sqlite3.OperationalError as e:
+            if not _interrupted(e):
+                raise
+    return stats
+
+
+# ============== Tasks ==============
+
+def _analyze(conn, budget):
+    conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+    analyzed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+    ).fetchone()
+    if analyzed:
+        # 0x10002: consider every table, not only ones this connection used
+        conn.execute('PRAGMA optimize(0x10002)').fetchall()
+        return {'statement': 'PRAGMA optimize'}
+    conn.execute('ANALYZE')
+    conn.commit()
+    return {'statement': 'ANALYZE'}
+
+
+def _vacuum(conn, budget):
+    result = {'conversion_needed': False, 'pages_freed': 0, 'chunks': 0}
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        # A full VACUUM would be interrupted by the budget every time
+        logger.warning('Database is not in auto_vacuum = INCREMENTAL; '
+                       'run "python manage.py maintenance --convert"')
+        result['conversion_needed'] = True
+        return result
+
+    while not budget.expired():
+        before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if before == 0:
+            break
+        # execute() stops after the first page; executescript() steps the
+        # pragma to completion
+        conn.executescript(
+            f'PRAGMA incremental_vacuum({VACUUM_CHUNK_PAGES})'
+        )
+        after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        result['pages_freed'] += before - after
+        result['chunks'] += 1
+        if after >= before:
+            break
+    return result
+
+
+def _integrity(conn, budget):
+    messages = [row[0] for row in conn.execute('PRAGMA quick_check')]
+    return {'ok': messages == ['ok'], 'messages': messages[:20]}
+
+
+_TASK_FUNCTIONS = {
+    'analyze': _analyze,
+    'vacuum': _vacuum,
+    'integrity': _integrity
+}
+
+
+# ============== Runs ==============
+
+def runs_db_path(db_name=None):
+    """Path of the run log (next to the maintained database)"""
+    if RUNS_DB_NAME:
+        return RUNS_DB_NAME
+    return os.path.join(os.path.dirname(db_name or database.DB_NAME),
+                        'maintenance.db')
+
+
+def _runs_connection(db_name=None):
+    conn = database.connect(runs_db_path(db_name), timeout=10)
+    conn.isolation_level = None
+    return conn
+
+
+def install(db_name=None):
+    """Create the run log; move runs out of the maintained database once"""
+    path = db_name or database.DB_NAME
+    conn = _runs_connection(path)
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS maintenance_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TIMESTAMP NOT NULL,
+                finished_at TIMESTAMP,
+                report TEXT
+            )
+        ''')
+
+        # Databases from before the split kept the log in products.db
+        conn.execute('ATTACH DATABASE ? AS products', (path,))
+        legacy = conn.execute(
+            "SELECT 1 FROM products.sqlite_master "
+            "WHERE type = 'table' AND name = 'maintenance_runs'"
+        ).fetchone()
+        if legacy:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''
+                INSERT INTO main.maintenance_runs
+                (started_at, finished_at, report)
+                SELECT started_at, finished_at, report
+                FROM products.maintenance_runs ORDER BY id
+            ''')
+            conn.execute('DROP TABLE products.maintenance_runs')
+            conn.execute('COMMIT')
+        conn.execute('DETACH DATABASE products')
+    finally:
+        conn.close()
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _claim(conn, min_interval=None):
+    """Record the start of a run unless one is running or ran recently
+
+    Runs inside BEGIN IMMEDIATE so two processes cannot both claim.
+    Returns the run id, or None when the run is not due.
+    """
+    now = _now()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        last = conn.execute(
+            'SELECT started_at, finished_at FROM maintenance_runs '
+            'ORDER BY id DESC LIMIT 1'
+        ).fetchone()
+        if last:
+            started = datetime.fromisoformat(last[0])
+            if last[1] is None and now - started < STALE_CLAIM:
+                raise MaintenanceInProgress('Maintenance is already running')
+            if min_interval is not None and now - started < min_interval:
+                conn.rollback()
+                return None
+        cursor = conn.execute(
+            'INSERT INTO maintenance_runs (started_at) VALUES (?)',
+            (now.isoformat(),)
+        )
+        conn.commit()
+        return cursor.lastrowid
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def run(budget_seconds=30.0, tasks=TASKS, db_name=None, min_interval=None):
+    """Run maintenance tasks within a time budget and return the report
+
+    With ``min_interval`` (a timedelta) nothing is done, and None is
+    returned, when the last run started less than that long ago.
+    """
+    for task in tasks:
+        if task not in _TASK_FUNCTIONS:
+            raise ValueError(f'Unknown maintenance task: {task}')
+
+    path = db_name or database.DB_NAME
+    runs = _runs_connection(path)
+    conn = None
+    try:
+        run_id = _claim(runs, min_interval)
+        if run_id is None:
+            return None
+        conn = database.connect(path, timeout=10)
+        conn.isolation_level = None
+
+        started = time.perf_counter()
+        budget = _Budget(budget_seconds)
+        conn.set_progress_handler(budget.expired, 10000)
+        report = {
+            'id': run_id,
+            'started_at': _now().isoformat(),
+            'budget_seconds': budget_seconds,
+            'before': file_stats(conn, path, detailed=True),
+            'tasks': []
+        }
+        try:
+            for task in tasks:
+                entry = {'name': task}
+                task_started = time.perf_counter()
+                if budget.expired():
+                    entry['status'] = 'skipped'
+                else:
+                    try:
+                        entry.update(_TASK_FUNCTIONS[task](conn, budget))
+                        entry['status'] = 'ok'
+                    except sqlite3.OperationalError as e:
+                        if not _interrupted(e):
+                            raise
+                        entry['status'] = 'timeout'
+                    if conn.in_transaction:
+                        conn.rollback()
+                entry['seconds'] = round(time.perf_counter() - task_started, 3)
+                report['tasks'].append(entry)
+            report['after'] = file_stats(conn, path, detailed=True)
+        finally:
+            conn.set_progress_handler(None, 0)
+
+        report['duration_seconds'] = round(time.perf_counter() - started, 3)
+        integrity = [entry for entry in report['tasks']
+                     if entry['name'] == 'integrity' and
+                     entry['status'] == 'ok']
+        if integrity and not integrity[0]['ok']:
+            logger.error('Database integrity check failed: %s',
+                         integrity[0]['messages'])
+
+        runs.execute(
+            'UPDATE maintenance_runs SET finished_at = ?, report = ? '
+            'WHERE id = ?',
+            (_now().isoformat(), json.dumps(report), run_id)
+        )
+        runs.execute(
+            'DELETE FROM maintenance_runs WHERE id <= ?',
+            (run_id - KEEP_RUNS,)
+        )
+        return report
+    finally:
+        if conn is not None:
+            conn.close()
+        runs.close()
+
+
+def convert(db_name=None):
+    """Switch the database to auto_vacuum = INCREMENTAL with a full VACUUM
+
+    Has no time budget and holds an exclusive lock while it rewrites the
+    file, so run it offline.  Claims a maintenance run first so the
+    scheduler does not start one meanwhile.
+    """
+    path = db_name or database.DB_NAME
+    runs = _runs_connection(path)
+    conn = None
+    try:
+        run_id = _claim(runs)
+        conn = database.connect(path, timeout=10)
+        conn.isolation_level = None
+        started = time.perf_counter()
+        report = {
+            'id': run_id,
+            'started_at': _now().isoformat(),
+            'before': file_stats(conn, path, detailed=True),
+            'converted': False
+        }
+        try:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                # Switching from NONE only takes effect through a full VACUUM
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+                report['converted'] = True
+        finally:
+            report['after'] = file_stats(conn, path, detailed=True)
+            report['duration_seconds'] = round(
+                time.perf_counter() - started, 3
+            )
+            runs.execute(
+                'UPDATE maintenance_runs SET finished_at = ?, report = ? '
+                'WHERE id = ?',
+                (_now().isoformat(), json.dumps(report), run_id)
+            )
+        return report
+    finally:
+        if conn is not None:
+            conn.close()
+        runs.close()
+
+
+def recent_runs(limit=10, db_name=None):
+    """Return the reports of the latest runs, newest first"""
+    conn = _runs_connection(db_name)
+    try:
+        runs = conn.execute(
+            'SELECT id, started_at, finished_at, report '
+            'FROM maintenance_runs ORDER BY id DESC LIMIT ?', (limit,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [json.loads(report) if report else
+            {'id': run_id, 'started_at': started_at, 'finished_at': None}
+            for run_id, started_at, finished_at, report in runs]
+
+
+# ============== Scheduler ==============
+
+class MaintenanceScheduler:
+    """Runs maintenance once per interval while this process is quiet"""
+
+    def __init__(self, interval_hours=24, quiet_seconds=300,
+                 budget_seconds=30.0, check_seconds=60):
+        self.interval = timedelta(hours=interval_hours)
+        self.quiet_seconds = quiet_seconds
+        self.budget_seconds = budget_seconds
+        self.check_seconds = check_seconds
+        self.last_report = None
+        self._last_activity = time.monotonic()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def touch(self):
+        """Note request activity; starts the thread in this process"""
+        self._last_activity = time.monotonic()
+        # Threads do not survive fork, so each worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='db-maintenance', daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def quiet(self):
+        return time.monotonic() - self._last_activity >= self.quiet_seconds
+
+    def _run(self):
+        while True:
+            time.sleep(self.check_seconds)
+            if not self.quiet():
+                continue
+            try:
+                report = run(self.budget_seconds,
+                             min_interval=self.interval)
+            except MaintenanceInProgress:
+                continue
+            except Exception:
+                logger.exception('Database maintenance failed')
+                continue
+            if report is not None:
+                self.last_report = report
+                logger.info('Database maintenance finished in %.1f s',
+                            report['duration_seconds'])
@@ -0,0 +1,168 @@
+"""Compile the print_settings row into a content-hashed stylesheet.
+
+Cards on the print page only carry class names; their colours, sizes,
+border and logo placement come from CSS custom properties on the
+``.labels`` container.  This module renders those properties (plus the
+``@page`` size) from the saved settings, so the browser can cache the
+result forever under its hash.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+# Page size definitions (in cm), kept in sync with main.js
+PAGE_SIZES = {
+    'A4': (21, 29.7),
+    'A5': (14.8, 21),
+    'Letter': (21.59, 27.94)
+}
+
+LOGO_MARGIN = '1cm'
+
+# Logo offsets per position; left/right are mirrored for the RTL layout
+LOGO_POSITIONS = {
+    'top-left': {'top': LOGO_MARGIN, 'right': LOGO_MARGIN},
+    'top-center': {'top': LOGO_MARGIN, 'left': '50%',
+                   'transform': 'translateX(-50%)'},
+    'top-right': {'top': LOGO_MARGIN, 'left': LOGO_MARGIN},
+    'center-left': {'top': '50%', 'right': LOGO_MARGIN,
+                    'transform': 'translateY(-50%)'},
+    'center': {'top': '50%', 'left': '50%',
+               'transform': 'translate(-50%, -50%)'},
+    'center-right': {'top': '50%', 'left': LOGO_MARGIN,
+                     'transform': 'translateY(-50%)'},
+    'bottom-left': {'bottom': LOGO_MARGIN, 'right': LOGO_MARGIN},
+    'bottom-center': {'bottom': LOGO_MARGIN, 'left': '50%',
+                      'transform': 'translateX(-50%)'},
+    'bottom-right': {'bottom': LOGO_MARGIN, 'left': LOGO_MARGIN}
+}
+
+COLOR_PATTERN = re.compile(r'^#[0-9a-fA-F]{3,8}$')
+MAX_CACHED_STYLESHEETS = 32
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _color(value, default):
+    """Return a safe CSS hex colour"""
+    if isinstance(value, str) and COLOR_PATTERN.match(value):
+        return value
+    return default
+
+
+def _number(value, default):
+    """Return a positive number, falling back like the JS `||` defaults"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    return number if number > 0 else default
+
+
+def _fmt(number):
+    """Format a number without a trailing .0, as JavaScript does"""
+    return '%g' % number
+
+
+def page_dimensions(settings):
+    """Return the (width, height) of the page in cm"""
+    page_size = settings.get('page_size')
+    if page_size == 'Custom':
+        return (_number(settings.get('custom_width'), 21),
+                _number(settings.get('custom_height'), 29.7))
+    return PAGE_SIZES.get(page_size, PAGE_SIZES['A4'])
+
+
+def card_variables(settings):
+    """Return the CSS custom properties that style the cards"""
+    width, height = page_dimensions(settings)
+    font_size = int(_number(settings.get('font_size'), 28))
+    font_color = _color(settings.get('font_color'), '#ffffff')
+
+    if settings.get('border_enabled'):
+        border = '%spx solid %s' % (
+            _fmt(_number(settings.get('border_width'), 2)),
+            _color(settings.get('border_color'), '#ffffff')
+        )
+    else:
+        border = 'none'
+
+    if settings.get('card_mode') == 'full':
+        columns = rows = '1fr'
+    else:
+        columns = 'repeat(2, %s%%)' % _fmt(
+            _number(settings.get('card_width'), 50))
+        rows = 'repeat(2, %s%%)' % _fmt(
+            _number(settings.get('card_height'), 50))
+
+    logo = LOGO_POSITIONS.get(settings.get('logo_position'), {})
+
+    return OrderedDict([
+        ('--page-width', '%scm' % _fmt(width)),
+        ('--page-height', '%scm' % _fmt(height)),
+        ('--card-columns', columns),
+        ('--card-rows', rows),
+        ('--card-color-start',
+         _color(settings.get('card_color_start'), '#1e3c72')),
+        ('--card-color-end',
+         _color(settings.get('card_color_end'), '#2a5298')),
+        ('--card-font-color', font_color),
+        ('--card-border', border),
+        ('--card-name-size', '%dpx' % font_size),
+        ('--card-specs-size', '%dpx' % int(font_size * 0.6 + 0.5)),
+        ('--card-price-size', '%dpx' % int(font_size * 1.4 + 0.5)),
+        ('--card-logo-size',
+         '%spx' % _fmt(_number(settings.get('logo_size'), 100))),
+        ('--logo-top', logo.get('top', 'auto')),
+        ('--logo-right', logo.get('right', 'auto')),
+        ('--logo-bottom', logo.get('bottom', 'auto')),
+        ('--logo-left', logo.get('left', 'auto')),
+        ('--logo-transform', logo.get('transform', 'none'))
+    ])
+
+
+def compile_stylesheet(settings):
+    """Render the stylesheet for a print_settings row"""
+    variables = card_variables(settings)
+    width, height = page_dimensions(settings)
+    declarations = '\n'.join(
+        '  %s: %s;' % (name, value) for name, value in variables.items()
+    )
+    return (
+        '/* Generated from print_settings. Do not edit. */\n'
+        '.labels {\n%s\n}\n\n'
+        '@page {\n  size: %scm %scm;\n  margin: 0;\n}\n\n'
+        '@media print {\n'
+        '  html, body {\n'
+        '    width: %scm !important;\n'
+        '    height: %scm !important;\n'
+        '  }\n'
+        '}\n'
+    ) % (declarations, _fmt(width), _fmt(height), _fmt(width), _fmt(height))
+
+
+def stylesheet_for(settings):
+    """Return (digest, css) for the settings, compiling only on change"""
+    key = tuple(card_variables(settings).items())
+    with _lock:
+        for digest, (cached_key, css) in _cache.items():
+            if cached_key == key:
+                _cache.move_to_end(digest)
+                return digest, css
+
+    css = compile_stylesheet(settings)
+    digest = hashlib.sha256(css.encode('utf-8')).hexdigest()[:16]
+    with _lock:
+        _cache[digest] = (key, css)
+        while len(_cache) > MAX_CACHED_STYLESHEETS:
+            _cache.popitem(last=False)
+    return digest, css
+
+
+def get_stylesheet(digest):
+    """Return a previously compiled stylesheet by digest, or None"""
+    with _lock:
+        entry = _cache.get(digest)
+    return entry[1] if entry else None
@@ -0,0 +1,338 @@
+"""On-demand request profiling with a bounded on-disk profile store.
+
+A request is profiled when an admin asks for it (``X-Profile: 1`` header
+or ``?_profile=1``; ``memory`` instead of ``1`` also traces allocations)
+or when it is picked at the configured sampling rate.  Profiled requests
+run under cProfile, and every SQL statement on connections opened through
+:func:`database.connect` is timed, including the time spent fetching its
+rows.
+
+With a slow threshold set, every request is timed and its SQL recorded;
+requests slower than the threshold are saved even when they were not
+profiled, so there is always something to look at after a slow response.
+
+Each profile is saved as ``<id>.json`` (request, timings, SQL, top
+functions) plus ``<id>.prof`` (pstats, for snakeviz or ``pstats``).  Only
+the newest ``max_profiles`` are kept.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import sqlite3
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+import database
+
+PROFILE_ID_RE = re.compile(r'^\d{8}-\d{6}-[0-9a-f]{8}$')
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 20
+MAX_SQL_LENGTH = 1000
+
+_state = threading.local()
+_memory_lock = threading.Lock()
+_memory_users = 0
+
+
+# ============== SQL timing ==============
+
+class _Trace:
+    """SQL statements run by one request, aggregated by statement text"""
+
+    def __init__(self):
+        self.statements = {}
+
+    def add(self, sql, seconds):
+        entry = self.statements.get(sql)
+        if entry is None:
+            entry = self.statements[sql] = {
+                'sql': ' '.join(sql.split()),
+                'count': 0,
+                'seconds': 0.0,
+                'max_seconds': 0.0
+            }
+        entry['count'] += 1
+        entry['seconds'] += seconds
+        entry['max_seconds'] = max(entry['max_seconds'], seconds)
+        return entry
+
+    def report(self):
+        entries = sorted(self.statements.values(),
+                         key=lambda entry: entry['seconds'], reverse=True)
+        return [{
+            'sql': entry['sql'][:MAX_SQL_LENGTH],
+            'count': entry['count'],
+            'total_ms': round(entry['seconds'] * 1000, 3),
+            'max_ms': round(entry['max_seconds'] * 1000, 3)
+        } for entry in entries]
+
+    def total_seconds(self):
+        return sum(entry['seconds'] for entry in self.statements.values())
+
+
+def _record(sql, seconds):
+    trace = getattr(_state, 'trace', None)
+    if trace is None:
+        return None
+    return trace.add(sql, seconds)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that adds execute and fetch time to the request's trace"""
+
+    _entry = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._entry = _record(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._entry = _record(sql, time.perf_counter() - start)
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._entry is not None:
+                self._entry['seconds'] += time.perf_counter() - start
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def __next__(self):
+        return self._fetch(super().__next__)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors record SQL timings"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_class():
+    """database.connection_factory hook: time SQL only while tracing"""
+    if getattr(_state, 'trace', None) is not None:
+        return TimedConnection
+    return None
+
+
+# ============== Profiler ==============
+
+class _RequestProfile:
+    """State for one request being timed or profiled"""
+
+    def __init__(self, reason, memory):
+        self.reason = reason
+        self.memory = memory
+        self.trace = _Trace()
+        self.profile = None
+        self.snapshot = None
+        self.started = None
+
+
+def _start_memory():
+    global _memory_users
+    # tracemalloc is process-wide: overlapping requests share the tracing
+    with _memory_lock:
+        if _memory_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _memory_users += 1
+    return tracemalloc.take_snapshot()
+
+
+def _stop_memory(before):
+    global _memory_users
+    after = tracemalloc.take_snapshot()
+    with _memory_lock:
+        _memory_users -= 1
+        if _memory_users == 0:
+            tracemalloc.stop()
+    return [str(stat) for stat in
+            after.compare_to(before, 'lineno')[:TOP_ALLOCATIONS]]
+
+
+class Profiler:
+    """Decides which requests to profile and stores the results"""
+
+    def __init__(self, directory, sample_rate=0.0, slow_ms=0,
+                 max_profiles=200):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.max_profiles = max_profiles
+        self.saved = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        database.connection_factory = connection_class
+
+    def start(self, requested=False, memory=False):
+        """Begin timing the current request; return its state or None"""
+        if requested:
+            reason = 'requested'
+        elif self.sample_rate and random.random() < self.sample_rate:
+            reason = 'sampled'
+        else:
+            reason = None
+        if reason is None and not self.slow_ms:
+            return None
+
+        request_profile = _RequestProfile(reason, memory and requested)
+        _state.trace = request_profile.trace
+        if request_profile.memory:
+            request_profile.snapshot = _start_memory()
+        if reason:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                request_profile.profile = profile
+            except ValueError:
+                # Another profiler is active on this interpreter
+                pass
+        request_profile.started = time.perf_counter()
+        return request_profile
+
+    def cancel(self, request_profile):
+        """Stop timing without saving anything"""
+        if request_profile.profile is not None:
+            request_profile.profile.disable()
+        if request_profile.snapshot is not None:
+            _stop_memory(request_profile.snapshot)
+        _state.trace = None
+
+    def finish(self, request_profile, info):
+        """Stop timing; save and return a profile id when one is due"""
+        duration = time.perf_counter() - request_profile.started
+        profile = request_profile.profile
+        if profile is not None:
+            profile.disable()
+        allocations = None
+        if request_profile.snapshot is not None:
+            allocations = _stop_memory(request_profile.snapshot)
+        _state.trace = None
+
+        duration_ms = duration * 1000
+        reason = request_profile.reason
+        if reason is None:
+            if duration_ms < self.slow_ms:
+                return None
+            reason = 'slow'
+
+        profile_id = '%s-%s' % (time.strftime('%Y%m%d-%H%M%S'),
+                                uuid.uuid4().hex[:8])
+        record = dict(info)
+        record.update({
+            'id': profile_id,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'reason': reason,
+            'slow': bool(self.slow_ms) and duration_ms >= self.slow_ms,
+            'duration_ms': round(duration_ms, 3),
+            'sql_ms': round(request_profile.trace.total_seconds() * 1000, 3),
+            'sql': request_profile.trace.report(),
+            'functions': None,
+            'allocations': allocations,
+            'has_pstats': profile is not None
+        })
+        if profile is not None:
+            stream = io.StringIO()
+            stats = pstats.Stats(profile, stream=stream)
+            stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+            record['functions'] = stream.getvalue()
+            profile.dump_stats(self._path(profile_id, '.prof'))
+
+        with open(self._path(profile_id, '.json'), 'w',
+                  encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        with self._lock:
+            self.saved += 1
+        self.prune()
+        return profile_id
+
+    def _path(self, profile_id, suffix):
+        return os.path.join(self.directory, profile_id + suffix)
+
+    def _ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((name[:-5] for name in names
+                       if name.endswith('.json')), reverse=True)
+
+    def prune(self):
+        """Delete the oldest profiles beyond the limit"""
+        removed = 0
+        for profile_id in self._ids()[self.max_profiles:]:
+            for suffix in ('.json', '.prof'):
+                try:
+                    os.remove(self._path(profile_id, suffix))
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        return removed
+
+    def list_profiles(self):
+        """Return a summary of the stored profiles, newest first"""
+        profiles = []
+        for profile_id in self._ids():
+            record = self.load(profile_id)
+            if record is None:
+                continue
+            for key in ('sql', 'functions', 'allocations'):
+                record.pop(key, None)
+            profiles.append(record)
+        return profiles
+
+    def load(self, profile_id):
+        """Return a stored profile, or None"""
+        if not PROFILE_ID_RE.match(profile_id):
+            return None
+        try:
+            with open(self._path(profile_id, '.json'),
+                      encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def pstats_filename(self, profile_id):
+        """Return the .prof file name for a profile, or None"""
+        if not PROFILE_ID_RE.match(profile_id) or \
+                not os.path.exists(self._path(profile_id, '.prof')):
+            return None
+        return profile_id + '.prof'
+
+    def stats(self):
+        return {
+            'sample_rate': self.sample_rate,
+            'slow_ms': self.slow_ms,
+            'max_profiles': self.max_profiles,
+            'stored': len(self._ids()),
+            'saved': self.saved
+        }
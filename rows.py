@@ -0,0 +1,96 @@
+"""Lean row handling for read-heavy list endpoints.
+
+Building ``dict(row)`` for every ``sqlite3.Row`` and then serializing the
+dicts allocates each value several times.  For list endpoints SQLite can
+emit each row as a JSON object itself (``json_object``); Python then only
+sees one string per row, fetched as a plain tuple, and joins them into the
+response body.  Keys are sorted so the output matches ``jsonify``.
+"""
+import threading
+
+# Entries for superseded schemas are never hit again; start over when the
+# cache grows past this many
+_COLUMNS_CACHE_MAX = 256
+_columns_cache = {}
+_columns_lock = threading.Lock()
+
+
+def _quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def _json_value(name):
+    """SQL expression rendering a column as a JSON value
+
+    SQLite prints REAL values with 15 significant digits, which does not
+    always round-trip; use 17 digits only when 15 would lose precision.
+    """
+    col = _quote(name)
+    return (
+        f"CASE typeof({col}) WHEN 'real' THEN json("
+        f"CASE WHEN CAST(printf('%!.15g', {col}) AS REAL) = {col} "
+        f"THEN printf('%!.15g', {col}) ELSE printf('%!.17g', {col}) END"
+        f") ELSE {col} END"
+    )
+
+
+def _schema_key(conn):
+    """The file and schema version of every database open on ``conn``
+
+    ``schema_version`` changes with every ALTER/CREATE/DROP, so a query's
+    cached columns are not reused after a migration.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    key = []
+    for _, name, path in cursor.execute('PRAGMA database_list').fetchall():
+        version = cursor.execute(
+            f'PRAGMA {_quote(name)}.schema_version'
+        ).fetchone()[0]
+        key.append((path, version))
+    cursor.close()
+    return tuple(key)
+
+
+def result_columns(conn, sql, params=()):
+    """Return the column names a query produces, without running it"""
+    key = (sql, _schema_key(conn))
+    with _columns_lock:
+        names = _columns_cache.get(key)
+    if names is None:
+        cursor = conn.execute(f'SELECT * FROM ({sql}) LIMIT 0', params)
+        names = tuple(column[0] for column in cursor.description)
+        cursor.close()
+        with _columns_lock:
+            if len(_columns_cache) >= _COLUMNS_CACHE_MAX:
+                _columns_cache.clear()
+            _columns_cache[key] = names
+    return names
+
+
+def json_objects(conn, sql, params=(), order_by=None):
+    """Run a query and return its rows as a list of JSON object texts
+
+    ``order_by`` is applied to the outer query; ``sql`` itself should not
+    be ordered, since SQLite does not promise to keep a subquery's order.
+    """
+    names = sorted(result_columns(conn, sql, params))
+    pairs = ', '.join(
+        "'%s', %s" % (name.replace("'", "''"), _json_value(name))
+        for name in names
+    )
+    query = f'SELECT json_object({pairs}) FROM ({sql})'
+    if order_by:
+        query += f' ORDER BY {order_by}'
+
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(query, params)
+    objects = [row for (row,) in cursor]
+    cursor.close()
+    return objects
+
+
+def json_array(conn, sql, params=(), order_by=None):
+    """Run a query and return its rows as a JSON array of objects (text)"""
+    return '[' + ','.join(json_objects(conn, sql, params, order_by)) + ']'
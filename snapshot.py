@@ -0,0 +1,207 @@
+"""In-memory read snapshot of the products database.
+
+When enabled, each worker process keeps a copy of products.db in a
+shared-cache ``:memory:`` database loaded with the SQLite backup API, and
+read-only routes query that copy instead of the file on disk.  A watcher
+connection checks ``PRAGMA data_version`` before handing out a connection.
+Once another connection has committed, reads go to the file until a
+background thread has reloaded the copy; reloads start at most once per
+``min_interval`` seconds, so a burst of writes costs one copy, and no
+request ever waits for one.
+"""
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+import database
+
+_generation = itertools.count(1)
+_snapshot = None
+
+
+class ReadSnapshot:
+    """Per-process in-memory copy of the database used for reads"""
+
+    def __init__(self, db_name=None, max_bytes=64 * 1024 * 1024,
+                 pages=256, min_interval=2.0):
+        self.db_name = db_name or database.DB_NAME
+        self.max_bytes = max_bytes
+        self.pages = pages
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._watcher = None
+        self._holder = None
+        self._uri = None
+        self._data_version = None
+        self._loading = False
+        self._next_load = 0.0
+        self.size_bytes = 0
+        self.disk_bytes = 0
+        self.loads = 0
+        self.hits = 0
+        self.fallbacks = 0
+        self.last_load_seconds = 0.0
+        self.last_loaded_at = None
+
+    def _reset(self):
+        """Drop connections inherited from a parent process"""
+        self._pid = os.getpid()
+        self._watcher = sqlite3.connect(self.db_name,
+                                        check_same_thread=False)
+        self._holder = None
+        self._uri = None
+        self._data_version = None
+        # The parent's loader thread did not survive the fork
+        self._loading = False
+        self._next_load = 0.0
+
+    def _schedule_load(self):
+        """Start a background reload unless one is running; needs the lock"""
+        if self._loading:
+            return
+        self._loading = True
+        delay = max(0.0, self._next_load - time.monotonic())
+        threading.Thread(target=self._load, args=(delay,),
+                         name='read-snapshot', daemon=True).start()
+
+    def _load(self, delay):
+        """Copy the on-disk database into a fresh memory database"""
+        try:
+            if delay:
+                time.sleep(delay)
+            with self._lock:
+                self._next_load = time.monotonic() + self.min_interval
+                # Read before copying: a commit during the copy leaves the
+                # version behind, so the next check reloads again
+                version = self._watcher.execute(
+                    'PRAGMA data_version'
+                ).fetchone()[0]
+            disk_bytes = os.path.getsize(self.db_name)
+
+            # Skip the copy entirely when the file is already too large
+            target = None
+            size = 0
+            start = time.perf_counter()
+            if disk_bytes <= self.max_bytes:
+                uri = (f'file:zt_snapshot_{self._pid}_{next(_generation)}'
+                       '?mode=memory&cache=shared')
+                target = sqlite3.connect(uri, uri=True,
+                                         check_same_thread=False)
+                source = sqlite3.connect(self.db_name)
+                try:
+                    source.backup(target, pages=self.pages)
+                finally:
+                    source.close()
+                page_count = target.execute(
+                    'PRAGMA page_count'
+                ).fetchone()[0]
+                page_size = target.execute('PRAGMA page_size').fetchone()[0]
+                size = page_count * page_size
+                if size > self.max_bytes:
+                    target.close()
+                    target = None
+
+            with self._lock:
+                self._data_version = version
+                self.disk_bytes = disk_bytes
+                if target is None:
+                    self._drop()
+                    self.size_bytes = size
+                    return
+                old_holder = self._holder
+                self._holder = target
+                self._uri = uri
+                self.size_bytes = size
+                self.loads += 1
+                self.last_load_seconds = time.perf_counter() - start
+                self.last_loaded_at = time.time()
+
+                # Readers still using the old snapshot keep it alive until
+                # they close
+                if old_holder is not None:
+                    old_holder.close()
+        finally:
+            with self._lock:
+                self._loading = False
+
+    def _drop(self):
+        """Release the memory copy so reads fall back to disk"""
+        if self._holder is not None:
+            self._holder.close()
+        self._holder = None
+        self._uri = None
+        self.size_bytes = 0
+
+    def connect(self):
+        """Return a read-only snapshot connection, or None to use disk"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+
+            version = self._watcher.execute(
+                'PRAGMA data_version'
+            ).fetchone()[0]
+            if version != self._data_version:
+                # The copy is behind the file: read the file meanwhile
+                self._schedule_load()
+                self.fallbacks += 1
+                return None
+
+            if self._uri is None:
+                self.fallbacks += 1
+                return None
+
+            # Connect under the lock so a concurrent reload cannot free
+            # the memory database between the check and the connect
+            conn = database.connect(self._uri, uri=True)
+            self.hits += 1
+
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def stats(self):
+        """Return memory accounting and usage counters"""
+        with self._lock:
+            return {
+                'enabled': True,
+                'active': self._uri is not None,
+                'size_bytes': self.size_bytes,
+                'disk_bytes': self.disk_bytes,
+                'max_bytes': self.max_bytes,
+                'loads': self.loads,
+                'hits': self.hits,
+                'fallbacks': self.fallbacks,
+                'last_load_seconds': round(self.last_load_seconds, 6),
+                'last_loaded_at': self.last_loaded_at,
+                'data_version': self._data_version,
+                'loading': self._loading,
+                'min_interval': self.min_interval,
+                'pid': self._pid
+            }
+
+
+def enable(max_bytes, db_name=None, min_interval=2.0):
+    """Serve reads in this process from an in-memory snapshot"""
+    global _snapshot
+    _snapshot = ReadSnapshot(db_name, max_bytes, min_interval=min_interval)
+    return _snapshot
+
+
+def get_read_connection():
+    """Return a connection for read-only queries"""
+    if _snapshot is not None:
+        conn = _snapshot.connect()
+        if conn is not None:
+            return conn
+    return database.get_db_connection()
+
+
+def stats():
+    """Return snapshot statistics for this worker"""
+    if _snapshot is None:
+        return {'enabled': False}
+    return _snapshot.stats()
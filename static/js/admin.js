@@ -11,6 +11,9 @@ let users = [];
 let filteredUsers = [];
 let logos = [];
 
+// Products selected for bulk actions (by code)
+const selectedProducts = new Set();
+
 // Edit states
 let editingProduct = null;
 let editingCategory = null;
@@ -49,17 +52,29 @@ function initTabs() {
 
 // ============== Data Loading ==============
 
+// Everything the page needs comes from one request and one consistent
+// read on the server; the load* functions below refresh single lists
 async function loadAllData() {
     showLoading(true);
     try {
-        await Promise.all([
-            loadProducts(),
-            loadCategories(),
-            loadUsers(),
-            loadLogos()
-        ]);
+        const response = await fetch(`${API_BASE_URL}/bootstrap?view=admin`);
+        if (response.status === 401) {
+            window.location.href = '/login';
+            return;
+        }
+        const data = response.ok ? await response.json() : null;
+        if (!data || !['products', 'categories', 'users', 'logos']
+                .every(key => Array.isArray(data[key]))) {
+            throw new Error(`bootstrap failed (${response.status})`);
+        }
+        setProducts(data.products);
+        setCategories(data.categories);
+        setUsers(data.users);
+        setLogos(data.logos);
     } catch (error) {
+        // Fall back to one request per list
         console.error('Error loading data:', error);
+        await Promise.all([loadProducts(), loadCategories(), loadUsers(), loadLogos()]);
     } finally {
         showLoading(false);
     }
@@ -72,53 +87,71 @@ async function loadProducts() {
             window.location.href = '/login';
             return;
         }
-        products = await response.json();
-        filteredProducts = [...products];
-        pagination.products.total = filteredProducts.length;
-        pagination.products.page = 1;
-        renderProductsTable();
+        setProducts(await response.json());
     } catch (error) {
         console.error('Error loading products:', error);
     }
 }
 
+function setProducts(data) {
+    products = data;
+    selectedProducts.clear();
+    updateSelectedProductsUI();
+    filteredProducts = [...products];
+    pagination.products.total = filteredProducts.length;
+    pagination.products.page = 1;
+    renderProductsTable();
+}
+
 async function loadCategories() {
     try {
-        const response = await fetch(`${API_BASE_URL}/categories`);
-        categories = await response.json();
-        filteredCategories = [...categories];
-        pagination.categories.total = filteredCategories.length;
-        pagination.categories.page = 1;
-        renderCategoriesTable();
-        updateCategoryDropdowns();
+        const response = await fetch(`${API_BASE_URL}/categories?with_stats=1`);
+        setCategories(await response.json());
     } catch (error) {
         console.error('Error loading categories:', error);
     }
 }
 
+function setCategories(data) {
+    categories = data;
+    filteredCategories = [...categories];
+    pagination.categories.total = filteredCategories.length;
+    pagination.categories.page = 1;
+    renderCategoriesTable();
+    updateCategoryDropdowns();
+}
+
 async function loadUsers() {
     try {
         const response = await fetch(`${API_BASE_URL}/users`);
-        users = await response.json();
-        filteredUsers = [...users];
-        pagination.users.total = filteredUsers.length;
-        pagination.users.page = 1;
-        renderUsersTable();
+        setUsers(await response.json());
     } catch (error) {
         console.error('Error loading users:', error);
     }
 }
 
+function setUsers(data) {
+    users = data;
+    filteredUsers = [...users];
+    pagination.users.total = filteredUsers.length;
+    pagination.users.page = 1;
+    renderUsersTable();
+}
+
 async function loadLogos() {
     try {
         const response = await fetch(`${API_BASE_URL}/logos`);
-        logos = await response.json();
-        renderLogosGrid();
+        setLogos(await response.json());
     } catch (error) {
         console.error('Error loading logos:', error);
     }
 }
 
+function setLogos(data) {
+    logos = data;
+    renderLogosGrid();
+}
+
 // ============== Pagination Functions ==============
 
 function getPaginatedData(data, paginationState) {
@@ -204,7 +237,7 @@ function renderProductsTable() {
     if (filteredProducts.length === 0) {
         tbody.innerHTML = `
             <tr>
-                <td colspan="6" class="text-center" style="padding: 3rem;">
+                <td colspan="7" class="text-center" style="padding: 3rem;">
                     <i class="bi bi-inbox" style="font-size: 3rem; opacity: 0.5;"></i>
                     <p>لا توجد منتجات</p>
                 </td>
@@ -216,6 +249,7 @@ function renderProductsTable() {
     
     tbody.innerHTML = paginatedData.map(p => `
         <tr>
+            <td><input type="checkbox" class="product-checkbox" ${selectedProducts.has(p.code) ? 'checked' : ''} onchange="toggleProductSelection('${p.code}', this.checked)"></td>
             <td><span class="code-badge">${escapeHtml(p.code)}</span></td>
             <td><strong>${escapeHtml(p.name)}</strong></td>
             <td style="max-width: 200px; overflow: hidden; text-overflow: ellipsis;">${escapeHtml(p.specs || '-')}</td>
@@ -233,6 +267,73 @@ function renderProductsTable() {
     `).join('');
     
     renderPagination('productsPagination', pagination.products, 'goToProductsPage');
+    updateSelectedProductsUI();
+}
+
+function toggleProductSelection(code, checked) {
+    if (checked) {
+        selectedProducts.add(code);
+    } else {
+        selectedProducts.delete(code);
+    }
+    updateSelectedProductsUI();
+}
+
+function toggleAllProducts(checked) {
+    getPaginatedData(filteredProducts, pagination.products).forEach(p => {
+        if (checked) {
+            selectedProducts.add(p.code);
+        } else {
+            selectedProducts.delete(p.code);
+        }
+    });
+    renderProductsTable();
+}
+
+function updateSelectedProductsUI() {
+    const count = document.getElementById('selectedProductsCount');
+    const button = document.getElementById('deleteSelectedBtn');
+    const selectAll = document.getElementById('selectAllProducts');
+    const pageData = getPaginatedData(filteredProducts, pagination.products);
+
+    if (count) count.textContent = selectedProducts.size;
+    if (button) button.disabled = selectedProducts.size === 0;
+    if (selectAll) {
+        selectAll.checked = pageData.length > 0 && pageData.every(p => selectedProducts.has(p.code));
+    }
+}
+
+// Deletes all selected products in one transactional /api/batch request
+async function deleteSelectedProducts() {
+    if (selectedProducts.size === 0) return;
+    if (!confirm(`هل أنت متأكد من حذف ${selectedProducts.size} منتج؟`)) return;
+
+    try {
+        showLoading(true);
+        const operations = [...selectedProducts].map(code => ({
+            entity: 'product',
+            op: 'delete',
+            code: code
+        }));
+        const response = await fetch(`${API_BASE_URL}/batch`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ operations })
+        });
+        const data = await response.json();
+
+        if (response.ok) {
+            showAlert(`تم حذف ${operations.length} منتج بنجاح`, 'success');
+            await Promise.all([loadProducts(), loadCategories()]);
+        } else {
+            const details = (data.errors || []).map(e => `${operations[e.index].code}: ${e.error}`).join('، ');
+            showAlert(details ? `${data.error} (${details})` : data.error, 'danger');
+        }
+    } catch (error) {
+        showAlert('حدث خطأ', 'danger');
+    } finally {
+        showLoading(false);
+    }
 }
 
 function openProductModal(product = null) {
@@ -273,7 +374,7 @@ async function deleteProduct(code) {
         
         if (response.ok) {
             showAlert('تم حذف المنتج بنجاح', 'success');
-            await loadProducts();
+            await Promise.all([loadProducts(), loadCategories()]);
         } else {
             showAlert(data.error, 'danger');
         }
@@ -323,7 +424,7 @@ function renderCategoriesTable() {
     if (filteredCategories.length === 0) {
         tbody.innerHTML = `
             <tr>
-                <td colspan="4" class="text-center" style="padding: 3rem;">
+                <td colspan="6" class="text-center" style="padding: 3rem;">
                     <i class="bi bi-folder" style="font-size: 3rem; opacity: 0.5;"></i>
                     <p>لا توجد فئات</p>
                 </td>
@@ -337,6 +438,8 @@ function renderCategoriesTable() {
         <tr>
             <td>${startIndex + i + 1}</td>
             <td><span class="category-badge">${escapeHtml(c.name)}</span></td>
+            <td>${c.product_count || 0}</td>
+            <td>${formatPriceRange(c)}</td>
             <td>${formatDate(c.created_at)}</td>
             <td class="actions-cell">
                 <button class="btn-modern btn-primary-custom btn-sm" onclick="editCategory(${c.id})">
@@ -687,7 +790,7 @@ function initForms() {
             if (response.ok) {
                 showAlert(editingProduct ? 'تم تحديث المنتج' : 'تم إضافة المنتج', 'success');
                 bootstrap.Modal.getInstance(document.getElementById('productModal')).hide();
-                await loadProducts();
+                await Promise.all([loadProducts(), loadCategories()]);
             } else {
                 showAlert(result.error, 'danger');
             }
@@ -831,6 +934,12 @@ function escapeHtml(text) {
     return div.innerHTML;
 }
 
+function formatPriceRange(category) {
+    if (!category.product_count) return '-';
+    if (category.price_min === category.price_max) return `${category.price_min} جنيه`;
+    return `${category.price_min} - ${category.price_max} جنيه`;
+}
+
 function formatDate(dateStr) {
     if (!dateStr) return '-';
     const date = new Date(dateStr);
@@ -21,97 +21,284 @@ let printSettings = {
     border_width: 2,
     card_mode: 'grid',
     card_width: 50,
-    card_height: 50
+    card_height: 50,
+    barcode_type: 'none'
 };
 
-// Page size definitions (in cm)
+// Print settings as last saved on the server (their CSS is in #printStylesheet)
+let savedSettings = { ...printSettings };
+
+// Page size definitions (in cm), kept in sync with print_styles.py
 const PAGE_SIZES = {
     'A4': { width: 21, height: 29.7 },
     'A5': { width: 14.8, height: 21 },
     'Letter': { width: 21.59, height: 27.94 }
 };
 
+// Logo offsets per position (left/right mirrored for RTL), see print_styles.py
+const LOGO_MARGIN = '1cm';
+const LOGO_POSITIONS = {
+    'top-left': { top: LOGO_MARGIN, right: LOGO_MARGIN },
+    'top-center': { top: LOGO_MARGIN, left: '50%', transform: 'translateX(-50%)' },
+    'top-right': { top: LOGO_MARGIN, left: LOGO_MARGIN },
+    'center-left': { top: '50%', right: LOGO_MARGIN, transform: 'translateY(-50%)' },
+    'center': { top: '50%', left: '50%', transform: 'translate(-50%, -50%)' },
+    'center-right': { top: '50%', left: LOGO_MARGIN, transform: 'translateY(-50%)' },
+    'bottom-left': { bottom: LOGO_MARGIN, right: LOGO_MARGIN },
+    'bottom-center': { bottom: LOGO_MARGIN, left: '50%', transform: 'translateX(-50%)' },
+    'bottom-right': { bottom: LOGO_MARGIN, left: LOGO_MARGIN }
+};
+
 // Initialize page
 document.addEventListener('DOMContentLoaded', async () => {
+    registerServiceWorker();
     await loadAllData();
     initProductSelects();
     initPrintConfig();
     initEventListeners();
+    watchCatalog();
 });
 
+function registerServiceWorker() {
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/sw.js').catch(error => {
+            console.error('Service worker registration failed:', error);
+        });
+    }
+}
+
 // ============== Data Loading ==============
 
+// Version of the local catalog copy ({ epoch, version }), null if none
+let catalogMeta = null;
+
+// Products, logos and print settings start from the copy in IndexedDB when
+// there is one; the server then only sends what changed since that version
 async function loadAllData() {
-    try {
-        await Promise.all([
-            loadProducts(),
-            loadLogos(),
-            loadPrintSettings()
-        ]);
-    } catch (error) {
-        console.error('Error loading data:', error);
-        if (error.status === 401) {
-            window.location.href = '/login';
+    const local = await readLocalCatalog();
+    if (local) {
+        applyLocalCatalog(local);
+        queueCatalogRefresh();
+        return;
+    }
+    await refreshCatalog();
+}
+
+// Catalog refreshes run one after another, so a pushed change never races the load
+let catalogRefresh = Promise.resolve();
+
+function queueCatalogRefresh() {
+    catalogRefresh = catalogRefresh
+        .then(() => refreshCatalog())
+        .then(changed => {
+            if (changed) refreshProductSelects();
+        });
+    return catalogRefresh;
+}
+
+// The ASGI server pushes the catalog version as it changes (/api/events)
+// and marks the page with data-catalog-events; under plain WSGI the route
+// does not exist, so the page keeps the version it loaded
+function watchCatalog() {
+    if (!('EventSource' in window) || !document.body.dataset.catalogEvents) return;
+    const events = new EventSource(`${API_BASE_URL}/events`);
+    events.addEventListener('catalog', event => {
+        const current = JSON.parse(event.data);
+        if (catalogMeta && current.epoch === catalogMeta.epoch &&
+            String(current.version) === String(catalogMeta.version)) {
+            return;
         }
+        queueCatalogRefresh();
+    });
+}
+
+function applyLocalCatalog(local) {
+    catalogMeta = local.meta;
+    products = local.products;
+    logos = local.logos;
+    populateLogoSelect();
+    if (local.printSettings) {
+        applyServerSettings(local.printSettings);
     }
 }
 
-async function loadProducts() {
+// Fetch the changes since the local version; returns true if anything changed
+async function refreshCatalog() {
+    const params = new URLSearchParams();
+    if (catalogMeta) {
+        params.set('since', catalogMeta.version);
+        params.set('epoch', catalogMeta.epoch);
+    }
+
+    let delta;
     try {
-        const response = await fetch(`${API_BASE_URL}/products`);
-        if (response.status === 401) {
+        params.set('view', 'print');
+        const response = await fetch(`${API_BASE_URL}/bootstrap?${params}`);
+        if (response.status === 401 || response.redirected) {
             window.location.href = '/login';
-            return;
+            return false;
         }
-        products = await response.json();
+        if (!response.ok) return false;
+        delta = (await response.json()).catalog;
     } catch (error) {
-        console.error('Error loading products:', error);
+        console.error('Error loading catalog:', error);
+        if (catalogMeta) {
+            showAlert('الخادم غير متاح، يتم استخدام البيانات المحفوظة على الجهاز', 'warning');
+        }
+        return false;
     }
+
+    const changed = delta.full || delta.products.length > 0 ||
+        delta.deleted_products.length > 0 || delta.logos !== null || delta.print_settings !== null;
+    applyCatalogDelta(delta);
+    await saveCatalogDelta(delta);
+    return changed;
 }
 
-async function loadLogos() {
-    try {
-        const response = await fetch(`${API_BASE_URL}/logos`);
-        logos = await response.json();
+function applyCatalogDelta(delta) {
+    catalogMeta = { epoch: delta.epoch, version: delta.version };
+    // Leave unsaved edits in the print config panel alone
+    const settingsUnchanged = JSON.stringify(printSettings) === JSON.stringify(savedSettings);
+
+    if (delta.full) {
+        products = delta.products;
+    } else if (delta.products.length > 0 || delta.deleted_products.length > 0) {
+        const byCode = new Map(products.map(p => [p.code, p]));
+        delta.deleted_products.forEach(code => byCode.delete(code));
+        delta.products.forEach(p => byCode.set(p.code, p));
+        products = [...byCode.values()].sort((a, b) => (a.code < b.code ? -1 : a.code > b.code ? 1 : 0));
+    }
+
+    if (delta.logos) {
+        logos = delta.logos;
         populateLogoSelect();
+    }
+
+    if (settingsUnchanged && delta.print_settings && Object.keys(delta.print_settings).length > 0) {
+        applyServerSettings(delta.print_settings);
+    }
+}
+
+function applyServerSettings(settings) {
+    printSettings = { ...printSettings, ...settings };
+    savedSettings = { ...printSettings };
+    applySettingsToUI();
+
+    const current = document.getElementById('printStylesheet');
+    if (settings.stylesheet_url && current && current.getAttribute('href') !== settings.stylesheet_url) {
+        swapPrintStylesheet(settings.stylesheet_url, { ...printSettings });
+    }
+}
+
+// ============== Local Catalog (IndexedDB) ==============
+
+const CATALOG_DB = 'zt-catalog';
+const CATALOG_DB_VERSION = 1;
+
+function openCatalogDB() {
+    return new Promise((resolve, reject) => {
+        if (!('indexedDB' in window)) {
+            reject(new Error('IndexedDB is not available'));
+            return;
+        }
+        const request = indexedDB.open(CATALOG_DB, CATALOG_DB_VERSION);
+        request.onupgradeneeded = () => {
+            const db = request.result;
+            db.createObjectStore('products', { keyPath: 'code' });
+            db.createObjectStore('state');
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function idbResult(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+async function readLocalCatalog() {
+    try {
+        const db = await openCatalogDB();
+        const tx = db.transaction(['products', 'state'], 'readonly');
+        const state = tx.objectStore('state');
+        const [meta, storedLogos, storedSettings, storedProducts] = await Promise.all([
+            idbResult(state.get('meta')),
+            idbResult(state.get('logos')),
+            idbResult(state.get('printSettings')),
+            idbResult(tx.objectStore('products').getAll())
+        ]);
+        db.close();
+        if (!meta) return null;
+        return {
+            meta,
+            logos: storedLogos || [],
+            printSettings: storedSettings || null,
+            products: storedProducts
+        };
     } catch (error) {
-        console.error('Error loading logos:', error);
+        console.error('Error reading local catalog:', error);
+        return null;
     }
 }
 
-async function loadPrintSettings() {
+async function saveCatalogDelta(delta) {
     try {
-        const response = await fetch(`${API_BASE_URL}/print-settings`);
-        const settings = await response.json();
-        if (settings && Object.keys(settings).length > 0) {
-            printSettings = { ...printSettings, ...settings };
-            applySettingsToUI();
-        }
+        const db = await openCatalogDB();
+        const tx = db.transaction(['products', 'state'], 'readwrite');
+        const productStore = tx.objectStore('products');
+        const state = tx.objectStore('state');
+
+        if (delta.full) productStore.clear();
+        delta.deleted_products.forEach(code => productStore.delete(code));
+        delta.products.forEach(product => productStore.put(product));
+        if (delta.logos) state.put(delta.logos, 'logos');
+        if (delta.print_settings) state.put(delta.print_settings, 'printSettings');
+        state.put({ epoch: delta.epoch, version: delta.version }, 'meta');
+
+        await new Promise((resolve, reject) => {
+            tx.oncomplete = resolve;
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+        db.close();
     } catch (error) {
-        console.error('Error loading print settings:', error);
+        console.error('Error saving local catalog:', error);
     }
 }
 
 // ============== Product Selects ==============
 
-function initProductSelects() {
-    const productOptions = [
-        { id: '', text: '' },  // Empty option for placeholder
-        ...products.map(p => ({
-            id: p.code,
-            text: `${p.code} - ${p.name} (${p.price} جنيه)`
-        }))
-    ];
+const SUGGEST_LIMIT = 20;
 
+// Options come from the server's prefix index as the cashier types, so the
+// selects never hold the whole catalog; the local copy answers offline
+function initProductSelects() {
     $('.product-select').each(function() {
         $(this).select2({
-            data: productOptions,
             placeholder: 'اختر منتج...',
             allowClear: true,
             dir: 'rtl',
+            minimumInputLength: 1,
+            ajax: {
+                delay: 150,
+                transport: function(params, success, failure) {
+                    suggestProducts(params.data.term).then(success, failure);
+                    return { abort: () => undefined };
+                },
+                processResults: results => ({ results })
+            },
             language: {
                 noResults: function() {
                     return 'لا توجد نتائج';
+                },
+                inputTooShort: function() {
+                    return 'اكتب جزءاً من الكود أو الاسم';
+                },
+                searching: function() {
+                    return 'جاري البحث...';
                 }
             }
         });
@@ -120,6 +307,65 @@ function initProductSelects() {
     });
 }
 
+async function suggestProducts(term) {
+    const prefix = (term || '').trim();
+    if (!prefix) return [];
+    try {
+        const params = new URLSearchParams({ prefix, limit: SUGGEST_LIMIT });
+        const response = await fetch(`${API_BASE_URL}/products/suggest?${params}`);
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const matches = await response.json();
+        return matches.map(productOption);
+    } catch (error) {
+        return localSuggestions(prefix).map(productOption);
+    }
+}
+
+function localSuggestions(prefix) {
+    const folded = prefix.toLowerCase();
+    const matches = products.filter(p => p.code.startsWith(prefix));
+    products.forEach(p => {
+        if (!p.code.startsWith(prefix) && (p.name || '').toLowerCase().startsWith(folded)) {
+            matches.push(p);
+        }
+    });
+    return matches.slice(0, SUGGEST_LIMIT);
+}
+
+// Price comes from the local catalog, which has this branch's prices
+function productOption(match) {
+    const product = findProduct(match.code);
+    const price = product ? ` (${product.price} جنيه)` : '';
+    return { id: match.code, text: `${match.code} - ${match.name}${price}` };
+}
+
+let productMap = null;
+let productMapSource = null;
+
+function findProduct(code) {
+    if (productMapSource !== products) {
+        productMap = new Map(products.map(p => [p.code, p]));
+        productMapSource = products;
+    }
+    return productMap.get(code);
+}
+
+// After a catalog refresh, update the selected options' text and clear
+// selections whose product was deleted
+function refreshProductSelects() {
+    $('.product-select').each(function() {
+        const code = $(this).val();
+        if (!code) return;
+        const product = findProduct(code);
+        if (product) {
+            $(this).find('option:selected').text(productOption(product).text);
+            $(this).trigger('change');
+        } else {
+            $(this).val(null).trigger('change');
+        }
+    });
+}
+
 // Clear product selection
 function clearProduct(num) {
     const select = $(`#product${num}`);
@@ -145,32 +391,32 @@ function initPrintConfig() {
                 printSettings.custom_width = parseFloat(customWidth?.value) || 21;
                 printSettings.custom_height = parseFloat(customHeight?.value) || 29.7;
             }
-            updateLabelsSize();
+            applyCardVariables();
         });
     });
 
     // Custom size inputs
     document.getElementById('customWidth')?.addEventListener('input', (e) => {
         printSettings.custom_width = parseFloat(e.target.value) || 21;
-        updateLabelsSize();
+        applyCardVariables();
     });
 
     document.getElementById('customHeight')?.addEventListener('input', (e) => {
         printSettings.custom_height = parseFloat(e.target.value) || 29.7;
-        updateLabelsSize();
+        applyCardVariables();
     });
 
     // Color pickers
     document.getElementById('colorStart')?.addEventListener('input', (e) => {
         printSettings.card_color_start = e.target.value;
         updateColorPreview();
-        updateCardsStyle();
+        applyCardVariables();
     });
 
     document.getElementById('colorEnd')?.addEventListener('input', (e) => {
         printSettings.card_color_end = e.target.value;
         updateColorPreview();
-        updateCardsStyle();
+        applyCardVariables();
     });
 
     // Font size slider
@@ -183,14 +429,14 @@ function initPrintConfig() {
             if (fontSizeValue) {
                 fontSizeValue.textContent = `${e.target.value}px`;
             }
-            updateCardsStyle();
+            applyCardVariables();
         });
     }
 
     // Font color picker
     document.getElementById('fontColor')?.addEventListener('input', (e) => {
         printSettings.font_color = e.target.value;
-        updateCardsStyle();
+        applyCardVariables();
     });
 
     // Logo select
@@ -204,11 +450,17 @@ function initPrintConfig() {
         }
     });
 
+    // Barcode type
+    document.getElementById('barcodeType')?.addEventListener('change', (e) => {
+        printSettings.barcode_type = e.target.value;
+        updateCardsBarcode();
+    });
+
     // Logo position
     document.querySelectorAll('input[name="logoPosition"]').forEach(radio => {
         radio.addEventListener('change', (e) => {
             printSettings.logo_position = e.target.value;
-            updateCardsStyle();
+            applyCardVariables();
         });
     });
 
@@ -222,14 +474,14 @@ function initPrintConfig() {
             if (borderOptions) {
                 borderOptions.style.display = e.target.checked ? 'block' : 'none';
             }
-            updateCardsStyle();
+            applyCardVariables();
         });
     }
 
     // Border color
     document.getElementById('borderColor')?.addEventListener('input', (e) => {
         printSettings.border_color = e.target.value;
-        updateCardsStyle();
+        applyCardVariables();
     });
 
     // Border width slider
@@ -242,7 +494,7 @@ function initPrintConfig() {
             if (borderWidthValue) {
                 borderWidthValue.textContent = `${e.target.value}px`;
             }
-            updateCardsStyle();
+            applyCardVariables();
         });
     }
 
@@ -254,7 +506,7 @@ function initPrintConfig() {
             if (cardSizeInputs) {
                 cardSizeInputs.style.display = e.target.value === 'grid' ? 'block' : 'none';
             }
-            updateLabelsLayout();
+            applyCardVariables();
         });
     });
 
@@ -268,7 +520,7 @@ function initPrintConfig() {
             if (cardWidthValue) {
                 cardWidthValue.textContent = `${e.target.value}%`;
             }
-            updateLabelsLayout();
+            applyCardVariables();
         });
     }
 
@@ -282,7 +534,7 @@ function initPrintConfig() {
             if (cardHeightValue) {
                 cardHeightValue.textContent = `${e.target.value}%`;
             }
-            updateLabelsLayout();
+            applyCardVariables();
         });
     }
 
@@ -296,7 +548,7 @@ function initPrintConfig() {
             if (logoSizeValue) {
                 logoSizeValue.textContent = `${e.target.value}px`;
             }
-            updateCardsStyle();
+            applyCardVariables();
         });
     }
 
@@ -434,10 +686,14 @@ function applySettingsToUI() {
         logoSizeValue.textContent = `${printSettings.logo_size || 100}px`;
     }
 
+    // Barcode
+    if (document.getElementById('barcodeType')) {
+        document.getElementById('barcodeType').value = printSettings.barcode_type || 'none';
+    }
+
     updateColorPreview();
     updateLogoPreview();
-    updateLabelsSize();
-    updateLabelsLayout();
+    applyCardVariables();
 }
 
 function updateColorPreview() {
@@ -454,96 +710,60 @@ function updateLogoPreview() {
     }
 }
 
-function updateLabelsSize() {
-    const labels = document.getElementById('labels');
-    if (labels) {
-        // Get proper page dimensions based on selected size
-        let width, height;
-        if (printSettings.page_size === 'Custom') {
-            width = printSettings.custom_width || 21;
-            height = printSettings.custom_height || 29.7;
-        } else if (PAGE_SIZES[printSettings.page_size]) {
-            width = PAGE_SIZES[printSettings.page_size].width;
-            height = PAGE_SIZES[printSettings.page_size].height;
-        } else {
-            width = 21;
-            height = 29.7;
-        }
-        labels.style.width = `${width}cm`;
-        labels.style.height = `${height}cm`;
+function getPageDimensions(settings) {
+    if (settings.page_size === 'Custom') {
+        return {
+            width: settings.custom_width || 21,
+            height: settings.custom_height || 29.7
+        };
     }
+    return PAGE_SIZES[settings.page_size] || PAGE_SIZES['A4'];
 }
 
-function updateLabelsLayout() {
+// Same custom properties that print_styles.card_variables() compiles on the server
+function cardVariables(settings) {
+    const page = getPageDimensions(settings);
+    const fontSize = settings.font_size || 28;
+    const logo = LOGO_POSITIONS[settings.logo_position] || {};
+    const full = settings.card_mode === 'full';
+
+    return {
+        '--page-width': `${page.width}cm`,
+        '--page-height': `${page.height}cm`,
+        '--card-columns': full ? '1fr' : `repeat(2, ${settings.card_width || 50}%)`,
+        '--card-rows': full ? '1fr' : `repeat(2, ${settings.card_height || 50}%)`,
+        '--card-color-start': settings.card_color_start || '#1e3c72',
+        '--card-color-end': settings.card_color_end || '#2a5298',
+        '--card-font-color': settings.font_color || '#ffffff',
+        '--card-border': settings.border_enabled
+            ? `${settings.border_width || 2}px solid ${settings.border_color || '#ffffff'}`
+            : 'none',
+        '--card-name-size': `${fontSize}px`,
+        '--card-specs-size': `${Math.round(fontSize * 0.6)}px`,
+        '--card-price-size': `${Math.round(fontSize * 1.4)}px`,
+        '--card-logo-size': `${settings.logo_size || 100}px`,
+        '--logo-top': logo.top || 'auto',
+        '--logo-right': logo.right || 'auto',
+        '--logo-bottom': logo.bottom || 'auto',
+        '--logo-left': logo.left || 'auto',
+        '--logo-transform': logo.transform || 'none'
+    };
+}
+
+// Preview unsaved settings by overriding the stylesheet's variables on the
+// container only; cards inherit them, so no per-card DOM writes are needed.
+function applyCardVariables() {
     const labels = document.getElementById('labels');
-    const cards = document.querySelectorAll('.label');
-    
     if (!labels) return;
-    
-    if (printSettings.card_mode === 'full') {
-        // Full page mode - single card
-        labels.style.gridTemplateColumns = '1fr';
-        labels.style.gridTemplateRows = '1fr';
-        cards.forEach(card => {
-            card.style.width = '100%';
-            card.style.height = '100%';
-        });
-    } else {
-        // Grid mode - custom size
-        const cardWidth = printSettings.card_width || 50;
-        const cardHeight = printSettings.card_height || 50;
-        
-        labels.style.gridTemplateColumns = `repeat(2, ${cardWidth}%)`;
-        labels.style.gridTemplateRows = `repeat(2, ${cardHeight}%)`;
-        cards.forEach(card => {
-            card.style.width = '100%';
-            card.style.height = '100%';
-        });
-    }
-}
 
-function updateCardsStyle() {
-    const cards = document.querySelectorAll('.label');
-    cards.forEach(card => {
-        // Update background
-        card.style.background = `linear-gradient(135deg, ${printSettings.card_color_start}, ${printSettings.card_color_end})`;
-        
-        // Update font color
-        card.style.color = printSettings.font_color || '#ffffff';
-        
-        // Update border
-        if (printSettings.border_enabled) {
-            card.style.border = `${printSettings.border_width || 2}px solid ${printSettings.border_color || '#ffffff'}`;
+    const current = cardVariables(printSettings);
+    const saved = cardVariables(savedSettings);
+    Object.entries(current).forEach(([name, value]) => {
+        if (value === saved[name]) {
+            labels.style.removeProperty(name);
         } else {
-            card.style.border = 'none';
-        }
-        
-        // Update font size for content
-        const productName = card.querySelector('.product-name');
-        const specs = card.querySelector('.specs');
-        const price = card.querySelector('.price');
-        const logo = card.querySelector('.logo');
-        
-        if (productName) {
-            productName.style.fontSize = `${printSettings.font_size || 28}px`;
-            productName.style.color = printSettings.font_color || '#ffffff';
-        }
-        if (specs) {
-            specs.style.fontSize = `${Math.round((printSettings.font_size || 28) * 0.6)}px`;
-            specs.style.color = printSettings.font_color || '#ffffff';
-        }
-        if (price) {
-            price.style.fontSize = `${Math.round((printSettings.font_size || 28) * 1.4)}px`;
-            price.style.color = printSettings.font_color || '#ffffff';
-        }
-        
-        // Update logo size
-        if (logo) {
-            logo.style.width = `${printSettings.logo_size || 100}px`;
-            logo.style.height = 'auto';
+            labels.style.setProperty(name, value);
         }
-        
-        applyLogoPosition(card);
     });
 }
 
@@ -559,66 +779,6 @@ function updateCardsLogo() {
     });
 }
 
-function applyLogoPosition(card) {
-    const logo = card.querySelector('.logo');
-    if (!logo) return;
-
-    // Reset all position styles
-    logo.style.position = 'absolute';
-    logo.style.top = 'auto';
-    logo.style.bottom = 'auto';
-    logo.style.left = 'auto';
-    logo.style.right = 'auto';
-    logo.style.transform = 'none';
-
-    const position = printSettings.logo_position;
-    const margin = '1cm';
-
-    switch (position) {
-        case 'top-left':
-            logo.style.top = margin;
-            logo.style.right = margin;
-            break;
-        case 'top-center':
-            logo.style.top = margin;
-            logo.style.left = '50%';
-            logo.style.transform = 'translateX(-50%)';
-            break;
-        case 'top-right':
-            logo.style.top = margin;
-            logo.style.left = margin;
-            break;
-        case 'center-left':
-            logo.style.top = '50%';
-            logo.style.right = margin;
-            logo.style.transform = 'translateY(-50%)';
-            break;
-        case 'center':
-            logo.style.top = '50%';
-            logo.style.left = '50%';
-            logo.style.transform = 'translate(-50%, -50%)';
-            break;
-        case 'center-right':
-            logo.style.top = '50%';
-            logo.style.left = margin;
-            logo.style.transform = 'translateY(-50%)';
-            break;
-        case 'bottom-left':
-            logo.style.bottom = margin;
-            logo.style.right = margin;
-            break;
-        case 'bottom-center':
-            logo.style.bottom = margin;
-            logo.style.left = '50%';
-            logo.style.transform = 'translateX(-50%)';
-            break;
-        case 'bottom-right':
-            logo.style.bottom = margin;
-            logo.style.left = margin;
-            break;
-    }
-}
-
 async function saveSettings() {
     try {
         const response = await fetch(`${API_BASE_URL}/print-settings`, {
@@ -628,6 +788,7 @@ async function saveSettings() {
         });
 
         if (response.ok) {
+            const result = await response.json();
             showAlert('تم حفظ الإعدادات بنجاح', 'success');
             
             // Close the print config panel
@@ -641,31 +802,11 @@ async function saveSettings() {
                 }
             }
             
-            // Apply settings to existing cards in preview
-            updateCardsStyle();
-            
-            // If there are cards, regenerate them with new settings
-            const labels = document.getElementById('labels');
-            if (labels && labels.children.length > 0) {
-                // Get currently selected products and regenerate
-                const selectedCodes = [];
-                for (let i = 1; i <= 4; i++) {
-                    const select = document.getElementById(`product${i}`);
-                    const code = $(select).val();
-                    if (code) selectedCodes.push(code);
-                }
-                
-                if (selectedCodes.length > 0) {
-                    labels.innerHTML = '';
-                    selectedCodes.forEach(code => {
-                        const product = products.find(p => p.code === code);
-                        if (product) {
-                            const card = createCard(product);
-                            labels.appendChild(card);
-                        }
-                    });
-                }
-            }
+            // Switch to the newly compiled stylesheet; cards only carry class names
+            swapPrintStylesheet(result.stylesheet_url, { ...printSettings });
+
+            // Keep the local catalog copy in step for offline use
+            queueCatalogRefresh();
         } else {
             showAlert('خطأ في حفظ الإعدادات', 'danger');
         }
@@ -674,26 +815,57 @@ async function saveSettings() {
     }
 }
 
+function swapPrintStylesheet(url, settings) {
+    const current = document.getElementById('printStylesheet');
+    if (!url || (current && current.getAttribute('href') === url)) {
+        savedSettings = settings;
+        applyCardVariables();
+        return;
+    }
+
+    const link = document.createElement('link');
+    link.rel = 'stylesheet';
+    link.href = url;
+    // Keep the inline overrides until the new sheet has loaded to avoid a flash
+    link.addEventListener('load', () => {
+        if (current) current.remove();
+        link.id = 'printStylesheet';
+        savedSettings = settings;
+        applyCardVariables();
+    });
+    document.head.appendChild(link);
+}
+
+function updateCardsBarcode() {
+    document.querySelectorAll('.label').forEach(card => {
+        card.querySelector('.barcode')?.remove();
+        const barcode = createBarcode(card.dataset.code);
+        if (barcode) {
+            card.querySelector('.card-content').insertAdjacentHTML('beforeend', barcode);
+        }
+    });
+}
+
 // ============== Card Generation ==============
 
-function generateLabels() {
+async function generateLabels() {
     const container = document.getElementById('labels');
     container.innerHTML = '';
 
-    const selectedCodes = [];
-    for (let i = 1; i <= 4; i++) {
-        const select = document.getElementById(`product${i}`);
-        const code = $(select).val();
-        if (code) selectedCodes.push(code);
-    }
+    const selectedCodes = getSelectedCodes();
 
     if (selectedCodes.length === 0) {
         showAlert('يرجى اختيار منتج واحد على الأقل', 'warning');
         return;
     }
 
+    const cards = await loadServerCards(selectedCodes);
     selectedCodes.forEach(code => {
-        const product = products.find(p => p.code === code);
+        if (cards && cards[code]) {
+            container.insertAdjacentHTML('beforeend', cards[code]);
+            return;
+        }
+        const product = findProduct(code);
         if (product) {
             const card = createCard(product);
             container.appendChild(card);
@@ -701,44 +873,72 @@ function generateLabels() {
     });
 
     // Apply layout settings
-    updateLabelsLayout();
+    applyCardVariables();
 
     showAlert(`تم توليد ${selectedCodes.length} كارت بنجاح`, 'success');
     document.querySelector('.preview-section').scrollIntoView({ behavior: 'smooth' });
 }
 
+function getSelectedCodes() {
+    const selectedCodes = [];
+    for (let i = 1; i <= 4; i++) {
+        const select = document.getElementById(`product${i}`);
+        const code = $(select).val();
+        if (code) selectedCodes.push(code);
+    }
+    return selectedCodes;
+}
+
+// Cached server fragments reflect the saved settings; unsaved logo or
+// barcode changes are previewed with client-built cards instead
+async function loadServerCards(codes) {
+    if (printSettings.logo_id !== savedSettings.logo_id ||
+        printSettings.barcode_type !== savedSettings.barcode_type) {
+        return null;
+    }
+
+    try {
+        const params = new URLSearchParams({ codes: codes.join(',') });
+        const response = await fetch(`${API_BASE_URL}/cards?${params}`);
+        if (!response.ok) return null;
+        const result = await response.json();
+        return Object.fromEntries(result.cards.map(card => [card.code, card.html]));
+    } catch (error) {
+        console.error('Error loading cards:', error);
+        return null;
+    }
+}
+
+// Client-side twin of templates/card.html, used for unsaved previews
 function createCard(product) {
     const card = document.createElement('div');
     card.className = 'label';
-    card.style.background = `linear-gradient(135deg, ${printSettings.card_color_start}, ${printSettings.card_color_end})`;
-    card.style.position = 'relative';
-    card.style.color = printSettings.font_color || '#ffffff';
-    
-    // Apply border if enabled
-    if (printSettings.border_enabled) {
-        card.style.border = `${printSettings.border_width || 2}px solid ${printSettings.border_color || '#ffffff'}`;
-    }
+    card.dataset.code = product.code;
 
     const logoSrc = `/static/uploads/${printSettings.logo_filename || 'logowhite.png'}`;
-    const fontSize = printSettings.font_size || 28;
-    const fontColor = printSettings.font_color || '#ffffff';
-    const logoSize = printSettings.logo_size || 100;
 
     card.innerHTML = `
-        <img src="${logoSrc}" class="logo" alt="Logo" style="width: ${logoSize}px; height: auto;" onerror="this.style.display='none'">
+        <img src="${logoSrc}" class="logo" alt="Logo" onerror="this.style.display='none'">
         <div class="card-content">
-            <div class="product-name" style="font-size: ${fontSize}px; color: ${fontColor};">${escapeHtml(product.name)}</div>
-            <div class="specs" style="font-size: ${Math.round(fontSize * 0.6)}px; color: ${fontColor};">${escapeHtml(product.specs || '')}</div>
-            <div class="price" style="font-size: ${Math.round(fontSize * 1.4)}px; color: ${fontColor};">${product.price} جنيه</div>
+            <div class="product-name">${escapeHtml(product.name)}</div>
+            <div class="specs">${escapeHtml(product.specs || '')}</div>
+            <div class="price">${product.price} جنيه</div>
+            ${createBarcode(product.code)}
         </div>
     `;
 
-    // Apply logo position
-    setTimeout(() => applyLogoPosition(card), 0);
-
     return card;
 }
 
+// Barcode images are rendered and cached on the server per (code, type, size)
+function createBarcode(code) {
+    const type = printSettings.barcode_type;
+    if (!type || type === 'none') return '';
+
+    const src = `${API_BASE_URL}/barcodes/${encodeURIComponent(code)}.svg?type=${type}`;
+    return `<img src="${src}" class="barcode barcode-${type}" alt="${escapeHtml(code)}" onerror="this.style.display='none'">`;
+}
+
 // ============== Event Listeners ==============
 
 function initEventListeners() {
@@ -770,90 +970,23 @@ function applyPrintStyles() {
     const existingStyle = document.getElementById('dynamic-print-style');
     if (existingStyle) existingStyle.remove();
 
-    // Get proper page dimensions based on selected size
-    let width, height;
-    if (printSettings.page_size === 'Custom') {
-        width = printSettings.custom_width || 21;
-        height = printSettings.custom_height || 29.7;
-    } else if (PAGE_SIZES[printSettings.page_size]) {
-        width = PAGE_SIZES[printSettings.page_size].width;
-        height = PAGE_SIZES[printSettings.page_size].height;
-    } else {
-        width = 21;
-        height = 29.7;
-    }
-    const fontSize = printSettings.font_size || 28;
-    const fontColor = printSettings.font_color || '#ffffff';
-    const logoSize = printSettings.logo_size || 100;
-    const borderStyle = printSettings.border_enabled 
-        ? `${printSettings.border_width || 2}px solid ${printSettings.border_color || '#ffffff'}` 
-        : 'none';
-    
-    // Card layout settings
-    const cardMode = printSettings.card_mode || 'grid';
-    const cardWidth = printSettings.card_width || 50;
-    const cardHeight = printSettings.card_height || 50;
-    
-    let gridStyle = '';
-    if (cardMode === 'full') {
-        gridStyle = `
-            .labels {
-                grid-template-columns: 1fr !important;
-                grid-template-rows: 1fr !important;
-            }
-            .label {
-                width: 100% !important;
-                height: 100% !important;
-            }
-        `;
-    } else {
-        gridStyle = `
-            .labels {
-                grid-template-columns: repeat(2, ${cardWidth}%) !important;
-                grid-template-rows: repeat(2, ${cardHeight}%) !important;
-            }
-        `;
-    }
+    // Everything except @page follows the variables on #labels; only an
+    // unsaved page size needs its own rule on top of #printStylesheet
+    const page = getPageDimensions(printSettings);
+    const savedPage = getPageDimensions(savedSettings);
+    if (page.width === savedPage.width && page.height === savedPage.height) return;
 
     const style = document.createElement('style');
     style.id = 'dynamic-print-style';
     style.textContent = `
+        @page {
+            size: ${page.width}cm ${page.height}cm;
+            margin: 0;
+        }
         @media print {
-            @page {
-                size: ${width}cm ${height}cm;
-                margin: 0;
-            }
             html, body {
-                width: ${width}cm !important;
-                height: ${height}cm !important;
-            }
-            .labels {
-                width: ${width}cm !important;
-                height: ${height}cm !important;
-            }
-            ${gridStyle}
-            .label {
-                background: linear-gradient(135deg, ${printSettings.card_color_start}, ${printSettings.card_color_end}) !important;
-                color: ${fontColor} !important;
-                border: ${borderStyle} !important;
-                -webkit-print-color-adjust: exact !important;
-                print-color-adjust: exact !important;
-            }
-            .label .logo {
-                width: ${logoSize}px !important;
-                height: auto !important;
-            }
-            .label .product-name {
-                font-size: ${fontSize}px !important;
-                color: ${fontColor} !important;
-            }
-            .label .specs {
-                font-size: ${Math.round(fontSize * 0.6)}px !important;
-                color: ${fontColor} !important;
-            }
-            .label .price {
-                font-size: ${Math.round(fontSize * 1.4)}px !important;
-                color: ${fontColor} !important;
+                width: ${page.width}cm !important;
+                height: ${page.height}cm !important;
             }
         }
     `;
@@ -0,0 +1,115 @@
+// Service worker for Zerotech print terminals
+//
+// Keeps the print page, its assets, print stylesheets and barcode images
+// available when the server is unreachable. Catalog data (products, logos,
+// print settings) is kept in IndexedDB by main.js, so other API requests
+// go straight to the network.
+
+const CACHE_VERSION = 'v1';
+const SHELL_CACHE = `zt-shell-${CACHE_VERSION}`;
+const ASSET_CACHE = `zt-assets-${CACHE_VERSION}`;
+
+const SHELL_URLS = [
+    '/static/css/custom.css',
+    '/static/js/main.js'
+];
+
+const CDN_HOSTS = [
+    'cdn.jsdelivr.net',
+    'fonts.googleapis.com',
+    'fonts.gstatic.com'
+];
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then(cache => cache.addAll(SHELL_URLS))
+            .catch(() => undefined)
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys
+                .filter(key => key !== SHELL_CACHE && key !== ASSET_CACHE)
+                .map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+
+    const url = new URL(request.url);
+
+    if (request.mode === 'navigate' && url.origin === location.origin && url.pathname === '/') {
+        event.respondWith(networkFirst(request, SHELL_CACHE));
+        return;
+    }
+
+    if (url.origin === location.origin) {
+        // Content-addressed or keyed by code: never change once rendered
+        if (url.pathname.startsWith('/print-styles/') || url.pathname.startsWith('/api/barcodes/')) {
+            event.respondWith(cacheFirst(request, ASSET_CACHE));
+        } else if (url.pathname.startsWith('/static/')) {
+            event.respondWith(staleWhileRevalidate(request, SHELL_CACHE));
+        }
+        return;
+    }
+
+    if (CDN_HOSTS.includes(url.hostname)) {
+        event.respondWith(cacheFirst(request, ASSET_CACHE));
+    }
+});
+
+// Cache only real pages, not the login page a redirect leads to
+function cacheable(response) {
+    return response && (response.ok || response.type === 'opaque') && !response.redirected;
+}
+
+async function networkFirst(request, cacheName) {
+    const cache = await caches.open(cacheName);
+    try {
+        const response = await fetch(request);
+        if (cacheable(response)) {
+            cache.put(request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        const cached = await cache.match(request, { ignoreSearch: true });
+        if (cached) return cached;
+        throw error;
+    }
+}
+
+async function cacheFirst(request, cacheName) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    if (cached) return cached;
+
+    const response = await fetch(request);
+    if (cacheable(response)) {
+        cache.put(request, response.clone());
+    }
+    return response;
+}
+
+async function staleWhileRevalidate(request, cacheName) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    const network = fetch(request)
+        .then(response => {
+            if (cacheable(response)) {
+                cache.put(request, response.clone());
+            }
+            return response;
+        })
+        .catch(error => {
+            if (cached) return cached;
+            throw error;
+        });
+    return cached || network;
+}
@@ -0,0 +1,212 @@
+"""In-memory prefix index for product-code autocomplete.
+
+Codes and case-folded names are kept in two sorted lists, so a prefix
+lookup is a binary search (``bisect``) followed by a short slice; it does
+not touch the database.  When the prefixes match fewer than ``limit``
+products, the rest is filled from a third sorted list of the other words
+in codes and names (``"gaming"`` finds "Mouse Gaming RGB"), again by
+binary search, so every lookup costs the same however rare its matches.
+
+The index follows product writes through the catalog change log (see
+:mod:`catalog`): before answering, it applies the product changes with a
+newer ``seq`` than the last one it saw, which also keeps the index of
+every worker process current.  Without a change log (the PostgreSQL
+store) it is rebuilt whenever the catalog version moves, in a background
+thread while lookups keep using the previous index.
+"""
+import bisect
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# The unary + keeps SQLite on the seq range instead of the entity index,
+# which would visit every product ever logged
+_CHANGES_SQL = '''
+    SELECT c.seq, c.entity_key, c.deleted, p.name
+    FROM catalog_changes c
+    LEFT JOIN products p ON p.code = c.entity_key
+    WHERE +c.entity = 'product' AND c.seq > ?
+    ORDER BY c.seq
+'''
+
+
+_WORD_SPLIT_RE = re.compile(r'[\W_]+')
+
+
+def _inner_words(code, name):
+    """Case-folded words of a product the prefix lists do not start with"""
+    words = set()
+    for text in (code.casefold(), name.casefold()):
+        parts = [part for part in _WORD_SPLIT_RE.split(text) if part]
+        # The first word is already a prefix of the code or name
+        if parts and text.startswith(parts[0]):
+            parts = parts[1:]
+        words.update(parts)
+    return words
+
+
+class SuggestIndex:
+    """Sorted code and name lists with bisect-based prefix lookup"""
+
+    def __init__(self, version=None, connect=None):
+        # version(conn) -> (epoch, version) replaces the change log;
+        # connect() opens the connection for background rebuilds
+        self._version = version
+        self._connect = connect
+        self._rebuilding = False
+        self._codes = []
+        self._names = []
+        self._words = []
+        self._by_code = {}
+        self._epoch = None
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.updates = 0
+
+    def build(self, conn):
+        """Load every product code and name"""
+        epoch, seq = self._log_state(conn)
+        products = conn.execute('SELECT code, name FROM products').fetchall()
+        by_code = {code: name or '' for code, name in products}
+        with self._lock:
+            self._by_code = by_code
+            self._codes = sorted(by_code)
+            self._names = sorted((name.casefold(), code)
+                                 for code, name in by_code.items())
+            self._words = sorted((word, code)
+                                 for code, name in by_code.items()
+                                 for word in _inner_words(code, name))
+            self._epoch = epoch
+            self._seq = seq
+            self.builds += 1
+
+    def refresh(self, conn):
+        """Apply product changes logged since the last build or refresh"""
+        epoch, seq = self._log_state(conn)
+        if self._version and self._epoch is not None and \
+                (epoch, seq) != (self._epoch, self._seq):
+            self._rebuild_in_background()
+            return
+        if epoch != self._epoch or seq < self._seq:
+            self.build(conn)
+            return
+        if seq == self._seq:
+            return
+
+        changes = conn.execute(_CHANGES_SQL, (self._seq,)).fetchall()
+        with self._lock:
+            for change_seq, code, deleted, name in changes:
+                if change_seq <= self._seq:
+                    continue
+                # Price and category edits leave the lists as they are
+                if not deleted and name is not None and \
+                        self._by_code.get(code) == name:
+                    continue
+                self._remove(code)
+                if not deleted and name is not None:
+                    self._insert(code, name)
+                self.updates += 1
+            self._seq = max(self._seq, seq)
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def rebuild():
+            try:
+                conn = self._connect()
+                try:
+                    self.build(conn)
+                finally:
+                    conn.close()
+            except Exception:
+                logger.exception('Rebuilding the suggest index failed')
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=rebuild, name='suggest-rebuild',
+                         daemon=True).start()
+
+    def lookup(self, prefix, limit=DEFAULT_LIMIT):
+        """Return up to ``limit`` products whose code or name starts with
+        ``prefix``, code matches first, then names, then other words"""
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        results = []
+        seen = set()
+        with self._lock:
+            start = bisect.bisect_left(self._codes, prefix)
+            for code in self._codes[start:start + limit]:
+                if not code.startswith(prefix):
+                    break
+                results.append({'code': code, 'name': self._by_code[code]})
+                seen.add(code)
+
+            folded = prefix.casefold()
+            start = bisect.bisect_left(self._names, (folded,))
+            for name, code in self._names[start:start + limit]:
+                if len(results) >= limit or not name.startswith(folded):
+                    break
+                if code not in seen:
+                    results.append({'code': code,
+                                    'name': self._by_code[code]})
+                    seen.add(code)
+
+            start = bisect.bisect_left(self._words, (folded,))
+            for word, code in self._words[start:start + limit + len(seen)]:
+                if len(results) >= limit or not word.startswith(folded):
+                    break
+                if code not in seen:
+                    results.append({'code': code,
+                                    'name': self._by_code[code]})
+                    seen.add(code)
+        return results
+
+    def stats(self):
+        return {
+            'products': len(self._codes),
+            'version': self._seq,
+            'builds': self.builds,
+            'updates': self.updates
+        }
+
+    def _log_state(self, conn):
+        if self._version:
+            return self._version(conn)
+        epoch = conn.execute(
+            "SELECT value FROM catalog_meta WHERE key = 'epoch'"
+        ).fetchone()[0]
+        seq = conn.execute(
+            'SELECT COALESCE(MAX(seq), 0) FROM catalog_changes'
+        ).fetchone()[0]
+        return epoch, seq
+
+    def _insert(self, code, name):
+        name = name or ''
+        self._by_code[code] = name
+        bisect.insort(self._codes, code)
+        bisect.insort(self._names, (name.casefold(), code))
+        for word in _inner_words(code, name):
+            bisect.insort(self._words, (word, code))
+
+    def _remove(self, code):
+        name = self._by_code.pop(code, None)
+        if name is None:
+            return
+        self._delete(self._codes, code)
+        self._delete(self._names, (name.casefold(), code))
+        for word in _inner_words(code, name):
+            self._delete(self._words, (word, code))
+
+    @staticmethod
+    def _delete(items, item):
+        i = bisect.bisect_left(items, item)
+        if i < len(items) and items[i] == item:
+            del items[i]
@@ -0,0 +1,73 @@
+"""Fixtures for the storage tests.
+
+Run from the project directory with ``python -m pytest``.  The PostgreSQL
+cases run only when ``ZT_TEST_POSTGRES_URL`` names a database they may
+empty, e.g.::
+
+    ZT_TEST_POSTGRES_URL=postgresql://postgres@localhost/zt_test python -m pytest
+
+Otherwise they are skipped, and listed as skipped in the summary (pytest.ini
+passes ``-rs``); the CI workflow always runs them against a PostgreSQL
+service.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import storage  # noqa: E402
+
+POSTGRES_URL = os.environ.get('ZT_TEST_POSTGRES_URL')
+
+# Everything PostgresStore.install() creates
+_PG_TABLES = storage.CATALOG_TABLES + ('catalog_meta', 'category_stats')
+_PG_FUNCTIONS = ('zt_catalog_changed', 'zt_category_stats_product',
+                 'zt_category_stats_category')
+
+
+def _reset_postgres(url):
+    store = storage.PostgresStore(url, pool_max=2)
+    conn = store.connect()
+    try:
+        conn.execute(f'DROP TABLE IF EXISTS {", ".join(_PG_TABLES)} CASCADE')
+        for function in _PG_FUNCTIONS:
+            conn.execute(f'DROP FUNCTION IF EXISTS {function}() CASCADE')
+        conn.commit()
+    finally:
+        conn.close()
+        store.close()
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def store(request, tmp_path, monkeypatch):
+    """A freshly installed store of each backend, with the default rows
+    but no products"""
+    if request.param == 'sqlite':
+        monkeypatch.setattr(database, 'DB_NAME',
+                            str(tmp_path / 'products.db'))
+        store = storage.SQLiteStore()
+    else:
+        if not POSTGRES_URL:
+            pytest.skip('ZT_TEST_POSTGRES_URL is not set')
+        _reset_postgres(POSTGRES_URL)
+        store = storage.PostgresStore(POSTGRES_URL, pool_max=4,
+                                      pool_timeout=5.0)
+    store.install()
+    conn = store.connect()
+    conn.execute('DELETE FROM products')
+    conn.commit()
+    conn.close()
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def conn(store):
+    """A write connection of ``store``; uncommitted work is rolled back"""
+    conn = store.connect()
+    yield conn
+    conn.rollback()
+    conn.close()
@@ -0,0 +1,27 @@
+"""JSON rendering of list queries"""
+import json
+import sqlite3
+
+import rows
+
+
+def test_columns_follow_schema_changes(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'rows.db'))
+    conn.execute('CREATE TABLE items (id INTEGER, name TEXT)')
+    conn.execute("INSERT INTO items VALUES (1, 'a')")
+    assert json.loads(rows.json_array(conn, 'SELECT * FROM items')) == \
+        [{'id': 1, 'name': 'a'}]
+
+    conn.execute('ALTER TABLE items ADD COLUMN price REAL DEFAULT 2.5')
+    assert json.loads(rows.json_array(conn, 'SELECT * FROM items')) == \
+        [{'id': 1, 'name': 'a', 'price': 2.5}]
+
+    # Another database with the same query and schema version
+    other = sqlite3.connect(str(tmp_path / 'other.db'))
+    other.execute('CREATE TABLE items (id INTEGER)')
+    other.execute('INSERT INTO items VALUES (3)')
+    other.execute('CREATE TABLE unused (x)')
+    assert json.loads(rows.json_array(other, 'SELECT * FROM items')) == \
+        [{'id': 3}]
+    conn.close()
+    other.close()
@@ -0,0 +1,457 @@
+"""Repositories, batches and catalog versions on both storage backends"""
+import json
+import threading
+import time
+
+import pytest
+
+import batch
+import storage
+
+
+def _category_id(conn, name):
+    return conn.execute('SELECT id FROM categories WHERE name = ?',
+                        (name,)).fetchone()['id']
+
+
+def _add_category(store, conn, name):
+    cat_id = store.categories.create(conn, name)
+    conn.commit()
+    return cat_id
+
+
+# ============== Repositories ==============
+
+def test_product_crud(store, conn):
+    cat_id = _add_category(store, conn, 'Mice')
+    product_id = store.products.create(conn, {
+        'code': '1001', 'name': 'Mouse', 'price': '12.5',
+        'category_id': cat_id
+    })
+    conn.commit()
+    assert isinstance(product_id, int)
+
+    product = store.products.get(conn, '1001')
+    assert product['id'] == product_id
+    assert product['price'] == 12.5
+    assert product['category_name'] == 'Mice'
+    assert product['logo_url'] == 'logowhite.png'
+    assert store.products.find(conn, '1001')['name'] == 'Mouse'
+    assert store.products.codes(conn) == ['1001']
+
+    store.products.update(conn, '1001', {'name': 'Wireless mouse',
+                                         'price': 15})
+    conn.commit()
+    product = store.products.get(conn, '1001')
+    assert product['name'] == 'Wireless mouse'
+    assert product['category_id'] is None
+
+    store.products.delete(conn, '1001')
+    conn.commit()
+    assert store.products.get(conn, '1001') is None
+    assert store.products.find(conn, '1001') is None
+
+
+def test_product_duplicate_code(store, conn):
+    store.products.create(conn, {'code': '1001', 'name': 'A', 'price': 1})
+    conn.commit()
+    with pytest.raises(storage.DuplicateError):
+        store.products.create(conn, {'code': '1001', 'name': 'B',
+                                     'price': 2})
+    conn.rollback()
+    assert store.products.get(conn, '1001')['name'] == 'A'
+
+
+def test_product_json_pages(store, conn):
+    for code in ('1003', '1001', '1002'):
+        store.products.create(conn, {'code': code, 'name': f'P{code}',
+                                     'price': 1})
+    conn.commit()
+
+    objects = [json.loads(obj) for obj in store.products.json_objects(conn)]
+    assert [obj['code'] for obj in objects] == ['1001', '1002', '1003']
+    page = store.products.json_objects(conn, after='1001', limit=1)
+    assert [json.loads(obj)['code'] for obj in page] == ['1002']
+    assert len(json.loads(store.products.list_json(conn))) == 3
+    rows = store.products.get_many(conn, ['1001', '1003'])
+    assert sorted(row['code'] for row in rows) == ['1001', '1003']
+
+
+def test_category_crud(store, conn):
+    cat_id = _add_category(store, conn, 'Cables')
+    store.products.create(conn, {'code': '1001', 'name': 'USB',
+                                 'price': 3, 'category_id': cat_id})
+    conn.commit()
+
+    store.categories.rename(conn, cat_id, 'Cables and adapters')
+    conn.commit()
+    names = [c['name'] for c in json.loads(store.categories.list_json(conn))]
+    assert 'Cables and adapters' in names
+
+    with pytest.raises(storage.DuplicateError):
+        store.categories.create(conn, 'Cables and adapters')
+    conn.rollback()
+    other_id = _add_category(store, conn, 'Other')
+    with pytest.raises(storage.DuplicateError):
+        store.categories.rename(conn, other_id, 'Cables and adapters')
+    conn.rollback()
+
+    store.categories.delete(conn, cat_id)
+    conn.commit()
+    assert store.products.get(conn, '1001')['category_id'] is None
+    names = [c['name'] for c in json.loads(store.categories.list_json(conn))]
+    assert 'Cables and adapters' not in names
+
+
+def test_category_stats(store, conn):
+    cat_id = _add_category(store, conn, 'Screens')
+    empty_id = _add_category(store, conn, 'Empty')
+    for code, price in (('1001', 100), ('1002', 300)):
+        store.products.create(conn, {'code': code, 'name': code,
+                                     'price': price, 'category_id': cat_id})
+    conn.commit()
+
+    stats = {c['id']: c for c in
+             json.loads(store.categories.list_json(conn, with_stats=True))}
+    assert stats[cat_id]['product_count'] == 2
+    assert stats[cat_id]['price_min'] == 100
+    assert stats[cat_id]['price_max'] == 300
+    assert stats[cat_id]['price_avg'] == 200
+    assert stats[empty_id]['product_count'] == 0
+    assert stats[empty_id]['price_avg'] is None
+
+    store.products.update(conn, '1002', {'name': '1002', 'price': 500,
+                                         'category_id': empty_id})
+    conn.commit()
+    stats = {c['id']: c for c in
+             json.loads(store.categories.list_json(conn, with_stats=True))}
+    assert stats[cat_id]['product_count'] == 1
+    assert stats[cat_id]['price_max'] == 100
+    assert stats[empty_id]['product_count'] == 1
+    assert stats[empty_id]['price_avg'] == 500
+
+
+def test_logo_crud(store, conn):
+    logo_id = store.logos.create(conn, 'Brand', 'brand.png')
+    conn.commit()
+    assert store.logos.get(conn, logo_id)['filename'] == 'brand.png'
+    assert logo_id in [logo['id'] for logo in
+                       json.loads(store.logos.list_json(conn))]
+
+    store.print_settings.save(conn, {'logo_id': logo_id})
+    conn.commit()
+    assert store.print_settings.get(conn)['logo_filename'] == 'brand.png'
+
+    store.logos.delete(conn, logo_id)
+    conn.commit()
+    assert store.logos.get(conn, logo_id) is None
+    assert store.print_settings.get(conn)['logo_id'] is None
+
+
+def test_user_crud(store, conn):
+    assert store.users.count_admins(conn) == 1
+    user_id = store.users.create(conn, 'sara', 'hash', full_name='Sara')
+    conn.commit()
+    with pytest.raises(storage.DuplicateError):
+        store.users.create(conn, 'sara', 'hash')
+    conn.rollback()
+
+    user = store.users.get(conn, user_id)
+    assert user['username'] == 'sara'
+    assert user['is_active'] == 1
+    assert 'password_hash' not in user
+    assert store.users.find(conn, 'sara')['password_hash'] == 'hash'
+
+    store.users.update(conn, user_id, full_name='Sara A', role='admin')
+    store.users.set_active(conn, user_id, 0)
+    store.users.set_password_hash(conn, user_id, 'other')
+    conn.commit()
+    assert store.users.get(conn, user_id)['full_name'] == 'Sara A'
+    assert store.users.count_admins(conn) == 2
+    assert store.users.count_admins(conn, active_only=True) == 1
+    assert store.users.find(conn, 'sara')['password_hash'] == 'other'
+    assert store.users.usernames(conn, [user_id]) == {user_id: 'sara'}
+    assert store.users.usernames(conn, []) == {}
+    assert {u['username'] for u in store.users.list(conn)} == \
+        {'admin', 'sara'}
+
+    store.users.delete(conn, user_id)
+    conn.commit()
+    assert store.users.get(conn, user_id) is None
+
+
+def test_print_settings_save(store, conn):
+    store.print_settings.save(conn, {'page_size': 'A5',
+                                     'border_enabled': True})
+    conn.commit()
+    settings = store.print_settings.get(conn)
+    assert settings['page_size'] == 'A5'
+    assert settings['border_enabled'] == 1
+    assert settings['barcode_type'] == 'none'
+
+    # The row is replaced, not added to
+    store.print_settings.save(conn, {'barcode_type': 'qr'})
+    conn.commit()
+    settings = store.print_settings.get(conn)
+    assert settings['page_size'] == 'A4'
+    assert settings['barcode_type'] == 'qr'
+    count = conn.execute(
+        'SELECT COUNT(*) AS count FROM print_settings'
+    ).fetchone()['count']
+    assert count == 1
+
+
+# ============== Batches ==============
+
+def test_batch_validate(store, conn):
+    cat_id = _add_category(store, conn, 'Printers')
+    store.products.create(conn, {'code': '1001', 'name': 'A', 'price': 1})
+    conn.commit()
+
+    errors = batch.validate(conn, [
+        {'entity': 'product', 'op': 'create',
+         'data': {'code': '1001', 'name': 'B', 'price': 2}},
+        {'entity': 'product', 'op': 'update', 'code': '9999', 'data': {}},
+        {'entity': 'product', 'op': 'delete', 'code': 5},
+        {'entity': 'category', 'op': 'delete', 'id': '1'},
+        {'entity': 'product', 'op': 'create',
+         'data': {'code': '1002', 'name': 'C', 'price': 1,
+                  'category_id': cat_id + 1000}},
+        {'entity': 'category', 'op': 'create', 'data': {'name': 'Printers'}},
+        {'entity': 'product', 'op': 'update', 'code': '1001',
+         'data': {'name': 'A', 'price': 'x'}},
+        {'entity': 'product', 'op': 'update', 'code': '1001',
+         'data': {'name': 'A', 'price': 1, 'category_id': cat_id}}
+    ])
+    assert errors == [
+        {'index': 0, 'error': 'Product code already exists'},
+        {'index': 1, 'error': 'Product not found'},
+        {'index': 2, 'error': 'Field code must be a non-empty string'},
+        {'index': 3, 'error': 'Field id must be an integer'},
+        {'index': 4, 'error': 'Category not found'},
+        {'index': 5, 'error': 'Category already exists'},
+        {'index': 6, 'error': 'Field price must be a number'}
+    ]
+
+
+def test_batch_apply(store, conn):
+    cat_id = _add_category(store, conn, 'Networks')
+    store.products.create(conn, {'code': '1001', 'name': 'Switch',
+                                 'price': 40, 'category_id': cat_id})
+    store.products.create(conn, {'code': '1002', 'name': 'Router',
+                                 'price': 60})
+    conn.commit()
+
+    operations = [
+        {'entity': 'category', 'op': 'create', 'data': {'name': 'Cables'}},
+        {'entity': 'product', 'op': 'create',
+         'data': {'code': '1003', 'name': 'Cable', 'price': 2}},
+        {'entity': 'product', 'op': 'create',
+         'data': {'code': '1004', 'name': 'Cable 2', 'price': 3}},
+        {'entity': 'product', 'op': 'update', 'code': '1001',
+         'data': {'name': 'Switch 8', 'price': 45}},
+        {'entity': 'product', 'op': 'delete', 'code': '1002'},
+        {'entity': 'category', 'op': 'update', 'id': cat_id,
+         'data': {'name': 'Network'}}
+    ]
+    store.begin_write(conn)
+    assert batch.validate(conn, operations) == []
+    results = batch.apply(conn, operations)
+    conn.commit()
+
+    assert [r['status'] for r in results] == \
+        ['created', 'created', 'created', 'updated', 'deleted', 'updated']
+    assert isinstance(results[0]['id'], int)
+    assert results[1]['id'] != results[2]['id']
+    assert store.products.get(conn, '1003')['id'] == results[1]['id']
+    assert store.products.get(conn, '1001')['price'] == 45
+    assert store.products.get(conn, '1002') is None
+    assert _category_id(conn, 'Network') == cat_id
+    assert _category_id(conn, 'Cables') == results[0]['id']
+
+
+def test_batch_rolls_back(store, conn):
+    store.products.create(conn, {'code': '1001', 'name': 'A', 'price': 1})
+    conn.commit()
+
+    store.begin_write(conn)
+    with pytest.raises(Exception):
+        # Validation would catch this; the database must too
+        batch.apply(conn, [
+            {'entity': 'product', 'op': 'create',
+             'data': {'code': '1002', 'name': 'B', 'price': 1}},
+            {'entity': 'product', 'op': 'create',
+             'data': {'code': '1001', 'name': 'C', 'price': 1}}
+        ])
+    conn.rollback()
+    assert store.products.codes(conn) == ['1001']
+
+
+# ============== Catalog version and write lock ==============
+
+def test_catalog_version(store, conn):
+    epoch, version = store.catalog_version(conn)
+    assert epoch
+
+    store.products.create(conn, {'code': '1001', 'name': 'A', 'price': 1})
+    conn.commit()
+    epoch2, version2 = store.catalog_version(conn)
+    assert epoch2 == epoch
+    assert int(version2) > int(version)
+
+    # Nothing committed, nothing moves
+    store.products.create(conn, {'code': '1002', 'name': 'B', 'price': 1})
+    conn.rollback()
+    assert store.catalog_version(conn) == (epoch2, version2)
+
+    parts = store.read_catalog(conn)
+    assert parts['version'] == version2
+    assert [p['code'] for p in json.loads(parts['products'])] == ['1001']
+
+
+def test_begin_write_blocks_other_writers(store, conn):
+    waited = []
+
+    def second_writer():
+        other = store.connect()
+        try:
+            started = time.monotonic()
+            store.begin_write(other)
+            waited.append(time.monotonic() - started)
+            store.products.create(other, {'code': '1002', 'name': 'B',
+                                          'price': 1})
+            other.commit()
+        finally:
+            other.close()
+
+    store.begin_write(conn)
+    store.products.create(conn, {'code': '1001', 'name': 'A', 'price': 1})
+    thread = threading.Thread(target=second_writer)
+    thread.start()
+    time.sleep(0.3)
+    assert not waited
+    conn.commit()
+    thread.join(5)
+
+    assert waited and waited[0] >= 0.25
+    assert store.products.codes(conn) == ['1001', '1002']
+
+
+def test_read_connection_sees_commits(store, conn):
+    store.products.create(conn, {'code': '1001', 'name': 'A', 'price': 1})
+    conn.commit()
+    reader = store.read_connection()
+    try:
+        assert store.products.get(reader, '1001')['name'] == 'A'
+    finally:
+        reader.close()
+
+
+# ============== SQL portability ==============
+
+def test_placeholders_and_percent_literals(store, conn):
+    store.products.create(conn, {'code': 'A%1', 'name': '100% cotton',
+                                 'price': 5})
+    store.products.create(conn, {'code': 'B2', 'name': 'Wool',
+                                 'price': 7})
+    conn.commit()
+
+    rows = conn.execute(
+        "SELECT code FROM products WHERE name LIKE '%cotton' AND price > ?",
+        (1,)
+    ).fetchall()
+    assert [row['code'] for row in rows] == ['A%1']
+    rows = conn.execute(
+        'SELECT code FROM products WHERE code LIKE ? ORDER BY code',
+        ('%',)
+    ).fetchall()
+    assert [row[0] for row in rows] == ['A%1', 'B2']
+
+
+def test_lastrowid(store, conn):
+    cursor = conn.cursor()
+    cursor.execute('INSERT INTO logos (name, filename) VALUES (?, ?)',
+                   ('A', 'a.png'))
+    first = cursor.lastrowid
+    cursor.execute('insert into logos (name, filename) values (?, ?)',
+                   ('B', 'b.png'))
+    assert cursor.lastrowid == first + 1
+    conn.commit()
+    assert store.logos.get(conn, first)['name'] == 'A'
+
+
+class _FakeCursor:
+    """Records what a _PgCursor sends to psycopg2"""
+
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, sql, params):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        return (42,)
+
+
+def test_pg_cursor_rewrites_sql():
+    assert storage._PgCursor._sql(
+        "SELECT * FROM products WHERE name LIKE '%a' AND code = ?"
+    ) == "SELECT * FROM products WHERE name LIKE '%%a' AND code = %s"
+
+    raw = _FakeCursor()
+    cursor = storage._PgCursor(raw)
+    cursor.execute('INSERT INTO products (code) VALUES (?)', ['1001'])
+    assert raw.executed[-1] == (
+        'INSERT INTO products (code) VALUES (%s) RETURNING id', ('1001',)
+    )
+    assert cursor.lastrowid == 42
+
+    cursor.execute('INSERT INTO catalog_meta (key, value) VALUES (?, ?)',
+                   ('a', 'b'))
+    assert not raw.executed[-1][0].endswith('RETURNING id')
+    cursor.execute('INSERT INTO users (username) VALUES (?) RETURNING id',
+                   ('x',))
+    assert raw.executed[-1][0].count('RETURNING') == 1
+
+
+def test_sql_without_params_is_sent_as_is(store, conn):
+    # No % doubling and no placeholders when there are no parameters
+    row = conn.execute("SELECT '100%' AS a, 'why?' AS b").fetchone()
+    assert (row['a'], row['b']) == ('100%', 'why?')
+
+
+def test_question_marks_in_literals(store, conn):
+    store.products.create(conn, {'code': 'Q1', 'name': 'What?', 'price': 1})
+    conn.commit()
+    row = conn.execute(
+        "SELECT code, 'a?b' AS text FROM products "
+        "WHERE name = 'What?' AND price = ?", (1,)
+    ).fetchone()
+    assert (row['code'], row['text']) == ('Q1', 'a?b')
+
+
+def test_category_stats_match_recount(store, conn):
+    cat_id = _add_category(store, conn, 'Audio')
+    other_id = _add_category(store, conn, 'Video')
+    for code, price in (('A1', 5), ('A2', 9), ('A3', 7)):
+        store.products.create(conn, {'code': code, 'name': code,
+                                     'price': price, 'category_id': cat_id})
+    conn.commit()
+    store.products.update(conn, 'A2', {'name': 'A2', 'price': 9,
+                                       'category_id': other_id})
+    store.products.delete(conn, 'A1')
+    conn.execute('UPDATE products SET price = price * 2')
+    conn.commit()
+
+    stored = {row['category_id']: tuple(row) for row in conn.execute(
+        'SELECT category_id, product_count, price_sum, price_min, '
+        'price_max FROM category_stats'
+    ).fetchall()}
+    recount = {row[0]: tuple(row) for row in conn.execute('''
+        SELECT c.id, COUNT(p.id), COALESCE(SUM(p.price), 0),
+               MIN(p.price), MAX(p.price)
+        FROM categories c LEFT JOIN products p ON p.category_id = c.id
+        GROUP BY c.id
+    ''').fetchall()}
+    assert stored == recount
+    assert stored[cat_id] == (cat_id, 1, 14, 14, 14)
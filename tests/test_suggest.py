@@ -0,0 +1,32 @@
+"""Prefix and word lookups of the suggest index"""
+import database
+import suggest
+
+
+def test_lookup_order_and_words(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DB_NAME', str(tmp_path / 'products.db'))
+    database.init_db()
+    conn = database.get_db_connection()
+    index = suggest.SuggestIndex()
+    index.build(conn)
+
+    codes = [r['code'] for r in index.lookup('100')]
+    assert codes == ['1001', '1002', '1003', '1004']
+    assert [r['code'] for r in index.lookup('mouse')] == ['1001']
+    # Words inside names and codes, not only their starts
+    assert [r['code'] for r in index.lookup('gam')] == ['1001', '1003']
+    assert [r['code'] for r in index.lookup('RGB')] == ['1001']
+    assert index.lookup('zzz') == []
+
+    conn.execute("INSERT INTO products (code, name, price) "
+                 "VALUES ('AB-77', 'Cable USB-C', 1)")
+    conn.commit()
+    index.refresh(conn)
+    assert [r['code'] for r in index.lookup('77')] == ['AB-77']
+    assert [r['code'] for r in index.lookup('usb')] == ['AB-77']
+
+    conn.execute("UPDATE products SET name = 'Cable' WHERE code = 'AB-77'")
+    conn.commit()
+    index.refresh(conn)
+    assert index.lookup('usb') == []
+    conn.close()
@@ -0,0 +1,117 @@
+"""SQLite triggers that maintain derived tables"""
+import pytest
+
+import branches
+import category_stats
+import database
+
+
+@pytest.fixture
+def master(tmp_path, monkeypatch):
+    """A fresh master database with the default rows"""
+    monkeypatch.setattr(database, 'DB_NAME', str(tmp_path / 'products.db'))
+    database.init_db()
+    conn = database.get_db_connection()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def branch_store(master, tmp_path):
+    branch_store = branches.BranchStore(str(tmp_path / 'branches'))
+    branch_store.create('cairo')
+    return branch_store
+
+
+def _changes(conn):
+    return {(row['entity'], row['entity_key']): row['seq']
+            for row in conn.execute('SELECT * FROM catalog_changes')}
+
+
+def test_branch_price_set_twice(branch_store):
+    conn = branch_store.connect('cairo')
+    branch_store.set_price(conn, '1001', 10)
+    conn.commit()
+    first = _changes(conn)[('product', '1001')]
+
+    branch_store.set_price(conn, '1001', 12)
+    conn.commit()
+    assert _changes(conn)[('product', '1001')] > first
+    assert conn.execute(
+        "SELECT price FROM price_overrides WHERE code = '1001'"
+    ).fetchone()['price'] == 12
+    conn.close()
+
+
+def test_product_upsert_and_rename(master):
+    master.execute("INSERT INTO products (code, name, price) "
+                   "VALUES ('T1', 'T1', 1)")
+    master.commit()
+    before = _changes(master)[('product', 'T1')]
+
+    master.execute('''
+        INSERT INTO products (code, name, price) VALUES ('T1', 'T1', 2)
+        ON CONFLICT(code) DO UPDATE SET price = excluded.price
+    ''')
+    master.commit()
+    changes = _changes(master)
+    assert changes[('product', 'T1')] > before
+
+    master.execute("UPDATE products SET code = 'T2' WHERE code = 'T1'")
+    master.commit()
+    deleted = master.execute(
+        "SELECT deleted FROM catalog_changes WHERE entity_key = 'T1'"
+    ).fetchone()['deleted']
+    assert deleted == 1
+    assert ('product', 'T2') in _changes(master)
+
+
+def test_category_stats_upsert(master):
+    cat_id, other_id = [row['id'] for row in master.execute(
+        'SELECT id FROM categories ORDER BY id LIMIT 2'
+    )]
+    for price, category_id in ((10, cat_id), (20, cat_id), (30, other_id)):
+        master.execute('''
+            INSERT INTO products (code, name, price, category_id)
+            VALUES ('T1', 'T1', ?, ?)
+            ON CONFLICT(code) DO UPDATE
+            SET price = excluded.price, category_id = excluded.category_id
+        ''', (price, category_id))
+        master.commit()
+    assert category_stats.verify(master) == []
+
+
+def test_deleted_logo_cleared_in_branches(master, branch_store):
+    logo_id = master.execute(
+        "INSERT INTO logos (name, filename) VALUES ('L', 'l.png')"
+    ).lastrowid
+    master.commit()
+    branch_store.create('giza')
+    for name in ('cairo', 'giza'):
+        conn = branch_store.connect(name)
+        conn.execute('UPDATE print_settings SET logo_id = ?', (logo_id,))
+        conn.commit()
+        conn.close()
+
+    branch_store.clear_logo(logo_id)
+    conn = branch_store.connect('cairo')
+    assert conn.execute(
+        'SELECT logo_id FROM print_settings'
+    ).fetchone()['logo_id'] is None
+    conn.close()
+
+    # Left behind by an older delete: cleared on the next startup
+    conn = branch_store.connect('giza')
+    conn.execute('UPDATE print_settings SET logo_id = ?', (logo_id,))
+    conn.commit()
+    conn.close()
+    master.execute('DELETE FROM logos WHERE id = ?', (logo_id,))
+    master.commit()
+    branch_store.migrate_all(
+        logo_ids=[row['id'] for row in master.execute('SELECT id FROM logos')]
+    )
+    conn = branch_store.connect('giza')
+    assert conn.execute(
+        'SELECT logo_id FROM print_settings'
+    ).fetchone()['logo_id'] is None
+    conn.close()
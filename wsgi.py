@@ -0,0 +1,57 @@
+"""Production WSGI entry point.
+
+Run with gunicorn, which reads its settings from gunicorn.conf.py::
+
+    gunicorn -c gunicorn.conf.py
+
+Every worker imports this module after it is forked, so each one builds
+its own caches and indexes in :func:`warm_up` before it takes requests.
+After a deploy, ``kill -HUP <master pid>`` starts workers with the new
+code and stops the old ones once their requests finish; the listening
+socket stays open throughout, so with the default sync workers no request
+is refused.
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(flask_app):
+    """Fill this worker's caches so its first requests are not slow"""
+    import app as app_module
+
+    started = time.perf_counter()
+    store = app_module.store
+
+    # Loads the in-memory read snapshot when it is enabled; the list
+    # endpoints' queries cache their column lists and read their pages
+    # (with PostgreSQL: opens the pool's first connection)
+    conn = store.read_connection()
+    store.categories.list_json(conn, with_stats=True)
+    store.logos.list_json(conn)
+    store.products.list_json(conn)
+    store.users.list_json(conn)
+    app_module.suggest_index.refresh(conn)
+    conn.close()
+    if app_module.catalog_file_store is not None:
+        app_module.catalog_file_store.build()
+
+    for template in ('index.html', 'admin.html', 'login.html', 'card.html'):
+        flask_app.jinja_env.get_template(template)
+
+    logger.info('Worker warmed up in %.3f s',
+                time.perf_counter() - started)
+
+
+def create_app():
+    """Return the Flask app configured for production and warmed up"""
+    from app import app as flask_app
+
+    flask_app.config['DEBUG'] = False
+    flask_app.config['TEMPLATES_AUTO_RELOAD'] = False
+    warm_up(flask_app)
+    return flask_app
+
+
+application = create_app()